@@ -0,0 +1,55 @@
+"""
+Конфигурация gunicorn для узлов API: gunicorn -c gunicorn.conf.py
+
+Приложение загружается один раз в мастере (preload_app) в профиле
+MULTISTOCK_PROFILE=api, если профиль не задан явно. Там же прогреваются
+маршруты и классы DRF (warehouses.warmup), и воркеры получают всё это
+после fork общими страницами памяти (copy-on-write).
+
+Чтобы страницы оставались общими, сборщик мусора в мастере выключен на
+время загрузки приложения, а объекты мастера перед каждым fork
+замораживаются (gc.freeze): сборки в воркерах не трогают их заголовки и не
+копируют страницы. После загрузки (when_ready) сборщик в мастере снова
+включается: мастер живёт долго и перезапускает воркеры. Соединения с базой
+каждый воркер открывает сам после fork.
+
+ASGI (MULTISTOCK_API_MODE=async): MULTISTOCK_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+Замер старта и памяти воркера: manage.py benchmark_startup.
+"""
+import gc
+import multiprocessing
+import os
+
+os.environ.setdefault('MULTISTOCK_PROFILE', 'api')
+
+if os.environ.get('MULTISTOCK_API_MODE') == 'async':
+    wsgi_app = 'multistock.asgi:application'
+else:
+    wsgi_app = 'multistock.wsgi:application'
+bind = os.environ.get('MULTISTOCK_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('MULTISTOCK_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('MULTISTOCK_WORKER_CLASS', 'sync')
+preload_app = True
+
+# без сборок в мастере при загрузке приложения не появляются «дыры» в общих страницах
+gc.disable()
+
+
+def when_ready(server):
+    # приложение загружено; мастер без сборщика копил бы циклический мусор всю жизнь
+    gc.enable()
+
+
+def pre_fork(server, worker):
+    from django.db import connections
+
+    # соединения, открытые при загрузке, не должны достаться воркерам
+    connections.close_all()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from warehouses import warmup
+
+    gc.enable()
+    warmup.warm_connections()
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'multistock.settings')
 
 application = get_asgi_application()
+
+# маршруты и классы DRF загружаются при старте, а не первым запросом
+from warehouses import warmup  # noqa: E402
+
+warmup.warm_code()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 import django_filters
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'drf_yasg',
@@ -48,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'warehouses.middleware.RequestMetricsMiddleware',
+    'warehouses.routing.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +71,12 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # orjson, если установлен; выдача та же, что у JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'warehouses.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 ROOT_URLCONF = 'multistock.urls'
@@ -89,6 +98,34 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'multistock.wsgi.application'
 
+# Профиль процесса: 'full' — всё приложение; 'api' — узлы, которые обслуживают только API
+# (gunicorn.conf.py): без админки, сессий, сообщений, CSRF и swagger, JSON без Browsable API.
+# API аутентифицируется токеном DRF, сессии ему не нужны.
+WAREHOUSES_PROFILE = os.environ.get('MULTISTOCK_PROFILE', 'full')
+
+if WAREHOUSES_PROFILE == 'api':
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS
+        if app not in {
+            'django.contrib.admin',
+            'django.contrib.sessions',
+            'django.contrib.messages',
+            'django.contrib.staticfiles',
+            'drf_yasg',
+        }
+    ]
+    MIDDLEWARE = [
+        middleware for middleware in MIDDLEWARE
+        if middleware not in {
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.middleware.csrf.CsrfViewMiddleware',
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+            'django.contrib.messages.middleware.MessageMiddleware',
+        }
+    ]
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = ['warehouses.renderers.FastJSONRenderer']
+    TEMPLATES[0]['OPTIONS']['context_processors'] = ['django.template.context_processors.request']
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -101,9 +138,64 @@ DATABASES = {
         "PASSWORD": "root",
         "HOST": "127.0.0.1",
         "PORT": "5432",
+        # постоянные соединения вместо нового подключения на каждый запрос
+        "CONN_MAX_AGE": int(os.environ.get('MULTISTOCK_CONN_MAX_AGE', 60)),
+        "CONN_HEALTH_CHECKS": True,
+    }
+}
+
+# Режим эндпоинтов чтения: 'sync' — DRF-представления, 'async' — warehouses.async_views (для ASGI)
+WAREHOUSES_API_MODE = os.environ.get('MULTISTOCK_API_MODE', 'sync')
+
+# Пул соединений psycopg 3. Под ASGI каждый запрос выполняется в своём потоке, и постоянные
+# соединения на поток не переиспользуются, поэтому в async-режиме пул включён по умолчанию.
+# Django не допускает пул вместе с CONN_MAX_AGE > 0: соединение возвращается в пул в конце запроса.
+if os.environ.get('MULTISTOCK_DB_POOL', '1' if WAREHOUSES_API_MODE == 'async' else '0') == '1':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('MULTISTOCK_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('MULTISTOCK_DB_POOL_MAX_SIZE', 20)),
+            'timeout': 10,
+        },
+    }
+
+# Реплика для отчётов и списков (см. warehouses.routing): те же параметры, другой хост.
+# В тестах реплика — зеркало основной базы.
+if os.environ.get('MULTISTOCK_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['MULTISTOCK_REPLICA_HOST'],
+        'PORT': os.environ.get('MULTISTOCK_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['warehouses.routing.ReplicaRouter']
+
+# Алиас реплики из DATABASES; None — всё читается с основной базы
+WAREHOUSES_REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+# Допустимое отставание реплики и интервал его проверки, сек; после записи клиент читает
+# с основной базы REPLICA_STICKY_SECONDS (cookie), чтобы видеть свои изменения
+REPLICA_MAX_LAG = 5
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+if os.environ.get('MULTISTOCK_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['MULTISTOCK_REDIS_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -145,3 +237,66 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Warehouses
+# Размер пачки строк для серверного курсора и потоковой выгрузки CSV
+
+INVENTORY_EXPORT_CHUNK_SIZE = 2000
+
+# Время жизни закэшированной выдачи склада, сек (инвалидация — по версии склада)
+INVENTORY_CACHE_TIMEOUT = 300
+
+# Поиск товаров: 'auto' — pg_trgm на PostgreSQL, иначе триграммный индекс в памяти; 'trigram' или 'ngram' — явно
+PRODUCT_SEARCH_BACKEND = 'auto'
+
+# Сколько хранится ответ на запрос с Idempotency-Key, сек (очистка — manage.py purge_idempotency_keys)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Срок резерва по умолчанию и максимальный ttl_seconds в запросе, сек (очистка — manage.py expire_reservations)
+RESERVATION_TTL = 15 * 60
+RESERVATION_MAX_TTL = 24 * 60 * 60
+
+# Фоновые выгрузки (manage.py run_export_jobs): каталог файлов, время без пульса, после которого
+# задание возвращается в очередь, число попыток и срок хранения готовых файлов, сек
+EXPORT_JOBS_DIR = BASE_DIR / 'var' / 'exports'
+EXPORT_JOB_TIMEOUT = 10 * 60
+EXPORT_JOB_MAX_ATTEMPTS = 3
+EXPORT_JOB_TTL = 24 * 60 * 60
+
+# Вебхук оповещений о пересечении порога дозаказа (manage.py dispatch_stock_alerts); без URL оповещения
+# не создаются. Окно сбора серии изменений в один запрос и таймаут запроса, сек; секрет подписи HMAC-SHA256
+LOW_STOCK_WEBHOOK_URL = os.environ.get('MULTISTOCK_LOW_STOCK_WEBHOOK_URL')
+LOW_STOCK_WEBHOOK_SECRET = os.environ.get('MULTISTOCK_LOW_STOCK_WEBHOOK_SECRET')
+LOW_STOCK_WEBHOOK_DEBOUNCE = 30
+LOW_STOCK_WEBHOOK_TIMEOUT = 10
+
+# Число слотов по умолчанию для «горячих» строк остатков (manage.py set_inventory_slots);
+# слоты выравнивает manage.py compact_inventory_slots
+INVENTORY_HOT_ROW_SLOTS = 8
+
+# Отчёт /api/analytics/movements/: срок кэша сумм закрытого периода, сек, и предел числа периодов в запросе
+ANALYTICS_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+ANALYTICS_MAX_PERIODS = 366
+
+# Лента /api/inventory/changes/: 'auto' — LISTEN/NOTIFY на PostgreSQL, иначе уведомления внутри процесса;
+# 'postgres' или 'local' — явно. Интервалы в секундах: комментарий-пульс SSE, предел ожидания long-poll
+# и страховочный опрос журнала слушателем
+CHANGE_FEED_BACKEND = 'auto'
+CHANGE_FEED_HEARTBEAT = 15
+CHANGE_FEED_LONG_POLL_TIMEOUT = 25
+CHANGE_FEED_POLL_INTERVAL = 5
+
+# Доля запросов, для которых измеряются SQL-запросы (число, время, повторы); 0 — только время ответа
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('MULTISTOCK_REQUEST_METRICS_SAMPLE_RATE', 0.05))
+
+# Доступ к /metrics: токен для Authorization: Bearer и/или адреса и сети через запятую; без них — 403
+METRICS_TOKEN = os.environ.get('MULTISTOCK_METRICS_TOKEN')
+METRICS_ALLOWED_IPS = [
+    network.strip() for network in os.environ.get('MULTISTOCK_METRICS_ALLOWED_IPS', '').split(',') if network.strip()
+]
+
+# Пороги медленного запроса для журнала warehouses.requests: время ответа, мс, и число SQL-запросов
+SLOW_REQUEST_THRESHOLD_MS = 1000
+SLOW_REQUEST_QUERY_THRESHOLD = 50
+SLOW_REQUEST_TOP_STATEMENTS = 5
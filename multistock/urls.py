@@ -14,26 +14,56 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from functools import cache
+
+from django.apps import apps
 from django.urls import path, include, re_path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Warehouse API",
-      default_version='v1',
-      description="API для управления складами",
-   ),
-   public=True,
-   permission_classes=[permissions.AllowAny],
-)
+from warehouses.metrics import metrics_view
+from warehouses.routing import use_replica
+
+
+@cache
+def schema_views():
+    """(схема JSON/YAML, swagger UI); drf_yasg импортируется при первом запросе к swagger, а не при старте."""
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    schema_view = get_schema_view(
+       openapi.Info(
+          title="Warehouse API",
+          default_version='v1',
+          description="API для управления складами",
+       ),
+       public=True,
+       permission_classes=[permissions.AllowAny],
+    )
+    return schema_view.without_ui(cache_timeout=0), schema_view.with_ui('swagger', cache_timeout=0)
+
+
+@use_replica
+def schema_json(request, *args, **kwargs):
+    return schema_views()[0](request, *args, **kwargs)
+
+
+@use_replica
+def schema_ui(request, *args, **kwargs):
+    return schema_views()[1](request, *args, **kwargs)
 
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('warehouses.urls')),
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+# в профиле 'api' (MULTISTOCK_PROFILE) нет ни админки, ни swagger
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+if apps.is_installed('drf_yasg'):
+    urlpatterns += [
+        re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_json, name='schema-json'),
+        path('swagger/', schema_ui, name='schema-swagger-ui'),
+    ]
@@ -5,7 +5,11 @@ from warehouses.models import (
     Product,
     Inventory,
     TransferLog,
-    InventoryLog
+    InventoryLog,
+    StockReservation,
+    ExportJob,
+    StockAlert,
+    InventorySlot
 )
 
 # Register your models here.
@@ -14,4 +18,8 @@ admin.site.register(Product)
 admin.site.register(Inventory)
 admin.site.register(InventoryLog)
 admin.site.register(TransferLog)
+admin.site.register(StockReservation)
 
+admin.site.register(ExportJob)
+admin.site.register(StockAlert)
+admin.site.register(InventorySlot)
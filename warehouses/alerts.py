@@ -0,0 +1,167 @@
+"""
+Оповещения о малом остатке по порогу Inventory.reorder_level.
+
+Пересечения порога ищутся на пути записи: обработчик inventory_changed
+сравнивает количество до и после изменения с порогом строки (один SELECT
+порогов затронутых строк на пакет изменений) и в той же транзакции кладёт
+StockAlert в очередь. Полные проходы по таблице не нужны, а откат записи
+откатывает и оповещение. Без LOW_STOCK_WEBHOOK_URL оповещения не
+создаются и путь записи не делает лишнего запроса.
+
+Очередь разбирает manage.py dispatch_stock_alerts: оповещение ждёт
+LOW_STOCK_WEBHOOK_DEBOUNCE секунд, чтобы серия перемещений ушла одним
+запросом, а по каждой паре (товар, склад) отправляется только последнее состояние.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from warehouses.models import LOW_STOCK, Inventory, StockAlert
+from warehouses.transfers import _pairs_filter
+
+logger = logging.getLogger('warehouses.alerts')
+
+SIGNATURE_HEADER = 'X-Warehouses-Signature'
+
+
+def webhook_url():
+    return getattr(settings, 'LOW_STOCK_WEBHOOK_URL', None)
+
+
+def debounce():
+    return timedelta(seconds=getattr(settings, 'LOW_STOCK_WEBHOOK_DEBOUNCE', 30))
+
+
+def low_stock(warehouse_ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    Строки ниже порога: обычные читаются по частичному индексу inventory_low_stock_idx,
+    шардированные (их немного) сравниваются с порогом вместе со слотами.
+    """
+    inventories = Inventory.objects.using(using).with_slot_totals().filter(
+        LOW_STOCK | Q(slots__gt=0, live_quantity__lt=F('reorder_level'))
+    )
+    if warehouse_ids:
+        inventories = inventories.filter(warehouse_id__in=warehouse_ids)
+    return inventories
+
+
+def set_reorder_levels(lines, using=DEFAULT_DB_ALIAS):
+    """
+    Пороги из строк {product_id, warehouse_id, reorder_level} одним UPDATE через CASE.
+    Количество не меняется, поэтому журнал не пишется и оповещений нет: текущие
+    строки ниже порога видны в low_stock(). Возвращает число обновлённых строк.
+    """
+    levels = {(line['product_id'], line['warehouse_id']): line['reorder_level'] for line in lines}
+    return Inventory.objects.using(using).filter(_pairs_filter(levels)).update(
+        reorder_level=Case(
+            *[
+                When(product_id=product_id, warehouse_id=warehouse_id, then=Value(level))
+                for (product_id, warehouse_id), level in levels.items()
+            ],
+            output_field=IntegerField(),
+        )
+    )
+
+
+def crossing(previous, quantity, level):
+    """LOW, RECOVERED или None; previous=None — прежнее количество неизвестно."""
+    if quantity < level and (previous is None or previous >= level):
+        return StockAlert.LOW
+    if quantity >= level and previous is not None and previous < level:
+        return StockAlert.RECOVERED
+    return None
+
+
+def detect_crossings(changes, using=DEFAULT_DB_ALIAS):
+    """Ставит в очередь StockAlert для изменений, пересёкших порог своей строки."""
+    if not webhook_url():
+        return
+    # удалённой строки уже нет, и порога у неё тоже
+    changes = [change for change in changes if change.operation != 'remove' and change.quantity != change.previous]
+    if not changes:
+        return
+
+    levels = {
+        (product_id, warehouse_id): level
+        for product_id, warehouse_id, level in Inventory.objects.using(using).filter(
+            product_id__in={change.product_id for change in changes},
+            warehouse_id__in={change.warehouse_id for change in changes},
+            reorder_level__isnull=False,
+        ).values_list('product_id', 'warehouse_id', 'reorder_level')
+    }
+    alerts = []
+    for change in changes:
+        level = levels.get((change.product_id, change.warehouse_id))
+        if level is None:
+            continue
+        state = crossing(change.previous, change.quantity, level)
+        if state is not None:
+            alerts.append(StockAlert(
+                product_id=change.product_id, warehouse_id=change.warehouse_id,
+                state=state, quantity=change.quantity, reorder_level=level,
+            ))
+    if alerts:
+        StockAlert.objects.using(using).bulk_create(alerts)
+
+
+def payload(alerts):
+    """Тело вебхука: последнее состояние по каждой паре (товар, склад) в порядке появления."""
+    latest = {}
+    for alert in alerts:
+        latest[alert.product_id, alert.warehouse_id] = alert
+    return {
+        "alerts": [
+            {
+                "product_id": alert.product_id,
+                "warehouse_id": alert.warehouse_id,
+                "state": alert.state,
+                "quantity": alert.quantity,
+                "reorder_level": alert.reorder_level,
+                "detected_at": alert.created_at,
+            }
+            for alert in latest.values()
+        ]
+    }
+
+
+def post_webhook(body):
+    data = json.dumps(body, cls=DjangoJSONEncoder).encode()
+    headers = {'Content-Type': 'application/json'}
+    secret = getattr(settings, 'LOW_STOCK_WEBHOOK_SECRET', None)
+    if secret:
+        headers[SIGNATURE_HEADER] = 'sha256=' + hmac.new(secret.encode(), data, hashlib.sha256).hexdigest()
+    request = urllib.request.Request(webhook_url(), data=data, headers=headers, method='POST')
+    timeout = getattr(settings, 'LOW_STOCK_WEBHOOK_TIMEOUT', 10)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def dispatch(batch_size=500, using=DEFAULT_DB_ALIAS):
+    """
+    Отправляет одну пачку оповещений старше окна LOW_STOCK_WEBHOOK_DEBOUNCE.
+    Строки заблокированы до ответа получателя (другие отправители их
+    пропускают), при ошибке остаются в очереди. Возвращает число отправленных.
+    """
+    with transaction.atomic(using=using):
+        batch = list(
+            StockAlert.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(dispatched_at__isnull=True, created_at__lte=timezone.now() - debounce())
+            .order_by('created_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return 0
+        post_webhook(payload(batch))
+        StockAlert.objects.using(using).filter(pk__in=[alert.pk for alert in batch]).update(
+            dispatched_at=timezone.now(),
+        )
+    return len(batch)
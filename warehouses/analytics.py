@@ -0,0 +1,216 @@
+"""
+Аналитика движения товара по периодам (/api/analytics/movements/).
+
+Движение — перемещения между складами (TransferLog): поступление на склад —
+перемещения с to_warehouse, отгрузка — с from_warehouse. База возвращает уже
+сгруппированные суммы по периоду (TruncDate/TruncWeek/TruncMonth) и складу
+или товару, а матрица периоды × ключи собирается в numpy. Там же векторно
+считаются изменение к предыдущему периоду и скользящие суммы за window
+периодов. Для этого запрос захватывает ещё window - 1 период до начала
+диапазона (минимум один).
+
+TransferLog только дописывается, и timestamp ставится при создании, поэтому
+суммы закрытого периода больше не меняются. Они кэшируются отдельно по
+каждому периоду, и повторный отчёт читает из базы только текущий период и
+то, чего нет в кэше.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DateField, F, Q, Sum, Value
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from warehouses.models import TransferLog
+
+PERIODS = ('day', 'week', 'month')
+GROUP_BY = ('warehouse', 'product')
+# столько периодов в отчёте без start_date
+DEFAULT_PERIODS = 30
+CACHE_PREFIX = 'analytics:movements:v1'
+
+
+def cache_timeout():
+    return getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+
+def max_periods():
+    return getattr(settings, 'ANALYTICS_MAX_PERIODS', 366)
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, period):
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def previous_period(start, period):
+    return period_start(start - timedelta(days=1), period)
+
+
+def default_start(end_date, period):
+    start = period_start(end_date, period)
+    for _ in range(DEFAULT_PERIODS - 1):
+        start = previous_period(start, period)
+    return start
+
+
+def period_range(start_date, end_date, period, lookback=0):
+    """Начала периодов от периода start_date до периода end_date и lookback периодов перед ними."""
+    current = period_start(start_date, period)
+    for _ in range(lookback):
+        current = previous_period(current, period)
+    last = period_start(end_date, period)
+    periods = []
+    while current <= last:
+        periods.append(current)
+        current = next_period(current, period)
+    return periods
+
+
+def _aggregate(first, end, period, group_by, warehouse_ids, product_ids, using):
+    """Словари {bucket, key, inbound, outbound} за [first, end) одним запросом."""
+    logs = TransferLog.objects.using(using).filter(
+        timestamp__gte=timezone.make_aware(datetime.combine(first, time.min)),
+        timestamp__lt=timezone.make_aware(datetime.combine(end, time.min)),
+    )
+    if product_ids:
+        logs = logs.filter(product_id__in=product_ids)
+    if period == 'day':
+        bucket = TruncDate('timestamp')
+    else:
+        bucket = (TruncWeek if period == 'week' else TruncMonth)('timestamp', output_field=DateField())
+
+    if group_by == 'product':
+        if not warehouse_ids:
+            # по всем складам каждое перемещение — и поступление, и отгрузка
+            return logs.values(bucket=bucket, key=F('product_id')).annotate(
+                inbound=Sum('quantity'), outbound=Sum('quantity'),
+            )
+        return logs.filter(
+            Q(to_warehouse_id__in=warehouse_ids) | Q(from_warehouse_id__in=warehouse_ids)
+        ).values(bucket=bucket, key=F('product_id')).annotate(
+            inbound=Sum('quantity', filter=Q(to_warehouse_id__in=warehouse_ids)),
+            outbound=Sum('quantity', filter=Q(from_warehouse_id__in=warehouse_ids)),
+        )
+
+    inbound, outbound = logs, logs
+    if warehouse_ids:
+        inbound = inbound.filter(to_warehouse_id__in=warehouse_ids)
+        outbound = outbound.filter(from_warehouse_id__in=warehouse_ids)
+    # перемещение относится к двум складам: две группировки одним UNION ALL
+    return inbound.values(bucket=bucket, key=F('to_warehouse_id')).annotate(
+        inbound=Sum('quantity'), outbound=Value(0),
+    ).union(
+        outbound.values(bucket=bucket, key=F('from_warehouse_id')).annotate(
+            inbound=Value(0), outbound=Sum('quantity'),
+        ),
+        all=True,
+    )
+
+
+def _cache_prefix(period, group_by, warehouse_ids, product_ids):
+    params = json.dumps([period, group_by, sorted(warehouse_ids or []), sorted(product_ids or [])])
+    return f'{CACHE_PREFIX}:{hashlib.sha256(params.encode()).hexdigest()[:32]}'
+
+
+def period_rows(periods, period, group_by, warehouse_ids=None, product_ids=None, using=DEFAULT_DB_ALIAS):
+    """{начало периода: [(ключ, поступление, отгрузка)]}; закрытые периоды берутся из кэша."""
+    today = timezone.localdate()
+    prefix = _cache_prefix(period, group_by, warehouse_ids, product_ids)
+    closed = {start: f'{prefix}:{start.isoformat()}' for start in periods if next_period(start, period) <= today}
+    cached = cache.get_many(list(closed.values())) if closed else {}
+
+    rows = {start: cached[key] for start, key in closed.items() if key in cached}
+    missing = [start for start in periods if start not in rows]
+    if missing:
+        fetched = defaultdict(list)
+        for item in _aggregate(
+            missing[0], next_period(missing[-1], period), period, group_by, warehouse_ids, product_ids, using,
+        ):
+            fetched[item['bucket']].append((item['key'], item['inbound'] or 0, item['outbound'] or 0))
+        for start in missing:
+            rows[start] = fetched.get(start, [])
+        cache.set_many(
+            {closed[start]: rows[start] for start in missing if start in closed}, cache_timeout(),
+        )
+    return rows
+
+
+def _rolling(matrix, window):
+    # сумма за window периодов по строкам — разность накопленных сумм
+    cumulative = np.cumsum(matrix, axis=0)
+    shifted = np.zeros_like(cumulative)
+    shifted[window:] = cumulative[:-window]
+    return cumulative - shifted
+
+
+def movements(start_date, end_date, period='day', group_by='warehouse', window=7, warehouse_ids=None,
+              product_ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    Колонки отчёта {имя: список} по периодам и ключам (склад или товар), где в
+    периоде было движение или оно изменилось к предыдущему периоду; строки
+    упорядочены по периоду, затем по ключу.
+    """
+    lookback = max(window - 1, 1)
+    periods = period_range(start_date, end_date, period, lookback)
+    rows = period_rows(periods, period, group_by, warehouse_ids, product_ids, using)
+
+    index = {start: position for position, start in enumerate(periods)}
+    flat = np.array(
+        [
+            (index[start], key, inbound, outbound)
+            for start, entries in rows.items() for key, inbound, outbound in entries
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    keys = np.unique(flat[:, 1])
+    inbound = np.zeros((len(periods), len(keys)), dtype=np.int64)
+    outbound = np.zeros_like(inbound)
+    cells = (flat[:, 0], np.searchsorted(keys, flat[:, 1]))
+    # у склада в UNION ALL две строки на период: суммы складываются
+    np.add.at(inbound, cells, flat[:, 2])
+    np.add.at(outbound, cells, flat[:, 3])
+
+    inbound_change = np.diff(inbound, axis=0)[lookback - 1:]
+    outbound_change = np.diff(outbound, axis=0)[lookback - 1:]
+    rolling_inbound = _rolling(inbound, window)[lookback:]
+    rolling_outbound = _rolling(outbound, window)[lookback:]
+    inbound, outbound = inbound[lookback:], outbound[lookback:]
+
+    mask = (inbound != 0) | (outbound != 0) | (inbound_change != 0) | (outbound_change != 0)
+    period_index, key_index = np.nonzero(mask)
+    starts = periods[lookback:]
+    return {
+        "period": [starts[position] for position in period_index.tolist()],
+        f"{group_by}_id": keys[key_index].tolist(),
+        "inbound": inbound[mask].tolist(),
+        "outbound": outbound[mask].tolist(),
+        "net": (inbound - outbound)[mask].tolist(),
+        "inbound_change": inbound_change[mask].tolist(),
+        "outbound_change": outbound_change[mask].tolist(),
+        "rolling_inbound": rolling_inbound[mask].tolist(),
+        "rolling_outbound": rolling_outbound[mask].tolist(),
+    }
+
+
+def as_rows(columns):
+    """Колонки отчёта movements() построчно: список словарей."""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
@@ -0,0 +1,406 @@
+"""
+Асинхронные версии горячих эндпоинтов чтения для запуска под ASGI.
+
+Включаются настройкой WAREHOUSES_API_MODE = 'async' (см. warehouses.urls) и
+перекрывают соответствующие действия DRF-представлений с той же выдачей.
+Запросы идут через асинхронный ORM (aget, async for); фильтры django-filter
+проверяются в потоке через sync_to_async, потому что валидация ссылочных
+фильтров обращается к базе. Журналы, перемещения и итоги листаются курсором по
+ключу сортировки (warehouses.pagination.KeysetPagination): ссылки "previous" нет
+("previous": null), а курсоры несовместимы с курсорами синхронного режима.
+Переключать WAREHOUSES_API_MODE посреди листания нельзя: курсор другого режима
+отклоняется с 400, и листать нужно с первой страницы.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import InvalidPage, Paginator
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import re_path
+from rest_framework import serializers, status
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from warehouses import changefeed, history, inventory_cache, queries, routing
+from warehouses.filters import InventoryLogFilter, InventoryLogRollupFilter, TransferLogFilter
+from warehouses.models import InventoryLog, InventoryLogRollup, ProductStockTotal, TransferLog
+from warehouses.pagination import WarehouseInventoryPagination, StockSummaryKeysetPagination, \
+    InventoryLogKeysetPagination, InventoryLogRollupKeysetPagination, TransferLogKeysetPagination, ForeignCursor, \
+    cached_page, listing_page, page_links
+from warehouses.renderers import FastJSONRenderer
+from warehouses.search import matching_product_ids
+from warehouses.views import parse_id_list
+
+_datetime_field = serializers.DateTimeField()
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    # тот же рендерер, что у DRF-представлений (warehouses.renderers)
+    return HttpResponse(FastJSONRenderer().render(data), status=status, headers=headers,
+                        content_type='application/json')
+
+
+async def authenticate(request):
+    """Аналог TokenAuthentication: пользователь или ответ 401 с тем же текстом ошибки."""
+    header = request.headers.get('Authorization', '').split()
+    if not header or header[0].lower() != 'token':
+        return None, "Authentication credentials were not provided."
+    if len(header) == 1:
+        return None, "Invalid token header. No credentials provided."
+    if len(header) > 2:
+        return None, "Invalid token header. Token string should not contain spaces."
+
+    try:
+        token = await Token.objects.select_related('user').aget(key=header[1])
+    except Token.DoesNotExist:
+        return None, "Invalid token."
+    if not token.user.is_active:
+        return None, "User inactive or deleted."
+    return token.user, None
+
+
+def api_view(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return json_response(
+                {"detail": f'Method "{request.method}" not allowed.'},
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                headers={'Allow': 'GET, HEAD'},
+            )
+        user, error = await authenticate(request)
+        if user is None:
+            return json_response(
+                {"detail": error}, status=status.HTTP_401_UNAUTHORIZED, headers={'WWW-Authenticate': 'Token'}
+            )
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def filtered_queryset(filterset_class, request, queryset):
+    def build():
+        filterset = filterset_class(request.GET, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return None, filterset.errors
+        return filterset.qs, None
+    return await sync_to_async(build)()
+
+
+def invalid_cursor(exc):
+    # курсор синхронного режима (CursorPagination) — 400, как в нём для курсоров этого режима
+    if isinstance(exc, ForeignCursor):
+        return json_response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return json_response({"detail": "Invalid cursor"}, status=status.HTTP_404_NOT_FOUND)
+
+
+async def keyset_response(paginator, queryset, request, row):
+    try:
+        rows, next_link = await paginator.paginate(queryset, request)
+    except ValueError as exc:
+        return invalid_cursor(exc)
+    return json_response({
+        "next": next_link,
+        "previous": None,
+        "results": [row(item) for item in rows],
+    })
+
+
+def inventory_log_row(item):
+    return {
+        "id": item["id"],
+        "quantity": item["quantity"],
+        "operation": item["operation"],
+        "created_at": _datetime_field.to_representation(item["created_at"]),
+        "product": item["product_id"],
+        "warehouse": item["warehouse_id"],
+    }
+
+
+def inventory_log_rollup_row(item):
+    return {
+        "id": item["id"],
+        "day": item["day"].isoformat(),
+        "closing_quantity": item["closing_quantity"],
+        "net_change": item["net_change"],
+        "entries": item["entries"],
+        "product": item["product_id"],
+        "warehouse": item["warehouse_id"],
+    }
+
+
+@api_view
+async def warehouse_inventory(request, pk):
+    search = request.GET.get('search', '').lower()
+    paginate = 'page' in request.GET or 'page_size' in request.GET
+    params = {key: request.GET.get(key) for key in ('page', 'page_size')}
+    params['search'] = search
+
+    if 'as_of' in request.GET:
+        return await warehouse_inventory_as_of(request, pk, search, paginate)
+
+    key = inventory_cache.listing_key(pk, await inventory_cache.awarehouse_version(pk), params)
+    etag = inventory_cache.etag_for(key)
+    if inventory_cache.etag_matches(request, etag):
+        inventory_cache.count('not_modified')
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    data = await cache.aget(key)
+    if data is not None:
+        inventory_cache.count('hits')
+        return json_response(listing_page(request, data) if paginate else data, headers={'ETag': etag})
+    inventory_cache.count('misses')
+
+    product_ids = await sync_to_async(matching_product_ids)(search) if search else None
+    inventories = queries.warehouse_inventory(pk, product_ids)
+
+    if not paginate:
+        data = [queries.inventory_listing_row(row) async for row in inventories]
+    else:
+        pagination = WarehouseInventoryPagination()
+        try:
+            page_size = int(request.GET[pagination.page_size_query_param])
+            if page_size <= 0:
+                raise ValueError
+            page_size = min(page_size, pagination.max_page_size)
+        except (KeyError, ValueError):
+            page_size = pagination.page_size
+        paginator = Paginator(inventories.order_by('pk'), page_size)
+        paginator.count = await inventories.acount()
+        try:
+            page = paginator.page(request.GET.get(pagination.page_query_param) or 1)
+        except InvalidPage:
+            return json_response({"detail": "Invalid page."}, status=status.HTTP_404_NOT_FOUND)
+
+        data = cached_page(page, [queries.inventory_listing_row(row) async for row in page.object_list])
+
+    await cache.aset(key, data, inventory_cache.cache_timeout())
+    return json_response(listing_page(request, data) if paginate else data, headers={'ETag': etag})
+
+
+def invalid_as_of():
+    return json_response(
+        {"error": "as_of must be an ISO 8601 date or datetime."},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+async def warehouse_inventory_as_of(request, pk, search, paginate):
+    # восстановление по снимку и журналу — несколько запросов подряд, выполняются в потоке
+    try:
+        as_of = history.parse_as_of(request.GET['as_of'])
+    except ValueError:
+        return invalid_as_of()
+
+    product_ids = await sync_to_async(matching_product_ids)(search) if search else None
+    data = await sync_to_async(history.warehouse_inventory)(pk, as_of, product_ids)
+    if not paginate:
+        return json_response(data)
+
+    pagination = WarehouseInventoryPagination()
+    try:
+        page_size = int(request.GET[pagination.page_size_query_param])
+        if page_size <= 0:
+            raise ValueError
+        page_size = min(page_size, pagination.max_page_size)
+    except (KeyError, ValueError):
+        page_size = pagination.page_size
+    paginator = Paginator(data, page_size)
+    try:
+        page = paginator.page(request.GET.get(pagination.page_query_param) or 1)
+    except InvalidPage:
+        return json_response({"detail": "Invalid page."}, status=status.HTTP_404_NOT_FOUND)
+    next_url, previous_url = page_links(request, pagination, page)
+    return json_response({
+        "count": paginator.count,
+        "next": next_url,
+        "previous": previous_url,
+        "results": page.object_list,
+    })
+
+
+async def summary_as_of(request):
+    try:
+        as_of = history.parse_as_of(request.GET['as_of'])
+    except ValueError:
+        return invalid_as_of()
+    try:
+        totals = await sync_to_async(history.stock_summary)(request.GET, as_of)
+    except ValueError:
+        return json_response(
+            {"error": "min_total and max_total must be integers."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        rows, next_link = StockSummaryKeysetPagination().paginate_rows(totals, request, ProductStockTotal)
+    except ValueError as exc:
+        return invalid_cursor(exc)
+    return json_response({"next": next_link, "previous": None, "results": rows})
+
+
+@routing.use_replica
+@api_view
+async def inventory_summary(request):
+    if 'as_of' in request.GET:
+        return await summary_as_of(request)
+
+    try:
+        totals = queries.stock_summary(request.GET)
+    except ValueError:
+        return json_response(
+            {"error": "min_total and max_total must be integers."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return await keyset_response(StockSummaryKeysetPagination(), totals, request, queries.stock_summary_row)
+
+
+@routing.use_replica
+@api_view
+async def inventory_logs(request):
+    if request.GET.get('source') == 'rollup':
+        rollups, errors = await filtered_queryset(
+            InventoryLogRollupFilter, request, InventoryLogRollup.objects.all()
+        )
+        if errors is not None:
+            return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+        return await keyset_response(
+            InventoryLogRollupKeysetPagination(), rollups.values(), request, inventory_log_rollup_row
+        )
+
+    logs, errors = await filtered_queryset(InventoryLogFilter, request, InventoryLog.objects.all())
+    if errors is not None:
+        return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = InventoryLogKeysetPagination()
+    try:
+        rows, next_url = await paginator.paginate(logs.values(), request)
+    except ValueError as exc:
+        return invalid_cursor(exc)
+
+    # Сырые записи закончились: более старая история доступна только в дневных сводках
+    if next_url is None and 'operation' not in request.GET:
+        rollups, _ = await filtered_queryset(InventoryLogRollupFilter, request, InventoryLogRollup.objects.all())
+        if rollups is not None and await rollups.aexists():
+            url = remove_query_param(request.build_absolute_uri(), paginator.cursor_query_param)
+            next_url = replace_query_param(url, 'source', 'rollup')
+
+    return json_response({
+        "next": next_url,
+        "previous": None,
+        "results": [inventory_log_row(item) for item in rows],
+    })
+
+
+@routing.use_replica
+@api_view
+async def transfer_logs(request):
+    transfers, errors = await filtered_queryset(TransferLogFilter, request, TransferLog.objects.all())
+    if errors is not None:
+        return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+    return await keyset_response(TransferLogKeysetPagination(), transfers.values(), request, queries.transfer_log_row)
+
+
+def change_event(cursor, rows):
+    payload = FastJSONRenderer().render({"cursor": cursor, "changes": changefeed.coalesce(rows)})
+    return b'id: %d\nevent: changes\ndata: %s\n\n' % (cursor, payload)
+
+
+async def change_events(hub, cursor, warehouse_ids):
+    heartbeat = getattr(settings, 'CHANGE_FEED_HEARTBEAT', 15)
+    subscription = await hub.subscribe(warehouse_ids)
+    try:
+        if cursor is None:
+            cursor = await sync_to_async(changefeed.latest_id)()
+        # EventSource переподключается сам и присылает последний id в Last-Event-ID
+        yield b'retry: 3000\nid: %d\nevent: ready\ndata: {"cursor":%d}\n\n' % (cursor, cursor)
+
+        # пропущенное с курсора клиента дочитывается из журнала, дальше — только то, что разошлёт слушатель
+        while True:
+            rows = await sync_to_async(changefeed.fetch_changes)(cursor, warehouse_ids)
+            if rows:
+                cursor = rows[-1][0]
+                yield change_event(cursor, rows)
+            if len(rows) < changefeed.FETCH_LIMIT:
+                break
+
+        # переполненная очередь: закрываем поток, клиент переподключится и дочитает из базы
+        while not subscription.overflowed:
+            rows = await subscription.get(heartbeat)
+            if rows is None:
+                yield b': keepalive\n\n'
+                continue
+            rows = [row for row in rows if row[0] > cursor]
+            if rows:
+                cursor = rows[-1][0]
+                yield change_event(cursor, rows)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@api_view
+async def inventory_changes(request):
+    """
+    Лента изменений остатков. С Accept: text/event-stream под ASGI — поток SSE,
+    иначе long-poll: ответ приходит, как только после курсора появятся изменения,
+    или через ?timeout= секунд с пустым списком. Курсор — id записи журнала
+    (?cursor= или заголовок Last-Event-ID); ?warehouse=1,2 — только эти склады.
+    """
+    try:
+        warehouse_ids = parse_id_list(request.GET.get('warehouse'))
+        cursor = request.GET.get('cursor') or request.headers.get('Last-Event-ID')
+        cursor = int(cursor) if cursor is not None else None
+        if cursor is not None and cursor < 0:
+            raise ValueError
+    except ValueError:
+        return json_response(
+            {"error": "warehouse must be a comma-separated list of ids and cursor a non-negative integer."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    hub = changefeed.get_hub()
+    if isinstance(request, ASGIRequest) and 'text/event-stream' in request.headers.get('Accept', ''):
+        return StreamingHttpResponse(
+            change_events(hub, cursor, warehouse_ids),
+            content_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    max_timeout = getattr(settings, 'CHANGE_FEED_LONG_POLL_TIMEOUT', 25)
+    try:
+        timeout = min(float(request.GET.get('timeout', max_timeout)), max_timeout)
+        if timeout < 0:
+            raise ValueError
+    except ValueError:
+        return json_response({"error": "timeout must be a non-negative number."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if cursor is None:
+        # первый запрос только выдаёт курсор, с которого ждать изменений
+        return json_response({"cursor": await sync_to_async(changefeed.latest_id)(), "changes": []})
+
+    subscription = await hub.subscribe(warehouse_ids)
+    try:
+        rows = await sync_to_async(changefeed.fetch_changes)(cursor, warehouse_ids)
+        if not rows and timeout:
+            rows = [row for row in await subscription.get(timeout) or () if row[0] > cursor]
+    finally:
+        hub.unsubscribe(subscription)
+    if rows:
+        cursor = rows[-1][0]
+    return json_response({"cursor": cursor, "changes": changefeed.coalesce(rows)})
+
+
+# лента изменений только асинхронная и подключается в обоих режимах API (см. warehouses.urls)
+changefeed_urlpatterns = [
+    re_path(r'^inventory/changes/$', inventory_changes, name='inventory-changes'),
+]
+
+# те же пути и имена, что у DefaultRouter; варианты с суффиксом формата (.json) остаются синхронными
+urlpatterns = [
+    re_path(r'^warehouses/(?P<pk>[^/.]+)/inventory/$', warehouse_inventory, name='warehouse-warehouse-inventory'),
+    re_path(r'^inventory/summary/$', inventory_summary, name='inventory-summary'),
+    re_path(r'^inventory/logs/$', inventory_logs, name='inventory-inventory-logs'),
+    re_path(r'^transfers/$', transfer_logs, name='transfers-list'),
+]
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from warehouses import changefeed
+from warehouses.models import InventoryLog
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {
+    'flushed_rows': 0,
+    'flushes': 0,
+    'flush_seconds_total': 0.0,
+    'last_flush_seconds': 0.0,
+}
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _buffers(using):
+    if not hasattr(_local, 'buffers'):
+        _local.buffers = {}
+    return _local.buffers.setdefault(using, {})
+
+
+def _flush(entries, using):
+    if not entries:
+        return
+    started = time.perf_counter()
+    changefeed.write_logs(entries, using)
+    elapsed = time.perf_counter() - started
+    changefeed.notify_local(using)
+
+    with _stats_lock:
+        _stats['flushed_rows'] += len(entries)
+        _stats['flushes'] += 1
+        _stats['flush_seconds_total'] += elapsed
+        _stats['last_flush_seconds'] = elapsed
+
+
+def record(changes, using=DEFAULT_DB_ALIAS):
+    """
+    Откладывает запись InventoryLog до фиксации текущей транзакции.
+
+    Записи копятся в буфере текущей точки сохранения и пишутся одним bulk_create
+    в transaction.on_commit. При откате колбэк отбрасывается Django, а вместе
+    с ним и буфер. Вне atomic() записи пишутся сразу.
+
+    Время записи ставится здесь, пока строка Inventory ещё заблокирована:
+    колбэки разных транзакций могут выполниться не в порядке фиксации, и тогда
+    id и время вставки не отражают порядок изменений одной пары.
+    """
+    changed_at = timezone.now()
+    entries = [
+        InventoryLog(
+            product_id=change.product_id,
+            warehouse_id=change.warehouse_id,
+            quantity=change.quantity,
+            operation=change.operation,
+            created_at=changed_at,
+        )
+        for change in changes
+    ]
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        _flush(entries, using)
+        return
+
+    buffers = _buffers(using)
+    pending = {id(func) for _, func, _ in connection.run_on_commit}
+    for key in [key for key, (_, flush) in buffers.items() if id(flush) not in pending]:
+        del buffers[key]
+
+    # None — вложенный atomic(savepoint=False), он не меняет область отката
+    key = tuple(sid for sid in connection.savepoint_ids if sid is not None)
+    if key in buffers:
+        buffers[key][0].extend(entries)
+        return
+
+    def flush():
+        if buffers.get(key, (None,))[0] is entries:
+            del buffers[key]
+        _flush(entries, using)
+
+    buffers[key] = (entries, flush)
+    transaction.on_commit(flush, using=using)
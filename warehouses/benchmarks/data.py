@@ -0,0 +1,108 @@
+"""
+Детерминированный генератор данных для бенчмарков: N складов × M товаров с
+заданной плотностью остатков плюс история InventoryLog и TransferLog.
+
+Один и тот же seed даёт одни и те же строки, поэтому прогоны на разных
+коммитах сравнимы между собой.
+"""
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from warehouses import changefeed
+from warehouses.models import Warehouse, Product, Inventory, InventoryLog, TransferLog
+
+# имя -> (складов, товаров, доля заполненных пар, записей InventoryLog, записей TransferLog)
+SCALES = {
+    'tiny': (3, 50, 0.5, 500, 100),
+    'small': (10, 500, 0.4, 10000, 2000),
+    'medium': (25, 5000, 0.3, 100000, 20000),
+    'large': (50, 20000, 0.25, 500000, 100000),
+}
+
+HISTORY_DAYS = 90
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _backdate(model, column, objs, now, rng, using):
+    # auto_now_add перезаписывает время при вставке, поэтому история датируется отдельным UPDATE на день
+    by_day = {}
+    for obj in objs:
+        by_day.setdefault(rng.randrange(HISTORY_DAYS), []).append(obj.pk)
+    for day, pks in by_day.items():
+        model.objects.using(using).filter(pk__in=pks).update(**{column: now - timedelta(days=day)})
+
+
+def generate(warehouses, products, density, log_entries=0, transfer_entries=0, seed=0,
+             chunk_size=5000, using=DEFAULT_DB_ALIAS):
+    """Создаёт данные и возвращает счётчики созданных строк."""
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        warehouse_objs = Warehouse.objects.using(using).bulk_create([
+            Warehouse(name=f'Warehouse {number}', location=f'City {number % 7}')
+            for number in range(warehouses)
+        ])
+        product_objs = Product.objects.using(using).bulk_create([
+            Product(name=f'Product {number} {rng.choice(["red", "green", "blue"])}', sku=f'BENCH-{number:07d}')
+            for number in range(products)
+        ], batch_size=chunk_size)
+        warehouse_ids = [obj.pk for obj in warehouse_objs]
+        product_ids = [obj.pk for obj in product_objs]
+
+        pairs = [
+            (product_id, warehouse_id)
+            for product_id in product_ids
+            for warehouse_id in warehouse_ids
+            if rng.random() < density
+        ]
+        for chunk in _chunks(pairs, chunk_size):
+            Inventory.objects.using(using).bulk_create([
+                Inventory(product_id=product_id, warehouse_id=warehouse_id, quantity=rng.randint(0, 500))
+                for product_id, warehouse_id in chunk
+            ])
+
+        operations = [operation for operation, _ in InventoryLog.OPERATION_CHOICES]
+        for chunk in _chunks(range(log_entries), chunk_size):
+            logs = [
+                InventoryLog(
+                    product_id=rng.choice(product_ids),
+                    warehouse_id=rng.choice(warehouse_ids),
+                    quantity=rng.randint(0, 500),
+                    operation=rng.choice(operations),
+                )
+                for _ in chunk
+            ]
+            # через границу ленты изменений: иначе лента отдала бы их вместе со следующей записью
+            changefeed.write_logs(logs, using)
+            _backdate(InventoryLog, 'created_at', logs, now, rng, using)
+
+        for chunk in _chunks(range(transfer_entries if len(warehouse_ids) > 1 else 0), chunk_size):
+            transfers = []
+            for _ in chunk:
+                source, destination = rng.sample(warehouse_ids, 2)
+                transfers.append(TransferLog(
+                    product_id=rng.choice(product_ids),
+                    from_warehouse_id=source,
+                    to_warehouse_id=destination,
+                    quantity=rng.randint(1, 20),
+                ))
+            transfers = TransferLog.objects.using(using).bulk_create(transfers)
+            _backdate(TransferLog, 'timestamp', transfers, now, rng, using)
+
+    return {
+        "warehouses": len(warehouse_ids),
+        "products": len(product_ids),
+        "inventory_rows": len(pairs),
+        "log_entries": InventoryLog.objects.using(using).count(),
+        "transfer_entries": TransferLog.objects.using(using).count(),
+    }
@@ -0,0 +1,97 @@
+"""
+Нагрузочный прогон эндпоинтов внутри процесса, без HTTP-сервера.
+
+Один и тот же набор запросов выполняется с одинаковой конкуренцией: синхронные
+представления — в пуле потоков (как воркеры WSGI), асинхронные — в цикле
+событий, каждый запрос в своём ThreadSensitiveContext (как ASGIHandler).
+Соединения с базой закрываются или возвращаются в пул в конце каждого запроса,
+как по сигналу request_finished.
+"""
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext, iscoroutinefunction, sync_to_async
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, RequestFactory
+from django.urls import URLResolver
+from django.urls.resolvers import RegexPattern
+
+# кэш выдачи склада отключается, чтобы каждый запрос доходил до базы
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def api_resolver(patterns, prefix=r'^/api/'):
+    return URLResolver(RegexPattern(prefix), patterns)
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples, elapsed):
+    """samples — [(секунды, код ответа)]; возвращает сводку прогона."""
+    latencies = sorted(seconds for seconds, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status in samples if status >= 400),
+        "seconds": round(elapsed, 4),
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def _call(match, request):
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def run_sync(resolver, paths, requests, concurrency, headers=None):
+    factory = RequestFactory()
+
+    def one(path):
+        close_old_connections()
+        request = factory.get(path, headers=headers)
+        started = time.perf_counter()
+        response = _call(resolver.resolve(request.path_info), request)
+        seconds = time.perf_counter() - started
+        close_old_connections()
+        return seconds, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, (paths[i % len(paths)] for i in range(requests))))
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def _run_async(resolver, paths, requests, concurrency, headers):
+    factory = AsyncRequestFactory()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore, ThreadSensitiveContext():
+            request = factory.get(path, headers=headers)
+            started = time.perf_counter()
+            match = resolver.resolve(request.path_info)
+            if iscoroutinefunction(match.func):
+                response = await match.func(request, *match.args, **match.kwargs)
+            else:
+                response = await sync_to_async(_call)(match, request)
+            seconds = time.perf_counter() - started
+            await sync_to_async(close_old_connections)()
+            return seconds, response.status_code
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(one(paths[i % len(paths)]) for i in range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run_async(resolver, paths, requests, concurrency, headers=None):
+    return asyncio.run(_run_async(resolver, paths, requests, concurrency, headers))
@@ -0,0 +1,175 @@
+"""
+Время старта и память воркера для профилей настроек (MULTISTOCK_PROFILE).
+
+Каждый замер идёт в отдельном интерпретаторе (python -m warehouses.benchmarks.startup
+<режим> <воркеров>), который печатает отчёт одной строкой JSON:
+
+- load — время до готового WSGI-приложения вместе с warmup.warm_code, число
+  загруженных модулей и память процесса;
+- preload — приложение загружается до fork, объекты замораживаются
+  gc.freeze, затем запускаются воркеры (как с gunicorn.conf.py);
+- fork — сначала fork, затем каждый воркер загружает приложение сам
+  (gunicorn без preload_app).
+
+Воркер выполняет полную сборку мусора, как это рано или поздно случится под
+нагрузкой, и сообщает память из /proc/self/smaps_rollup: private — страницы
+только этого воркера, pss — его доля с учётом общих страниц. Воркеры живут,
+пока не отчитаются все, чтобы доли общих страниц считались на всех.
+Разбор импорта — по выводу python -X importtime отдельного запуска load.
+"""
+import gc
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ('load', 'preload', 'fork')
+MEMORY_FIELD = re.compile(r'^(\w+):\s+(\d+) kB$', re.MULTILINE)
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def memory():
+    """Память процесса, КБ: rss, pss, private; None там, где нет /proc/self/smaps_rollup."""
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            fields = {name: int(value) for name, value in MEMORY_FIELD.findall(file.read())}
+    except OSError:
+        return {"rss_kb": None, "pss_kb": None, "private_kb": None}
+    return {
+        "rss_kb": fields['Rss'],
+        "pss_kb": fields['Pss'],
+        "private_kb": fields['Private_Clean'] + fields['Private_Dirty'],
+    }
+
+
+def load_application():
+    """WSGI-приложение, готовое к первому запросу: прогрев повторяется на случай, если его нет в wsgi.py."""
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+
+    from warehouses import warmup
+
+    application = import_string(settings.WSGI_APPLICATION)
+    warmup.warm_code()
+    return application
+
+
+def fork_workers(count, load):
+    """Запускает count воркеров fork; load — воркер загружает приложение сам. Возвращает их память."""
+    report_read, report_write = os.pipe()
+    release_read, release_write = os.pipe()
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            os.close(report_read)
+            os.close(release_write)
+            if load:
+                load_application()
+            gc.enable()
+            gc.collect()
+            # одна строка короче PIPE_BUF пишется в общий канал целиком
+            os.write(report_write, (json.dumps(memory()) + '\n').encode())
+            os.read(release_read, 1)
+            os._exit(0)
+        pids.append(pid)
+    os.close(report_write)
+    os.close(release_read)
+
+    with os.fdopen(report_read) as reports:
+        workers = [json.loads(reports.readline()) for _ in pids]
+    os.close(release_write)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return workers
+
+
+def probe(mode, workers):
+    started = time.perf_counter()
+    if mode == 'fork':
+        return {"workers": fork_workers(workers, load=True)}
+    if mode == 'preload':
+        gc.disable()
+    load_application()
+    report = {"ready_seconds": time.perf_counter() - started, "modules": len(sys.modules), **memory()}
+    if mode == 'preload':
+        gc.freeze()
+        report["workers"] = fork_workers(workers, load=False)
+    return report
+
+
+def run_probe(mode, profile, workers=0, importtime=False):
+    """Запускает замер в новом интерпретаторе; возвращает (отчёт, stderr)."""
+    from django.conf import settings
+
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []),
+               '-m', 'warehouses.benchmarks.startup', mode, str(workers)]
+    started = time.perf_counter()
+    completed = subprocess.run(
+        command, cwd=settings.BASE_DIR, env={**os.environ, 'MULTISTOCK_PROFILE': profile},
+        capture_output=True, text=True, check=False,
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode:
+        raise RuntimeError(f"Startup probe {mode} ({profile}) failed:\n{completed.stderr[-2000:]}")
+    report = json.loads(completed.stdout.splitlines()[-1])
+    report["wall_seconds"] = elapsed
+    return report, completed.stderr
+
+
+def import_breakdown(stderr, top=10):
+    """(суммарное время импорта, с; [(модуль, с)] самых долгих импортов верхнего уровня)."""
+    total, top_level = 0, []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        own, cumulative, indent, name = match.groups()
+        total += int(own)
+        if len(indent) == 1:
+            top_level.append((name, int(cumulative)))
+    top_level.sort(key=lambda item: -item[1])
+    return total / 1e6, [(name, microseconds / 1e6) for name, microseconds in top_level[:top]]
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.fmean(values)) if values else None
+
+
+def worker_memory(workers):
+    return {
+        "workers": len(workers),
+        **{f"{field}_mean": _mean(worker[field] for worker in workers) for field in ("rss_kb", "pss_kb", "private_kb")},
+    }
+
+
+def measure(profile, workers=4, repeat=5, top=10):
+    """Сводка по профилю: медианы repeat запусков load, разбор импорта и память воркеров в обоих режимах."""
+    loads = [run_probe('load', profile)[0] for _ in range(repeat)]
+    _, stderr = run_probe('load', profile, importtime=True)
+    import_seconds, slowest = import_breakdown(stderr, top)
+    preload, _ = run_probe('preload', profile, workers)
+    forked, _ = run_probe('fork', profile, workers)
+    return {
+        "profile": profile,
+        "ready_seconds": round(statistics.median(report["ready_seconds"] for report in loads), 4),
+        "wall_seconds": round(statistics.median(report["wall_seconds"] for report in loads), 4),
+        "modules": loads[0]["modules"],
+        "rss_kb": _mean(report["rss_kb"] for report in loads),
+        "import_seconds": round(import_seconds, 4),
+        "slowest_imports": [[name, round(seconds, 4)] for name, seconds in slowest],
+        "preload": {"master_rss_kb": preload["rss_kb"], **worker_memory(preload["workers"])},
+        "fork": worker_memory(forked["workers"]),
+    }
+
+
+if __name__ == '__main__':
+    mode, workers = sys.argv[1], int(sys.argv[2])
+    if mode not in MODES:
+        sys.exit(f"Unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'multistock.settings')
+    print(json.dumps(probe(mode, workers)))
@@ -0,0 +1,342 @@
+"""
+Набор бенчмарков API складов: число запросов к базе на эндпоинт (бюджет не
+должен зависеть от объёма данных), задержки и пропускная способность на
+нескольких масштабах данных и конкурентные перемещения с проверкой того,
+что суммарный остаток по товарам сохраняется, в том числе по одной «горячей»
+строке в обычном и шардированном режимах.
+"""
+import random
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, reset_queries
+from django.db.models import F, Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from warehouses import history, slots, stock_totals
+from warehouses.benchmarks import load
+from warehouses.models import Inventory, TransferLog, Warehouse, live_quantity
+from warehouses.urls import router
+
+# Максимум запросов к базе на один HTTP-запрос (включая проверку токена), кэш выдачи отключён
+QUERY_BUDGETS = {
+    'warehouse_inventory': 2,
+    'warehouse_inventory_page': 3,
+    'summary': 2,
+    # снимок, журнал, резервы и товары на момент as_of
+    'warehouse_inventory_as_of': 6,
+    'summary_as_of': 6,
+    'logs': 3,
+    'logs_by_warehouse': 4,
+    'transfers': 2,
+    'inventory_list': 2,
+    'products': 3,
+    'warehouses': 2,
+    'export': 2,
+    'export_all': 2,
+    'low_stock': 2,
+    # без LOW_STOCK_WEBHOOK_URL; с ним поиск пересечений порога добавляет один запрос.
+    # Два из них — блокировка и сдвиг границы ленты изменений при записи журнала
+    'transfer': 13,
+    'rebalance_plan': 3,
+    # кэш закрытых периодов отключён (NO_CACHE): все периоды одним запросом
+    'analytics_movements': 2,
+}
+
+
+def endpoint_requests(warehouse_id, transfer):
+    """Имя -> (метод, путь, тело) для эндпоинтов из QUERY_BUDGETS."""
+    today = timezone.localdate().isoformat()
+    return {
+        'warehouse_inventory': ('get', f'/api/warehouses/{warehouse_id}/inventory/', None),
+        'warehouse_inventory_page': ('get', f'/api/warehouses/{warehouse_id}/inventory/?page=2&page_size=10', None),
+        'summary': ('get', '/api/inventory/summary/', None),
+        'warehouse_inventory_as_of': ('get', f'/api/warehouses/{warehouse_id}/inventory/?as_of={today}', None),
+        'summary_as_of': ('get', f'/api/inventory/summary/?as_of={today}', None),
+        'logs': ('get', '/api/inventory/logs/', None),
+        'logs_by_warehouse': ('get', f'/api/inventory/logs/?warehouse={warehouse_id}', None),
+        'transfers': ('get', '/api/transfers/', None),
+        'inventory_list': ('get', '/api/inventory/', None),
+        'products': ('get', '/api/products/', None),
+        'warehouses': ('get', '/api/warehouses/', None),
+        'export': ('get', f'/api/warehouses/{warehouse_id}/inventory/export/', None),
+        'export_all': ('get', '/api/warehouses/inventory/export/', None),
+        'low_stock': ('get', '/api/inventory/low-stock/', None),
+        'transfer': ('post', '/api/inventory/transfer/', transfer),
+        # только расчёт по всей матрице остатков, без применения
+        'rebalance_plan': ('post', '/api/inventory/rebalance/plan/', {
+            'rules': [{'warehouse_id': warehouse_id, 'min': 1}],
+        }),
+        'analytics_movements': ('get', '/api/analytics/movements/?period=week&group_by=warehouse', None),
+    }
+
+
+def _request(client, method, path, body):
+    if method == 'post':
+        response = client.post(path, body, content_type='application/json')
+    else:
+        response = client.get(path)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _reversed(transfer):
+    return {
+        **transfer,
+        'from_warehouse_id': transfer['to_warehouse_id'],
+        'to_warehouse_id': transfer['from_warehouse_id'],
+    }
+
+
+def transfer_candidate(using=DEFAULT_DB_ALIAS):
+    """Перемещение по 1 шт. между двумя складами, которое можно гонять туда и обратно."""
+    stocked = (
+        Inventory.objects.using(using)
+        .filter(available__gt=0)
+        .order_by('-available', 'pk')
+        .values_list('product_id', 'warehouse_id')
+    )
+    for product_id, warehouse_id in stocked[:100]:
+        destination = (
+            Inventory.objects.using(using)
+            .filter(product_id=product_id)
+            .exclude(warehouse_id=warehouse_id)
+            .values_list('warehouse_id', flat=True)
+            .first()
+        )
+        if destination is not None:
+            break
+    else:
+        return None
+    return {
+        'product_id': product_id,
+        'from_warehouse_id': warehouse_id,
+        'to_warehouse_id': destination,
+        'quantity': 1,
+    }
+
+
+def measure_endpoint(client, method, path, body, repeat, using=DEFAULT_DB_ALIAS):
+    """Запросы к базе на один вызов и задержки последовательных вызовов."""
+    # перемещение гоняется туда и обратно, чтобы не менять остатки
+    reverse = 'from_warehouse_id' in (body or {})
+    _request(client, method, path, body)
+    if reverse:
+        body = _reversed(body)
+    # при DEBUG журнал запросов ограничен по длине; заполненный журнал даёт нулевую разницу
+    reset_queries()
+    with CaptureQueriesContext(connections[using]) as captured:
+        response = _request(client, method, path, body)
+    # captured читает журнал запросов лениво, а следующие вызовы его очищают (request_started)
+    queries = len(captured)
+
+    samples = []
+    for _ in range(repeat):
+        if reverse:
+            body = _reversed(body)
+        started = time.perf_counter()
+        response = _request(client, method, path, body)
+        samples.append((time.perf_counter() - started, response.status_code))
+    return queries, response.status_code, load.summarize(samples, sum(seconds for seconds, _ in samples))
+
+
+def stress_transfers(token, workers, transfers_per_worker, seed=0, products=5, using=DEFAULT_DB_ALIAS):
+    """
+    Параллельные переводы по нескольким «горячим» товарам через /api/inventory/transfer/.
+    Отказы 400/404 допустимы; сумма остатков по товару, неотрицательность и
+    соответствие TransferLog успешным переводам проверяются после прогона.
+    """
+    hot = list(
+        Inventory.objects.using(using)
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .order_by('-total', 'product_id')
+        .values_list('product_id', flat=True)[:products]
+    )
+    warehouse_ids = sorted(set(
+        Inventory.objects.using(using).filter(product_id__in=hot).values_list('warehouse_id', flat=True)
+    ))
+    if not hot or len(warehouse_ids) < 2:
+        return None
+
+    def line(rng):
+        source, destination = rng.sample(warehouse_ids, 2)
+        return {
+            'product_id': rng.choice(hot),
+            'from_warehouse_id': source,
+            'to_warehouse_id': destination,
+            'quantity': rng.randint(1, 5),
+        }
+
+    return _run_transfers(token, workers, transfers_per_worker, line, hot, seed, using)
+
+
+def _product_totals(product_ids, using):
+    # количество шардированных строк — вместе со слотами
+    return dict(
+        Inventory.objects.using(using).filter(product_id__in=product_ids)
+        .values('product_id').annotate(total=Sum(live_quantity())).values_list('product_id', 'total')
+    )
+
+
+def _run_transfers(token, workers, transfers_per_worker, line, product_ids, seed, using):
+    """Параллельные POST /api/inventory/transfer/ с телами line(rng) и проверкой сохранения остатков product_ids."""
+    before = _product_totals(product_ids, using)
+    logs_before = TransferLog.objects.using(using).count()
+    statuses = []
+    statuses_lock = threading.Lock()
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}', raise_request_exception=False)
+        codes = []
+        try:
+            for _ in range(transfers_per_worker):
+                response = client.post('/api/inventory/transfer/', line(rng), content_type='application/json')
+                codes.append(response.status_code)
+        finally:
+            connections.close_all()
+        with statuses_lock:
+            statuses.extend(codes)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    after = _product_totals(product_ids, using)
+    succeeded = sum(1 for status in statuses if status == 200)
+    logged = TransferLog.objects.using(using).count() - logs_before
+    negative = Inventory.objects.using(using).filter(quantity__lt=0).count()
+    total_mismatches = sorted(
+        product_id for product_id in before if before[product_id] != after.get(product_id)
+    )
+    stock_total_mismatches = [product_id for product_id, _, _ in stock_totals.verify(using=using)]
+    return {
+        "workers": workers,
+        "attempted": len(statuses),
+        "succeeded": succeeded,
+        "rejected": sum(1 for status in statuses if 400 <= status < 500),
+        "server_errors": sum(1 for status in statuses if status >= 500),
+        "seconds": round(elapsed, 4),
+        "transfers_per_second": round(len(statuses) / elapsed, 1) if elapsed else 0.0,
+        "transfer_logs_written": logged,
+        "negative_rows": negative,
+        "total_mismatches": total_mismatches,
+        "stock_total_mismatches": stock_total_mismatches,
+        "conserved": not total_mismatches and not negative and not stock_total_mismatches,
+    }
+
+
+def hot_row_stress(token, workers, transfers_per_worker, slot_count, seed=0, using=DEFAULT_DB_ALIAS):
+    """
+    Все потоки списывают по единице с одной строки Inventory (самой большой) на
+    случайные другие склады: сначала в обычном режиме, затем с slot_count слотами
+    (warehouses.slots). После прогона строка возвращается в обычный режим.
+    """
+    source = (
+        Inventory.objects.using(using).order_by('-quantity', 'pk')
+        .values_list('pk', 'product_id', 'warehouse_id').first()
+    )
+    if source is None:
+        return None
+    inventory_id, product_id, warehouse_id = source
+    destinations = list(
+        Warehouse.objects.using(using).exclude(pk=warehouse_id).order_by('pk').values_list('pk', flat=True)
+    )
+    if not destinations:
+        return None
+
+    # остатка должно хватить на оба прогона, иначе сравнивались бы отказы
+    needed = 2 * workers * transfers_per_worker
+    Inventory.objects.using(using).filter(pk=inventory_id, available__lt=needed).update(
+        quantity=F('reserved') + needed,
+    )
+
+    def line(rng):
+        return {
+            'product_id': product_id,
+            'from_warehouse_id': warehouse_id,
+            'to_warehouse_id': rng.choice(destinations),
+            'quantity': 1,
+        }
+
+    single = _run_transfers(token, workers, transfers_per_worker, line, [product_id], seed, using)
+    slots.set_slots(inventory_id, slot_count, using)
+    try:
+        sharded = _run_transfers(token, workers, transfers_per_worker, line, [product_id], seed + 1, using)
+        slots.compact(inventory_id, using)
+    finally:
+        slots.set_slots(inventory_id, 0, using)
+    return {
+        "inventory_id": inventory_id,
+        "slots": slot_count,
+        "single_row": single,
+        "sharded": sharded,
+        "speedup": round(sharded["transfers_per_second"] / single["transfers_per_second"], 2)
+        if single["transfers_per_second"] else None,
+    }
+
+
+def _stress_violations(name, stress):
+    violations = []
+    if not stress["conserved"]:
+        violations.append(
+            f"{name}: stock not conserved (products {stress['total_mismatches']}, "
+            f"negative rows {stress['negative_rows']}, totals {stress['stock_total_mismatches']})"
+        )
+    if stress["transfer_logs_written"] != stress["succeeded"]:
+        violations.append(
+            f"{name}: {stress['transfer_logs_written']} TransferLog rows "
+            f"for {stress['succeeded']} successful transfers"
+        )
+    if stress["server_errors"]:
+        violations.append(f"{name}: {stress['server_errors']} server errors")
+    return violations
+
+
+def run_scale(token, repeat=30, requests=200, concurrency=8, stress_workers=8, stress_transfers_per_worker=25,
+              seed=0, hot_row_slots=8, using=DEFAULT_DB_ALIAS):
+    """Прогон всех измерений на уже сгенерированных данных. Возвращает (результаты, нарушения)."""
+    client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+    # as_of отвечается от снимка: сгенерированная история целиком раньше него
+    history.take_snapshot(using)
+    warehouse_id = Inventory.objects.using(using).order_by('warehouse_id').values_list('warehouse_id', flat=True).first()
+    transfer = transfer_candidate(using)
+    resolver = load.api_resolver(router.urls)
+    headers = {'Authorization': f'Token {token}'}
+
+    endpoints, violations = {}, []
+    for name, (method, path, body) in endpoint_requests(warehouse_id, transfer).items():
+        if method == 'post' and body is None:
+            continue
+        queries, status, latency = measure_endpoint(client, method, path, body, repeat, using)
+        result = {"path": path, "status": status, "queries": queries, "query_budget": QUERY_BUDGETS[name],
+                  "latency": latency}
+        if method == 'get':
+            result["load"] = load.run_sync(resolver, [path], requests, concurrency, headers)
+        endpoints[name] = result
+
+        if status >= 400:
+            violations.append(f"{name}: HTTP {status}")
+        if queries > QUERY_BUDGETS[name]:
+            violations.append(f"{name}: {queries} queries, budget {QUERY_BUDGETS[name]}")
+
+    stress = stress_transfers(token, stress_workers, stress_transfers_per_worker, seed=seed, using=using)
+    if stress is not None:
+        violations.extend(_stress_violations("transfer stress", stress))
+
+    hot_row = None
+    if hot_row_slots:
+        hot_row = hot_row_stress(token, stress_workers, stress_transfers_per_worker, hot_row_slots, seed, using)
+    if hot_row is not None:
+        violations.extend(_stress_violations("hot row stress (single row)", hot_row["single_row"]))
+        violations.extend(_stress_violations("hot row stress (sharded)", hot_row["sharded"]))
+    return {"endpoints": endpoints, "stress": stress, "hot_row": hot_row}, violations
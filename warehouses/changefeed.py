@@ -0,0 +1,266 @@
+"""
+Лента изменений остатков для /api/inventory/changes/ (SSE и long-poll).
+
+В каждом процессе один поток-слушатель ждёт уведомления о новых записях
+InventoryLog и одним запросом читает их для всех подписчиков, вместо того
+чтобы каждый клиент опрашивал базу сам. На PostgreSQL это LISTEN на канале
+CHANNEL, в который пишет триггер таблицы журнала (миграция 0013), на других
+СУБД — уведомление внутри процесса из warehouses.audit после записи журнала
+(годится для тестов и разработки в одном процессе). Курсор ленты — id записи
+InventoryLog; после переподключения клиент дочитывает пропущенное из базы.
+
+id выдаются при вставке, а транзакции фиксируются в другом порядке: без
+дополнительных мер запись с меньшим id могла бы стать видимой позже записи
+с большим, и курсор «id > after» её бы перепрыгнул. Поэтому журнал пишется
+только через write_logs(): вставка идёт под блокировкой строки
+ChangeFeedWatermark, и в той же транзакции в неё записывается последний id.
+Записи журнала выдают id и фиксируются по очереди, а лента отдаёт только
+записи не дальше границы — все они уже видны. Цена — записи журнала разных
+транзакций не идут параллельно (они короткие, см. warehouses.audit).
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.db.models import F, Max
+
+from warehouses.models import ChangeFeedWatermark, InventoryLog
+
+logger = logging.getLogger('warehouses.changefeed')
+
+CHANNEL = 'warehouses_inventory_changes'
+FETCH_LIMIT = 1000
+# пачек в очереди подписчика; отстающий подписчик отключается и дочитывает из базы
+QUEUE_SIZE = 100
+
+_hubs = {}
+_hubs_lock = threading.Lock()
+
+
+def backend(using=DEFAULT_DB_ALIAS):
+    configured = getattr(settings, 'CHANGE_FEED_BACKEND', 'auto')
+    if configured == 'auto':
+        return 'postgres' if connections[using].vendor == 'postgresql' else 'local'
+    return configured
+
+
+def poll_interval():
+    # страховочный опрос на случай потерянного уведомления
+    return getattr(settings, 'CHANGE_FEED_POLL_INTERVAL', 5.0)
+
+
+def write_logs(entries, using=DEFAULT_DB_ALIAS):
+    """Вставляет записи InventoryLog и сдвигает границу ленты в одной транзакции."""
+    watermark = ChangeFeedWatermark.objects.using(using).filter(pk=1)
+    with transaction.atomic(using=using):
+        # блокировка до вставки: следующая запись получит id только после фиксации этой.
+        # UPDATE, а не SELECT FOR UPDATE: SQLite сразу берёт блокировку записи, а не
+        # повышает блокировку чтения (это падало бы с «database is locked»)
+        if not watermark.update(last_id=F('last_id')):
+            ChangeFeedWatermark.objects.using(using).get_or_create(pk=1)
+            watermark.select_for_update().get()
+        InventoryLog.objects.using(using).bulk_create(entries)
+        ids = [entry.pk for entry in entries]
+        if None in ids:
+            # СУБД без RETURNING: под блокировкой последняя запись журнала — наша
+            last_id = InventoryLog.objects.using(using).aggregate(latest=Max('id'))['latest']
+        else:
+            last_id = max(ids)
+        watermark.update(last_id=last_id)
+
+
+def _watermark(using):
+    return ChangeFeedWatermark.objects.using(using).filter(pk=1).values('last_id')
+
+
+def latest_id(using=DEFAULT_DB_ALIAS):
+    """Курсор, с которого ждать изменений: граница ленты."""
+    return _watermark(using).values_list('last_id', flat=True).first() or 0
+
+
+def fetch_changes(after, warehouse_ids=None, limit=FETCH_LIMIT, using=DEFAULT_DB_ALIAS):
+    """
+    Строки журнала (id, товар, склад, количество) с id > after по возрастанию
+    id, не дальше границы ленты. Граница читается тем же запросом, что и
+    записи, поэтому всё, что до неё, в выборку попадает.
+    """
+    logs = InventoryLog.objects.using(using).filter(id__gt=after, id__lte=_watermark(using))
+    if warehouse_ids:
+        logs = logs.filter(warehouse_id__in=warehouse_ids)
+    return list(logs.order_by('id').values_list('id', 'product_id', 'warehouse_id', 'quantity')[:limit])
+
+
+class LocalListener:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+        self._event.clear()
+
+    def close(self):
+        pass
+
+
+class PostgresListener:
+    """Отдельное соединение вне пула Django, которое только слушает канал."""
+
+    def __init__(self, using):
+        wrapper = connections[using]
+        self.connection = wrapper.Database.connect(**wrapper.get_connection_params(), autocommit=True)
+        self.connection.execute(f'LISTEN {CHANNEL}')
+
+    def wait(self, timeout):
+        for _ in self.connection.notifies(timeout=timeout, stop_after=1):
+            pass
+
+    def close(self):
+        self.connection.close()
+
+
+class Subscription:
+    __slots__ = ('warehouse_ids', 'loop', 'queue', 'overflowed')
+
+    def __init__(self, warehouse_ids, loop):
+        self.warehouse_ids = frozenset(warehouse_ids or ())
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def _put(self, rows):
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def deliver(self, rows):
+        if self.warehouse_ids:
+            rows = [row for row in rows if row[2] in self.warehouse_ids]
+        if rows:
+            try:
+                self.loop.call_soon_threadsafe(self._put, rows)
+            except RuntimeError:
+                # цикл событий уже закрыт: подписчик вот-вот отпишется
+                pass
+
+    async def get(self, timeout):
+        """Следующая пачка строк или None по таймауту."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+
+class ChangeHub:
+    """Поток-слушатель одного алиаса базы; работает, пока есть подписчики."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.cursor = 0
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._listener = None
+        self._thread = None
+
+    async def subscribe(self, warehouse_ids=None):
+        subscription = Subscription(warehouse_ids, asyncio.get_running_loop())
+        await sync_to_async(self._add)(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def notify(self):
+        listener = self._listener
+        if isinstance(listener, LocalListener):
+            listener.notify()
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self._thread is not None:
+                return
+            # курсор берётся до того, как подписчик дочитает пропущенное, поэтому разрыва нет
+            self.cursor = latest_id(self.using)
+            self._listener = self._connect()
+            self._thread = threading.Thread(target=self._run, name=f'changefeed-{self.using}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    self._listener.wait(poll_interval())
+                    with self._lock:
+                        if not self._subscriptions:
+                            # непрочитанные уведомления держали бы очередь NOTIFY на сервере
+                            self._listener.close()
+                            self._listener = None
+                            self._thread = None
+                            return
+                    self._publish()
+                except Exception:
+                    logger.exception("Change feed listener failed, reconnecting")
+                    self._reconnect()
+        finally:
+            close_old_connections()
+
+    def _reconnect(self):
+        close_old_connections()
+        time.sleep(1)
+        with self._lock:
+            self._listener.close()
+            self._listener = self._connect()
+
+    def _connect(self):
+        if backend(self.using) == 'postgres':
+            return PostgresListener(self.using)
+        return LocalListener()
+
+    def _publish(self):
+        while True:
+            rows = fetch_changes(self.cursor, using=self.using)
+            if not rows:
+                break
+            self.cursor = rows[-1][0]
+            with self._lock:
+                subscriptions = list(self._subscriptions)
+            for subscription in subscriptions:
+                subscription.deliver(rows)
+            if len(rows) < FETCH_LIMIT:
+                break
+        # соединение потока не держится между уведомлениями (и возвращается в пул)
+        close_old_connections()
+
+
+def get_hub(using=DEFAULT_DB_ALIAS):
+    with _hubs_lock:
+        if using not in _hubs:
+            _hubs[using] = ChangeHub(using)
+        return _hubs[using]
+
+
+def notify_local(using=DEFAULT_DB_ALIAS):
+    """Будит слушателя процесса после записи журнала (на PostgreSQL уведомляет триггер)."""
+    hub = _hubs.get(using)
+    if hub is not None:
+        hub.notify()
+
+
+def coalesce(rows):
+    """Последнее количество по каждой паре (товар, склад) из пачки строк журнала."""
+    latest = {}
+    for _, product_id, warehouse_id, quantity in rows:
+        latest[product_id, warehouse_id] = quantity
+    return [
+        {"product_id": product_id, "warehouse_id": warehouse_id, "quantity": quantity}
+        for (product_id, warehouse_id), quantity in latest.items()
+    ]
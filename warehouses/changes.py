@@ -0,0 +1,16 @@
+from collections import namedtuple
+
+from django.dispatch import Signal
+
+# Одно изменение остатка. Для записей журнала нужны только id внешних ключей,
+# поэтому связанные Product/Warehouse никогда не загружаются.
+# previous — количество до изменения (0 для 'add'), None если путь записи его не знает.
+InventoryChange = namedtuple(
+    'InventoryChange',
+    ['product_id', 'warehouse_id', 'quantity', 'operation', 'previous'],
+    defaults=(None,),
+)
+
+# Отправляется всеми путями записи Inventory (save/delete, bulk_create, bulk_update,
+# QuerySet.update, пакетные перемещения) с аргументами changes=[InventoryChange] и using=<alias>.
+inventory_changed = Signal()
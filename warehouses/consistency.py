@@ -0,0 +1,205 @@
+"""
+Сверка остатков с журналами (manage.py verify_inventory).
+
+Для каждой пары (склад, товар) сравниваются:
+
+- Inventory — текущее количество (у шардированных строк вместе со слотами);
+- InventoryLog — последняя запись пары, а если её записи уже свёрнуты
+  (manage_log_partitions), закрытие последнего дня в InventoryLogRollup;
+- TransferLog — время последнего перемещения на склад пары или с него.
+
+Каждый источник читается серверным курсором в порядке (склад, товар), и
+потоки сливаются за один проход (heapq.merge): в памяти только записи
+текущей пары, объём памяти не зависит от размера таблиц. На PostgreSQL
+проход идёт в транзакции REPEATABLE READ, поэтому все курсоры видят один
+снимок базы. Проверку можно разбить по диапазонам id складов и проверять
+диапазоны параллельно.
+
+Расхождения (Discrepancy.kind):
+
+- quantity — количество строки не совпадает с последним в журнале;
+- unlogged_row — строка есть, а в журнале её нет или она удалена;
+- missing_row — по журналу строка есть, а в Inventory её нет;
+- unlogged_transfer — перемещение по паре записано позже последней записи
+  журнала: TransferLog есть, а журнал остатков его не отразил.
+
+Источник истины — Inventory. repair() не меняет остатки, а дописывает в
+журнал запись с текущим состоянием пары, как compact_inventory_slots.
+"""
+import heapq
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from warehouses import audit
+from warehouses.changes import InventoryChange
+from warehouses.models import Inventory, InventoryLog, InventoryLogRollup, TransferLog, Warehouse, live_quantity
+from warehouses.transfers import _pairs_filter
+
+# quantity — количество в Inventory (None — строки нет), logged — по журналу (None — строки нет),
+# transferred_at и logged_at — время последнего перемещения и последней записи журнала
+Discrepancy = namedtuple(
+    'Discrepancy',
+    ['warehouse_id', 'product_id', 'kind', 'quantity', 'logged', 'transferred_at', 'logged_at'],
+)
+
+# метки потоков; при равной паре heapq.merge упорядочивает по ним
+INVENTORY, LOG, ROLLUP, INBOUND, OUTBOUND = range(5)
+# столько пар исправляется одной транзакцией
+REPAIR_BATCH_SIZE = 500
+
+
+def warehouse_ranges(parts, using=DEFAULT_DB_ALIAS):
+    """Делит id складов на не больше parts диапазонов (первый, последний) с равным числом складов."""
+    warehouse_ids = list(Warehouse.objects.using(using).order_by('pk').values_list('pk', flat=True))
+    size = max(1, -(-len(warehouse_ids) // max(parts, 1)))
+    return [
+        (warehouse_ids[start], warehouse_ids[min(start + size, len(warehouse_ids)) - 1])
+        for start in range(0, len(warehouse_ids), size)
+    ]
+
+
+def _last_per_pair(rows):
+    # строки упорядочены по паре, затем по времени: от каждой пары остаётся последняя
+    for pair, entries in groupby(rows, key=lambda row: row[:2]):
+        *_, last = entries
+        yield pair, last[2:]
+
+
+def _tagged(tag, items):
+    for pair, state in items:
+        yield pair, tag, state
+
+
+def _streams(warehouse_range, chunk_size, using):
+    def scoped(queryset, field):
+        if warehouse_range is None:
+            return queryset
+        first, last = warehouse_range
+        return queryset.filter(**{f'{field}__gte': first, f'{field}__lte': last})
+
+    def stream(queryset):
+        return (((first, second), value) for first, second, value in queryset.iterator(chunk_size=chunk_size))
+
+    inventory = scoped(Inventory.objects.using(using), 'warehouse_id').order_by(
+        'warehouse_id', 'product_id',
+    ).values_list('warehouse_id', 'product_id', live_quantity())
+    logs = scoped(InventoryLog.objects.using(using), 'warehouse_id').order_by(
+        'warehouse_id', 'product_id', 'created_at', 'id',
+    ).values_list('warehouse_id', 'product_id', 'quantity', 'operation', 'created_at')
+    rollups = scoped(InventoryLogRollup.objects.using(using), 'warehouse_id').order_by(
+        'warehouse_id', 'product_id', 'day',
+    ).values_list('warehouse_id', 'product_id', 'closing_quantity', 'day')
+    inbound, outbound = (
+        scoped(TransferLog.objects.using(using), field).values_list(field, 'product_id')
+        .annotate(last=Max('timestamp')).order_by(field, 'product_id')
+        for field in ('to_warehouse_id', 'from_warehouse_id')
+    )
+    return [
+        _tagged(INVENTORY, stream(inventory)),
+        _tagged(LOG, _last_per_pair(logs.iterator(chunk_size=chunk_size))),
+        _tagged(ROLLUP, _last_per_pair(rollups.iterator(chunk_size=chunk_size))),
+        _tagged(INBOUND, stream(inbound)),
+        _tagged(OUTBOUND, stream(outbound)),
+    ]
+
+
+def _check(pair, states):
+    """Discrepancy для пары или None."""
+    quantity = states.get(INVENTORY)
+    # present: есть ли строка по журналу; None — не известно (сводка с закрытием 0)
+    logged, logged_at, present = None, None, False
+    if LOG in states:
+        logged, operation, logged_at = states[LOG]
+        present = operation != 'remove'
+    elif ROLLUP in states:
+        logged, day = states[ROLLUP]
+        logged_at = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        present = True if logged else None
+    transferred = [states[tag] for tag in (INBOUND, OUTBOUND) if tag in states]
+    transferred_at = max(transferred) if transferred else None
+
+    kind = None
+    if quantity is not None:
+        if present is False:
+            kind = 'unlogged_row'
+        elif logged != quantity:
+            kind = 'quantity'
+    elif present:
+        kind = 'missing_row'
+    if kind is None and transferred_at is not None and (logged_at is None or transferred_at > logged_at):
+        kind = 'unlogged_transfer'
+    if kind is None:
+        return None
+    return Discrepancy(
+        pair[0], pair[1], kind, quantity, logged if present is not False else None, transferred_at, logged_at,
+    )
+
+
+def verify(warehouse_range=None, chunk_size=2000, using=DEFAULT_DB_ALIAS):
+    """
+    Генератор расхождений по парам складов из warehouse_range (первый, последний
+    id включительно; None — все склады) в порядке (склад, товар).
+    """
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        merged = heapq.merge(*_streams(warehouse_range, chunk_size, using))
+        for pair, items in groupby(merged, key=lambda item: item[0]):
+            discrepancy = _check(pair, {tag: state for _, tag, state in items})
+            if discrepancy is not None:
+                yield discrepancy
+
+
+def repair(discrepancies, using=DEFAULT_DB_ALIAS):
+    """
+    Дописывает в журнал запись с текущим состоянием каждой пары из discrepancies:
+    количество строки или 'remove', если строки нет. Строки блокируются до записи,
+    поэтому параллельное перемещение не окажется между чтением и записью.
+    Возвращает число записей.
+    """
+    pairs = sorted({(item.product_id, item.warehouse_id) for item in discrepancies})
+    written = 0
+    for start in range(0, len(pairs), REPAIR_BATCH_SIZE):
+        batch = pairs[start:start + REPAIR_BATCH_SIZE]
+        with transaction.atomic(using=using):
+            rows = Inventory.objects.using(using).filter(_pairs_filter(batch))
+            list(rows.select_for_update().order_by('pk').values_list('pk', flat=True))
+            current = {
+                (product_id, warehouse_id): quantity
+                for product_id, warehouse_id, quantity in rows.values_list('product_id', 'warehouse_id', live_quantity())
+            }
+            # только журнал: остатки и итоги не меняются, поэтому без inventory_changed
+            audit.record(
+                [
+                    InventoryChange(product_id, warehouse_id, current[product_id, warehouse_id], 'update')
+                    if (product_id, warehouse_id) in current
+                    else InventoryChange(product_id, warehouse_id, 0, 'remove')
+                    for product_id, warehouse_id in batch
+                ],
+                using=using,
+            )
+        written += len(batch)
+    return written
+
+
+def check_range(task):
+    """Задача пула verify_inventory: (диапазон, исправлять ли, chunk_size, база) -> (расхождения, записано)."""
+    warehouse_range, fix, chunk_size, using = task
+    found = list(verify(warehouse_range, chunk_size, using))
+    return found, repair(found, using) if fix else 0
+
+
+def worker_init():
+    """Инициализатор процесса пула verify_inventory."""
+    import django
+    django.setup()
+    # соединения родителя в дочернем процессе не используются
+    for connection in connections.all(initialized_only=True):
+        connection.close()
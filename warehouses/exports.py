@@ -0,0 +1,87 @@
+import csv
+import zlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+INVENTORY_CSV_HEADER = ['product', 'name', 'sku', 'quantity']
+INVENTORY_CSV_FIELDS = ('product_id', 'product__name', 'product__sku', 'live_quantity')
+INVENTORY_LOG_CSV_HEADER = ['id', 'created_at', 'product', 'warehouse', 'operation', 'quantity']
+INVENTORY_LOG_CSV_FIELDS = ('id', 'created_at', 'product_id', 'warehouse_id', 'operation', 'quantity')
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: writerow() сразу возвращает готовую строку."""
+
+    def write(self, value):
+        return value
+
+
+def export_chunk_size():
+    return getattr(settings, 'INVENTORY_EXPORT_CHUNK_SIZE', 2000)
+
+
+def csv_rows(header, rows, chunk_size=None):
+    """Генератор CSV-текста, склеенного в блоки по chunk_size строк."""
+    chunk_size = chunk_size or export_chunk_size()
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer.clear()
+    if buffer:
+        yield ''.join(buffer)
+
+
+def filter_inventory(inventories, warehouse_ids=None, skus=None):
+    """Фильтры выгрузки остатков (?warehouse=1,2&sku=A,B)."""
+    if warehouse_ids:
+        inventories = inventories.filter(warehouse_id__in=warehouse_ids)
+    if skus:
+        inventories = inventories.filter(product__sku__in=skus)
+    return inventories
+
+
+def inventory_csv_values(inventories, chunk_size=None):
+    # values_list + iterator(): без создания моделей и с серверным курсором на PostgreSQL
+    return inventories.with_slot_totals().values_list(*INVENTORY_CSV_FIELDS).iterator(chunk_size=chunk_size or export_chunk_size())
+
+
+def inventory_csv_rows(inventories, chunk_size=None):
+    return csv_rows(INVENTORY_CSV_HEADER, inventory_csv_values(inventories, chunk_size), chunk_size)
+
+
+def inventory_log_csv_values(logs, chunk_size=None):
+    rows = logs.order_by('id').values_list(*INVENTORY_LOG_CSV_FIELDS).iterator(
+        chunk_size=chunk_size or export_chunk_size()
+    )
+    for pk, created_at, product_id, warehouse_id, operation, quantity in rows:
+        yield pk, created_at.isoformat(), product_id, warehouse_id, operation, quantity
+
+
+def gzip_stream(chunks, charset='utf-8'):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)  # 16 -> формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(charset))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(prefix):
+    return f'{prefix}_{datetime.now(timezone.utc).date().strftime("%d_%m_%Y")}.csv'
+
+
+def csv_streaming_response(chunks, filename, compress=False):
+    if compress:
+        response = StreamingHttpResponse(gzip_stream(chunks), content_type='application/gzip')
+        filename = f'{filename}.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
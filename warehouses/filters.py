@@ -0,0 +1,45 @@
+import django_filters
+
+from warehouses.models import InventoryLog, InventoryLogRollup, TransferLog
+
+
+class InventoryLogFilter(django_filters.FilterSet):
+    start_date = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    end_date = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lte')
+
+    class Meta:
+        model = InventoryLog
+        fields = ['product', 'warehouse', 'operation']
+
+
+class InventoryLogRollupFilter(django_filters.FilterSet):
+    # те же параметры, что у InventoryLogFilter, но сводки хранятся по дням
+    start_date = django_filters.IsoDateTimeFilter(method='filter_start_date')
+    end_date = django_filters.IsoDateTimeFilter(method='filter_end_date')
+
+    class Meta:
+        model = InventoryLogRollup
+        fields = ['product', 'warehouse']
+
+    def filter_cleaned(self, cleaned_data):
+        """Сводки по параметрам, уже проверенным InventoryLogFilter: товар и склад не загружаются повторно."""
+        queryset = self.queryset.all()
+        for name, value in cleaned_data.items():
+            if name in self.filters:
+                queryset = self.filters[name].filter(queryset, value)
+        return queryset
+
+    def filter_start_date(self, queryset, name, value):
+        return queryset.filter(day__gte=value.date())
+
+    def filter_end_date(self, queryset, name, value):
+        return queryset.filter(day__lte=value.date())
+
+
+class TransferLogFilter(django_filters.FilterSet):
+    start_date = django_filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    end_date = django_filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='lte')
+
+    class Meta:
+        model = TransferLog
+        fields = ['product', 'from_warehouse', 'to_warehouse']
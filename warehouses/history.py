@@ -0,0 +1,185 @@
+"""
+Остатки на момент времени (параметр ?as_of=).
+
+Основа — ближайший не более поздний полный снимок InventorySnapshot, поверх
+него применяется последняя запись InventoryLog по каждой паре (товар, склад)
+между снимком и as_of. В журнале хранится количество после изменения, а не
+приращение, поэтому повторное применение записи, уже вошедшей в снимок,
+ничего не портит. Объём работы зависит от числа изменений после снимка, а не
+от длины истории. До первого снимка остатки восстанавливаются по всему журналу.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Max, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from warehouses import queries
+from warehouses.models import Inventory, InventoryLog, InventorySlot, InventorySnapshot, Product, StockReservation
+
+
+def parse_as_of(value):
+    """ISO 8601 дата (остатки на конец дня) или дата-время; ValueError, если не разобрать."""
+    # сначала дата: parse_datetime принимает и голую дату, как полночь
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day, time.max)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def take_snapshot(using=DEFAULT_DB_ALIAS):
+    """Копирует Inventory в InventorySnapshot одним INSERT ... SELECT; возвращает (taken_at, число строк)."""
+    taken_at = timezone.now()
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote_name(InventorySnapshot._meta.db_table)} "
+            f"(taken_at, product_id, warehouse_id, quantity) "
+            # количество шардированной строки — вместе с её слотами
+            f"SELECT %s, inventory.product_id, inventory.warehouse_id, inventory.quantity + COALESCE(("
+            f"SELECT SUM(slot.quantity) FROM {quote_name(InventorySlot._meta.db_table)} slot "
+            f"WHERE slot.inventory_id = inventory.id), 0) "
+            f"FROM {quote_name(Inventory._meta.db_table)} inventory",
+            [connection.ops.adapt_datetimefield_value(taken_at)],
+        )
+        rows = cursor.rowcount
+    return taken_at, rows
+
+
+def prune_snapshots(before, using=DEFAULT_DB_ALIAS):
+    return InventorySnapshot.objects.using(using).filter(taken_at__lt=before).delete()[0]
+
+
+def nearest_snapshot(as_of, using=DEFAULT_DB_ALIAS):
+    return InventorySnapshot.objects.using(using).filter(taken_at__lte=as_of).aggregate(
+        taken_at=Max('taken_at')
+    )['taken_at']
+
+
+def latest_changes(as_of, since=None, using=DEFAULT_DB_ALIAS, **filters):
+    """(товар, склад, количество, операция) последней записи журнала по паре в интервале (since, as_of]."""
+    logs = InventoryLog.objects.using(using).filter(created_at__lte=as_of, **filters)
+    if since is not None:
+        logs = logs.filter(created_at__gt=since)
+    return logs.annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F('product_id'), F('warehouse_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )
+    ).filter(rank=1).values_list('product_id', 'warehouse_id', 'quantity', 'operation')
+
+
+def warehouse_quantities(warehouse_id, as_of, product_ids=None, using=DEFAULT_DB_ALIAS):
+    """{товар: количество} на складе на момент as_of."""
+    filters = {'warehouse_id': warehouse_id}
+    if product_ids is not None:
+        filters['product_id__in'] = product_ids
+
+    taken_at = nearest_snapshot(as_of, using)
+    quantities = {}
+    if taken_at is not None:
+        quantities = dict(
+            InventorySnapshot.objects.using(using).filter(taken_at=taken_at, **filters)
+            .values_list('product_id', 'quantity')
+        )
+    for product_id, _, quantity, operation in latest_changes(as_of, taken_at, using, **filters):
+        if operation == 'remove':
+            quantities.pop(product_id, None)
+        else:
+            quantities[product_id] = quantity
+    return quantities
+
+
+def reserved_quantities(warehouse_id, as_of, product_ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    {товар: зарезервировано} на складе на момент as_of. Резервы не удаляются,
+    поэтому Inventory.reserved восстанавливается точно: резерв держал товар
+    с created_at до closed_at (подтверждение, снятие или снятие просроченного).
+    """
+    reservations = StockReservation.objects.using(using).filter(
+        Q(closed_at__isnull=True) | Q(closed_at__gt=as_of), warehouse_id=warehouse_id, created_at__lte=as_of,
+    )
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    return dict(reservations.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+
+
+def warehouse_inventory(warehouse_id, as_of, product_ids=None, using=DEFAULT_DB_ALIAS):
+    """Строки выдачи склада на момент as_of (те же поля, что у живой выдачи), по возрастанию product_id."""
+    quantities = warehouse_quantities(warehouse_id, as_of, product_ids, using)
+    reserved = reserved_quantities(warehouse_id, as_of, product_ids, using) if quantities else {}
+    products = Product.objects.using(using).filter(pk__in=quantities).values_list('pk', 'name', 'sku')
+    return [
+        queries.inventory_listing_row(
+            (product_id, name, sku, quantities[product_id], quantities[product_id] - reserved.get(product_id, 0))
+        )
+        for product_id, name, sku in sorted(products)
+    ]
+
+
+def product_totals(as_of, using=DEFAULT_DB_ALIAS):
+    """{товар: (сумма остатков, число строк Inventory)} на момент as_of."""
+    taken_at = nearest_snapshot(as_of, using)
+    totals = defaultdict(lambda: [0, 0])
+    if taken_at is not None:
+        aggregated = (
+            InventorySnapshot.objects.using(using).filter(taken_at=taken_at)
+            .values('product_id').annotate(total=Sum('quantity'), rows=Count('id'))
+            .values_list('product_id', 'total', 'rows')
+        )
+        for product_id, total, rows in aggregated:
+            totals[product_id] = [total, rows]
+
+    changes = list(latest_changes(as_of, taken_at, using))
+    previous = {}
+    if changes and taken_at is not None:
+        previous = {
+            (product_id, warehouse_id): quantity
+            for product_id, warehouse_id, quantity in InventorySnapshot.objects.using(using).filter(
+                taken_at=taken_at, product_id__in={change[0] for change in changes},
+            ).values_list('product_id', 'warehouse_id', 'quantity')
+        }
+    for product_id, warehouse_id, quantity, operation in changes:
+        before = previous.get((product_id, warehouse_id))
+        total = totals[product_id]
+        total[0] += (0 if operation == 'remove' else quantity) - (before or 0)
+        total[1] += (0 if operation == 'remove' else 1) - (0 if before is None else 1)
+    return totals
+
+
+def stock_summary(params, as_of, using=DEFAULT_DB_ALIAS):
+    """
+    Итоги по товарам на момент as_of с фильтрами stock_summary (sku_prefix,
+    min_total, max_total), по возрастанию product_id; ValueError при нецелых границах.
+    """
+    min_total = params.get('min_total')
+    min_total = int(min_total) if min_total is not None else None
+    max_total = params.get('max_total')
+    max_total = int(max_total) if max_total is not None else None
+
+    totals = {
+        product_id: total
+        for product_id, (total, rows) in product_totals(as_of, using).items()
+        if rows > 0
+        and (min_total is None or total >= min_total)
+        and (max_total is None or total <= max_total)
+    }
+    products = Product.objects.using(using).filter(pk__in=totals)
+    sku_prefix = params.get('sku_prefix')
+    if sku_prefix:
+        products = products.filter(sku__startswith=sku_prefix)
+    return [
+        {"product_id": product_id, "name": name, "sku": sku, "total_quantity": totals[product_id]}
+        for product_id, name, sku in sorted(products.values_list('pk', 'name', 'sku'))
+    ]
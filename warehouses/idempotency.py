@@ -0,0 +1,121 @@
+"""
+Поддержка заголовка Idempotency-Key для изменяющих эндпоинтов.
+
+Ответ сохраняется в IdempotencyKey в той же транзакции, что и сама операция,
+поэтому ключ без ответа никогда не виден другим запросам. Если два запроса с
+одним ключом выполняются одновременно, вставка второго упирается в уникальный
+индекс: его транзакция откатывается, и он возвращает ответ первого.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from warehouses.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class _KeyTaken(Exception):
+    pass
+
+
+def key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def request_hash(data):
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _stored(user, scope, key):
+    record = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+    if record is not None and record.expires_at <= timezone.now():
+        # просроченный ключ ещё не удалён очисткой: считаем его свободным
+        record.delete()
+        return None
+    return record
+
+
+def _replay(record, fingerprint):
+    if record.request_hash != fingerprint:
+        return Response(
+            {"error": "Idempotency-Key was already used with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def run(request, scope, handler):
+    """
+    Выполняет handler() -> (status, body) в транзакции и возвращает Response.
+
+    С заголовком Idempotency-Key операция выполняется не больше одного раза на
+    (пользователь, scope, ключ) в течение IDEMPOTENCY_KEY_TTL; ответы 5xx не
+    сохраняются, чтобы повтор мог выполниться заново.
+    """
+    key = request.headers.get(HEADER)
+    if key is None:
+        with transaction.atomic():
+            response_status, body = handler()
+        return Response(body, status=response_status)
+
+    if not key.strip() or len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"error": f"{HEADER} must be 1-{MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    fingerprint = request_hash(request.data)
+    try:
+        with transaction.atomic():
+            record = _stored(request.user, scope, key)
+            if record is not None:
+                return _replay(record, fingerprint)
+
+            response_status, body = handler()
+            if response_status < 500:
+                try:
+                    with transaction.atomic():
+                        IdempotencyKey.objects.create(
+                            user=request.user,
+                            scope=scope,
+                            key=key,
+                            request_hash=fingerprint,
+                            response_status=response_status,
+                            response_body=body,
+                            expires_at=timezone.now() + key_ttl(),
+                        )
+                except IntegrityError:
+                    # параллельный запрос с тем же ключом успел первым: откатываем свою операцию
+                    raise _KeyTaken
+    except _KeyTaken:
+        record = _stored(request.user, scope, key)
+        if record is None:
+            return Response(
+                {"error": f"A request with this {HEADER} is still in progress."},
+                status=status.HTTP_409_CONFLICT
+            )
+        return _replay(record, fingerprint)
+    return Response(body, status=response_status)
+
+
+def purge_expired(batch_size=10000, using=None):
+    """Удаляет просроченные ключи пачками; возвращает число удалённых."""
+    queryset = IdempotencyKey.objects.using(using).filter(expires_at__lte=timezone.now())
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.using(using).filter(pk__in=pks).delete()[0]
@@ -0,0 +1,112 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from warehouses.models import Warehouse, Product, Inventory
+
+
+def import_chunk_size():
+    return getattr(settings, 'INVENTORY_IMPORT_CHUNK_SIZE', 5000)
+
+
+class ImportResult:
+    def __init__(self, max_errors=1000):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, row, error):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "error": error})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+
+def _clean_row(row):
+    if not isinstance(row, dict):
+        raise ValueError("Malformed row.")
+
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise ValueError("Missing sku.")
+    try:
+        warehouse_id = int(row.get('warehouse_id') or row.get('warehouse'))
+    except (TypeError, ValueError):
+        raise ValueError("warehouse_id must be an integer.")
+    try:
+        quantity = int(row.get('quantity'))
+    except (TypeError, ValueError):
+        raise ValueError("Quantity must be an integer.")
+    if quantity < 0:
+        raise ValueError("Quantity must not be negative.")
+    return sku, warehouse_id, quantity
+
+
+def _import_chunk(chunk, result, using):
+    cleaned = []
+    for number, row in chunk:
+        try:
+            cleaned.append((number, *_clean_row(row)))
+        except ValueError as exc:
+            result.add_error(number, str(exc))
+    if not cleaned:
+        return
+
+    # один запрос на чанк для SKU и один для складов
+    product_ids = dict(
+        Product.objects.using(using)
+        .filter(sku__in={sku for _, sku, _, _ in cleaned})
+        .values_list('sku', 'id')
+    )
+    warehouse_ids = set(
+        Warehouse.objects.using(using)
+        .filter(pk__in={warehouse_id for _, _, warehouse_id, _ in cleaned})
+        .values_list('pk', flat=True)
+    )
+
+    # повтор пары внутри чанка: побеждает последняя строка (ON CONFLICT не обновляет строку дважды)
+    objs = {}
+    for number, sku, warehouse_id, quantity in cleaned:
+        if sku not in product_ids:
+            result.add_error(number, "No such product.")
+        elif warehouse_id not in warehouse_ids:
+            result.add_error(number, "No such warehouse.")
+        else:
+            product_id = product_ids[sku]
+            objs[product_id, warehouse_id] = Inventory(
+                product_id=product_id, warehouse_id=warehouse_id, quantity=quantity
+            )
+    if not objs:
+        return
+
+    with transaction.atomic(using=using):
+        created, updated = Inventory.objects.using(using).upsert(objs.values())
+    result.created += created
+    result.updated += updated
+
+
+def import_inventory(rows, chunk_size=None, max_errors=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Загружает остатки из итерируемого набора словарей {sku, warehouse_id, quantity}
+    пачками по chunk_size. Каждая пачка — отдельная транзакция; ошибочные строки
+    (нумерация с 1) попадают в result.errors и не прерывают загрузку.
+    """
+    chunk_size = chunk_size or import_chunk_size()
+    result = ImportResult(max_errors=max_errors)
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, result, using)
+    return result
@@ -0,0 +1,84 @@
+"""
+Кэш выдачи warehouses/{id}/inventory поверх фреймворка кэширования Django.
+
+Ключ включает номер версии склада; любые записи остатков склада увеличивают
+версию после фиксации транзакции, так что старые записи кэша просто перестают
+читаться и вытесняются по таймауту.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_timeout():
+    return getattr(settings, 'INVENTORY_CACHE_TIMEOUT', 300)
+
+
+def _version_key(warehouse_id):
+    return f'inventory:warehouse:{warehouse_id}:version'
+
+
+def _initial_version():
+    # после вытеснения счётчика версия не должна совпасть с уже закэшированной
+    return time.time_ns() // 1000
+
+
+def warehouse_version(warehouse_id):
+    key = _version_key(warehouse_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def awarehouse_version(warehouse_id):
+    key = _version_key(warehouse_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_warehouses(warehouse_ids):
+    for warehouse_id in set(warehouse_ids):
+        key = _version_key(warehouse_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+    count('invalidations', len(set(warehouse_ids)))
+
+
+def listing_key(warehouse_id, version, params):
+    digest = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+    return f'inventory:warehouse:{warehouse_id}:v{version}:{digest}'
+
+
+def etag_for(key):
+    return f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
@@ -0,0 +1,262 @@
+"""
+Фоновые выгрузки CSV (ExportJob) без брокера сообщений.
+
+Очередь — сама таблица ExportJob: исполнитель (manage.py run_export_jobs)
+забирает самое старое задание через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+несколько процессов не берут одно задание и не ждут блокировок друг друга.
+Строки читаются серверным курсором блоками по INVENTORY_EXPORT_CHUNK_SIZE и
+сразу сжимаются в gzip во временный файл, который по готовности
+переименовывается: в EXPORT_JOBS_DIR лежат только целые файлы. Колонки те же,
+что у синхронных выгрузок (warehouses.exports).
+
+Пока идёт выгрузка, отдельный поток исполнителя обновляет heartbeat_at раз в
+HEARTBEAT_INTERVAL, даже если выгрузка надолго встала в запросе или записи
+файла. Задание без пульса
+дольше EXPORT_JOB_TIMEOUT (исполнитель упал) возвращается в очередь, после
+EXPORT_JOB_MAX_ATTEMPTS попыток — помечается ошибкой. Каждая попытка пишет
+свой файл и завершает задание условным UPDATE по номеру попытки, поэтому
+зависший исполнитель не перезапишет результат следующей попытки.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from warehouses import routing
+from warehouses.exports import INVENTORY_CSV_HEADER, INVENTORY_LOG_CSV_HEADER, csv_rows, export_filename, \
+    filter_inventory, gzip_stream, inventory_csv_values, inventory_log_csv_values
+from warehouses.filters import InventoryLogFilter
+from warehouses.models import ExportJob, Inventory, InventoryLog
+
+logger = logging.getLogger('warehouses.jobs')
+
+# пульс пишется раз в столько секунд
+HEARTBEAT_INTERVAL = 10
+# просроченные файлы удаляются не чаще, чем раз в столько секунд
+PURGE_INTERVAL = 60 * 60
+
+
+class JobLost(Exception):
+    """Задание вернули в очередь или забрал другой исполнитель, пока эта попытка работала."""
+
+
+def jobs_dir():
+    return Path(getattr(settings, 'EXPORT_JOBS_DIR', settings.BASE_DIR / 'var' / 'exports'))
+
+
+def job_timeout():
+    return timedelta(seconds=getattr(settings, 'EXPORT_JOB_TIMEOUT', 10 * 60))
+
+
+def max_attempts():
+    return getattr(settings, 'EXPORT_JOB_MAX_ATTEMPTS', 3)
+
+
+def job_ttl():
+    return timedelta(seconds=getattr(settings, 'EXPORT_JOB_TTL', 24 * 60 * 60))
+
+
+def log_filterset(params, using=DEFAULT_DB_ALIAS):
+    return InventoryLogFilter(params, queryset=InventoryLog.objects.using(using).all())
+
+
+def validate_params(kind, params):
+    """Ошибки параметров задания (словарь, как у сериализатора) или None."""
+    if kind == ExportJob.INVENTORY_LOGS:
+        filterset = log_filterset(params)
+        return None if filterset.is_valid() else filterset.errors
+    return None
+
+
+def artifact_path(job):
+    return jobs_dir() / job.artifact
+
+
+def download_filename(job):
+    prefix = 'warehouses_inventory' if job.kind == ExportJob.INVENTORY else 'inventory_logs'
+    return f'{export_filename(prefix)}.gz'
+
+
+def job_rows(job, using):
+    """(заголовок CSV, итератор строк) для задания."""
+    if job.kind == ExportJob.INVENTORY:
+        inventories = filter_inventory(
+            Inventory.objects.using(using).all(), job.params.get('warehouse'), job.params.get('sku'),
+        )
+        return INVENTORY_CSV_HEADER, inventory_csv_values(inventories)
+    return INVENTORY_LOG_CSV_HEADER, inventory_log_csv_values(log_filterset(job.params, using).qs)
+
+
+def requeue_stale(using=DEFAULT_DB_ALIAS):
+    """Возвращает в очередь задания исполнителей, переставших слать пульс; исчерпавшие попытки — в failed."""
+    now = timezone.now()
+    stale = ExportJob.objects.using(using).filter(status=ExportJob.RUNNING, heartbeat_at__lt=now - job_timeout())
+    stale.filter(attempts__gte=max_attempts()).update(
+        status=ExportJob.FAILED, error="Worker stopped responding.", finished_at=now,
+    )
+    return stale.filter(attempts__lt=max_attempts()).update(status=ExportJob.QUEUED)
+
+
+def claim(using=DEFAULT_DB_ALIAS):
+    """Забирает самое старое задание из очереди или возвращает None."""
+    with transaction.atomic(using=using):
+        job = (
+            ExportJob.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(status=ExportJob.QUEUED)
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ExportJob.RUNNING
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at'])
+    return job
+
+
+def _attempt(job, using):
+    # только эта попытка: после возврата в очередь номер попытки изменится
+    return ExportJob.objects.using(using).filter(pk=job.pk, status=ExportJob.RUNNING, attempts=job.attempts)
+
+
+class Heartbeat:
+    """
+    Поток пульса попытки на время выгрузки, со своим соединением с базой.
+    lost — попытку вернули в очередь или забрал другой исполнитель.
+    """
+
+    def __init__(self, job, using=DEFAULT_DB_ALIAS):
+        self.job = job
+        self.using = using
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'export-job-{job.pk}-heartbeat', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(HEARTBEAT_INTERVAL):
+                try:
+                    if not _attempt(self.job, self.using).update(heartbeat_at=timezone.now()):
+                        self.lost = True
+                        return
+                except DatabaseError:
+                    # пропущенный пульс не страшен: в очередь задание вернётся только после EXPORT_JOB_TIMEOUT
+                    logger.warning("Export job %s heartbeat failed", self.job.pk, exc_info=True)
+                    close_old_connections()
+        finally:
+            # соединения этого потока
+            connections.close_all()
+
+
+def run(job, using=DEFAULT_DB_ALIAS):
+    """Выполняет забранное задание: пишет файл и помечает задание done или failed."""
+    directory = jobs_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{job.kind}-{job.pk}-{job.attempts}.csv.gz'
+    partial = directory / f'{name}.part'
+
+    try:
+        header, rows = job_rows(job, routing.reporting_alias())
+        counted = [0]
+
+        def counting(rows):
+            for row in rows:
+                counted[0] += 1
+                yield row
+
+        with Heartbeat(job, using) as heartbeat, open(partial, 'wb') as output:
+            for data in gzip_stream(csv_rows(header, counting(rows))):
+                output.write(data)
+                if heartbeat.lost:
+                    raise JobLost
+        os.replace(partial, directory / name)
+        if not _attempt(job, using).update(
+            status=ExportJob.DONE, artifact=name, rows=counted[0], size=(directory / name).stat().st_size,
+            finished_at=timezone.now(),
+        ):
+            raise JobLost
+    except JobLost:
+        logger.warning("Export job %s attempt %s was taken over, discarding its output", job.pk, job.attempts)
+        for path in (partial, directory / name):
+            path.unlink(missing_ok=True)
+    except Exception as exc:
+        logger.exception("Export job %s failed", job.pk)
+        partial.unlink(missing_ok=True)
+        _attempt(job, using).update(status=ExportJob.FAILED, error=str(exc)[:1000], finished_at=timezone.now())
+
+
+def purge_expired(using=DEFAULT_DB_ALIAS):
+    """Удаляет завершённые задания старше EXPORT_JOB_TTL вместе с файлами."""
+    expired = ExportJob.objects.using(using).filter(
+        status__in=[ExportJob.DONE, ExportJob.FAILED], finished_at__lt=timezone.now() - job_ttl(),
+    )
+    for job in expired.only('pk', 'artifact'):
+        if job.artifact:
+            artifact_path(job).unlink(missing_ok=True)
+    return expired.delete()[0]
+
+
+def work(interval=2.0, once=False, using=DEFAULT_DB_ALIAS, stop=None):
+    """
+    Цикл исполнителя: выполняет задания, пока очередь не пуста, затем ждёт
+    interval секунд. С once — выходит, когда очередь пуста. stop — threading.Event.
+    Возвращает число выполненных заданий.
+    """
+    stop = stop or threading.Event()
+    done = 0
+    purged_at = None
+    while not stop.is_set():
+        try:
+            if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                purge_expired(using)
+                purged_at = time.monotonic()
+            requeue_stale(using)
+            job = claim(using)
+        except DatabaseError:
+            # база перезапускается или занята: исполнитель не падает, а повторяет позже
+            logger.exception("Export job queue is unavailable, retrying in %s s", interval)
+            close_old_connections()
+            stop.wait(interval)
+            continue
+        if job is not None:
+            run(job, using)
+            done += 1
+            continue
+        if once:
+            break
+        # соединение не держится, пока исполнитель ждёт
+        close_old_connections()
+        stop.wait(interval)
+    return done
+
+
+def worker_process(interval, once, using):
+    """Точка входа процесса-исполнителя из run_export_jobs --workers."""
+    import django
+    django.setup()
+    # соединения родителя в дочернем процессе не используются
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+
+    stop = threading.Event()
+    # SIGTERM: доделать текущее задание и выйти
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    work(interval, once, using, stop)
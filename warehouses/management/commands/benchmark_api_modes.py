@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.authtoken.models import Token
+
+from warehouses import async_views
+from warehouses.benchmarks import load
+from warehouses.models import Warehouse
+from warehouses.urls import router
+
+ENDPOINTS = {
+    'warehouse_inventory': '/api/warehouses/{warehouse}/inventory/',
+    'summary': '/api/inventory/summary/',
+    'logs': '/api/inventory/logs/',
+    'transfers': '/api/transfers/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает синхронные (DRF) и асинхронные (warehouses.async_views) эндпоинты чтения "
+        "под одинаковой нагрузкой: запросов в секунду, p50 и p99 задержки. Работает с текущей базой."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS),
+                            help="Эндпоинт для прогона (можно несколько); по умолчанию все.")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--warehouse', type=int, help="Склад для warehouse_inventory; по умолчанию первый.")
+        parser.add_argument('--token', help="Токен API; по умолчанию первый существующий.")
+        parser.add_argument('--with-cache', action='store_true',
+                            help="Не отключать кэш выдачи склада (иначе каждый запрос идёт в базу).")
+        parser.add_argument('--json', dest='json_path', help="Записать результаты в JSON-файл.")
+
+    def handle(self, *args, **options):
+        token = options['token'] or Token.objects.values_list('key', flat=True).first()
+        if not token:
+            raise CommandError("No API tokens exist; create one with: manage.py drf_create_token <username>")
+        warehouse = options['warehouse'] or Warehouse.objects.order_by('pk').values_list('pk', flat=True).first()
+        if warehouse is None:
+            raise CommandError("No warehouses to benchmark.")
+
+        modes = ['sync', 'async'] if options['mode'] == 'both' else [options['mode']]
+        resolvers = {
+            'sync': load.api_resolver(router.urls),
+            'async': load.api_resolver(async_views.urlpatterns + router.urls),
+        }
+        runners = {'sync': load.run_sync, 'async': load.run_async}
+        headers = {'Authorization': f'Token {token}'}
+
+        results = []
+        setup_test_environment()
+        try:
+            with override_settings(**({} if options['with_cache'] else {'CACHES': load.NO_CACHE})):
+                for name in options['endpoint'] or list(ENDPOINTS):
+                    paths = [ENDPOINTS[name].format(warehouse=warehouse)]
+                    for mode in modes:
+                        runner = runners[mode]
+                        if options['warmup']:
+                            runner(resolvers[mode], paths, options['warmup'], options['concurrency'], headers)
+                        summary = runner(
+                            resolvers[mode], paths, options['requests'], options['concurrency'], headers
+                        )
+                        results.append({"endpoint": name, "mode": mode, **summary})
+                        self.stdout.write(
+                            f"{name:<20} {mode:<5} {summary['rps']:>9.1f} req/s  "
+                            f"p50 {summary['p50_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms  "
+                            f"errors {summary['errors']}"
+                        )
+        finally:
+            teardown_test_environment()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as file:
+                json.dump({"concurrency": options['concurrency'], "results": results}, file, indent=2)
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouses.benchmarks import startup
+
+PROFILES = ['full', 'api']
+
+
+def kilobytes(value):
+    return f"{value / 1024:>7.1f} MB" if value is not None else "      n/a"
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает профили настроек (MULTISTOCK_PROFILE) по времени старта воркера, числу модулей, "
+        "разбору python -X importtime и памяти воркеров с загрузкой до fork (preload_app, gc.freeze) "
+        "и после него. Память воркера — из /proc/self/smaps_rollup (Linux)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=[*PROFILES, 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=4, help="Воркеров в замере памяти.")
+        parser.add_argument('--repeat', type=int, default=5, help="Запусков для медианы времени старта.")
+        parser.add_argument('--top', type=int, default=10, help="Самых долгих импортов в отчёте.")
+        parser.add_argument('--json', dest='json_path', help="Записать результаты в JSON-файл.")
+
+    def handle(self, *args, **options):
+        profiles = PROFILES if options['profile'] == 'both' else [options['profile']]
+        results = []
+        for profile in profiles:
+            try:
+                result = startup.measure(profile, options['workers'], options['repeat'], options['top'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            results.append(result)
+            self.stdout.write(
+                f"[{profile}] ready {result['ready_seconds'] * 1000:>8.1f} ms  "
+                f"process {result['wall_seconds'] * 1000:>8.1f} ms  imports {result['import_seconds'] * 1000:>8.1f} ms  "
+                f"modules {result['modules']:>5}  rss {kilobytes(result['rss_kb'])}"
+            )
+            for mode in ('preload', 'fork'):
+                memory = result[mode]
+                self.stdout.write(
+                    f"[{profile}] {mode:<7} x{memory['workers']} worker private {kilobytes(memory['private_kb_mean'])}  "
+                    f"pss {kilobytes(memory['pss_kb_mean'])}  rss {kilobytes(memory['rss_kb_mean'])}"
+                )
+            for name, seconds in result['slowest_imports']:
+                self.stdout.write(f"[{profile}]   {seconds * 1000:>8.1f} ms  {name}")
+
+        if len(results) == 2:
+            full, api = results
+            self.stdout.write(
+                f"api vs full: ready x{api['ready_seconds'] / full['ready_seconds']:.2f}, "
+                f"modules {api['modules'] - full['modules']:+d}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as file:
+                json.dump({"workers": options['workers'], "results": results}, file, indent=2)
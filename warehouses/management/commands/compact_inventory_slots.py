@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from warehouses import slots
+
+
+class Command(BaseCommand):
+    help = (
+        "Выравнивает слоты шардированных строк остатков: собирает остаток строки и слотов и "
+        "раскладывает его поровну, чтобы списания снова проходили по одному слоту. "
+        "С --interval работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Повторять проход каждые N секунд, пока процесс не остановят.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        while True:
+            compacted = slots.compact_all(using=options['database'])
+            if compacted or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} inventory rows."))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
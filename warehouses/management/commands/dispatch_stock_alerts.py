@@ -0,0 +1,41 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouses import alerts
+
+logger = logging.getLogger('warehouses.alerts')
+
+
+class Command(BaseCommand):
+    help = (
+        "Отправляет оповещения о пересечении порога дозаказа на LOW_STOCK_WEBHOOK_URL пачками, "
+        "по последнему состоянию каждой пары (товар, склад). С --interval работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float,
+                            help="Повторять проход каждые N секунд, пока процесс не остановят.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if not alerts.webhook_url():
+            raise CommandError("LOW_STOCK_WEBHOOK_URL is not set.")
+        while True:
+            sent = 0
+            try:
+                while True:
+                    batch = alerts.dispatch(batch_size=options['batch_size'], using=options['database'])
+                    if not batch:
+                        break
+                    sent += batch
+            except OSError:
+                # получатель недоступен: оповещения остались в очереди до следующего прохода
+                logger.exception("Stock alert webhook failed")
+            if sent or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f"Dispatched {sent} stock alerts."))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
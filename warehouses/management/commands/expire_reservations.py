@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from warehouses import reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Снимает просроченные резервы пачками и возвращает удержанное количество в available. "
+        "С --interval работает постоянно, повторяя проход каждые N секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float,
+                            help="Повторять проход каждые N секунд, пока процесс не остановят.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = reservations.expire_stale(batch_size=options['batch_size'], using=options['database'])
+            if expired or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f"Expired {expired} reservations."))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,42 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouses.imports import import_inventory, import_chunk_size
+from warehouses.parsers import JSONLinesParser
+
+
+class Command(BaseCommand):
+    help = "Потоково загружает остатки из CSV или JSON Lines файла (sku, warehouse_id, quantity)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="По умолчанию определяется по расширению файла.")
+        parser.add_argument('--chunk-size', type=int, default=import_chunk_size())
+        parser.add_argument('--max-errors', type=int, default=100, help="Сколько ошибок строк вывести.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"File {path} does not exist.")
+
+        file_format = options['format'] or ('jsonl' if path.suffix in ('.jsonl', '.ndjson') else 'csv')
+        with path.open(encoding='utf-8', newline='') as stream:
+            if file_format == 'csv':
+                rows = csv.DictReader(stream)
+            else:
+                rows = JSONLinesParser._rows(stream)
+            result = import_inventory(
+                rows,
+                chunk_size=options['chunk_size'],
+                max_errors=options['max_errors'],
+                using=options['database'],
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created}, updated {result.updated}, {result.error_count} rows with errors."
+        ))
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+
+from warehouses import partitioning
+from warehouses.models import InventoryLog, TransferLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт помесячные секции InventoryLog/TransferLog заранее и применяет политику хранения: "
+        "старые месяцы InventoryLog сворачиваются в дневные сводки, затем сырые секции отсоединяются "
+        "или удаляются. Без PostgreSQL строки сворачиваются и удаляются пачками."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+        parser.add_argument('--retain-months', type=int,
+                            help="Сколько месяцев сырого InventoryLog хранить (включая текущий).")
+        parser.add_argument('--transfer-retain-months', type=int,
+                            help="Сколько месяцев TransferLog хранить (включая текущий).")
+        parser.add_argument('--detach', action='store_true',
+                            help="Только отсоединять старые секции, не удаляя таблицы.")
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.dry_run = options['dry_run']
+        self.drop = not options['detach']
+        current = partitioning.month_start(partitioning.utc_today())
+        partitioned = partitioning.supports_partitioning(self.using)
+
+        if partitioned:
+            for table, _ in partitioning.PARTITIONED_TABLES:
+                if self.dry_run:
+                    continue
+                for name in partitioning.ensure_partitions(table, options['months_ahead'], using=self.using):
+                    self.stdout.write(f"Created partition {name}")
+
+        if options['retain_months']:
+            cutoff = partitioning.add_months(current, 1 - options['retain_months'])
+            if partitioned:
+                self.expire_partitions(InventoryLog._meta.db_table, cutoff, rollup=True)
+            else:
+                self.expire_rows(InventoryLog, 'created_at', cutoff, rollup=True)
+
+        if options['transfer_retain_months']:
+            cutoff = partitioning.add_months(current, 1 - options['transfer_retain_months'])
+            if partitioned:
+                self.expire_partitions(TransferLog._meta.db_table, cutoff, rollup=False)
+            else:
+                self.expire_rows(TransferLog, 'timestamp', cutoff, rollup=False)
+
+    def expire_partitions(self, table, cutoff, rollup):
+        for start, name in partitioning.monthly_partitions(table, using=self.using):
+            if start >= cutoff:
+                break
+            self.stdout.write(f"Expiring partition {name}")
+            if self.dry_run:
+                continue
+            if rollup:
+                written = partitioning.rollup_inventory_logs(start, partitioning.add_months(start, 1), using=self.using)
+                self.stdout.write(f"  rolled up into {written} daily summaries")
+            partitioning.remove_partition(table, name, drop=self.drop, using=self.using)
+
+    def expire_rows(self, model, column, cutoff, rollup):
+        oldest = model._base_manager.using(self.using).order_by(column).values_list(column, flat=True).first()
+        if oldest is None or oldest.date() >= cutoff:
+            return
+        self.stdout.write(f"Expiring {model._meta.db_table} rows before {cutoff}")
+        if self.dry_run:
+            return
+        if rollup:
+            # помесячно, от старых к новым, чтобы net_change опирался на уже свёрнутые дни
+            month = partitioning.month_start(oldest)
+            while month < cutoff:
+                written = partitioning.rollup_inventory_logs(month, partitioning.add_months(month, 1), using=self.using)
+                self.stdout.write(f"  {month:%Y-%m}: rolled up into {written} daily summaries")
+                month = partitioning.add_months(month, 1)
+        deleted = partitioning.delete_before(model, column, cutoff, using=self.using)
+        self.stdout.write(f"  deleted {deleted} rows")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from warehouses import idempotency
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи Idempotency-Key (срок задаётся IDEMPOTENCY_KEY_TTL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired(batch_size=options['batch_size'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouses import stock_totals
+
+
+class Command(BaseCommand):
+    help = "Пересобирает таблицу ProductStockTotal из Inventory или сверяет её с живым агрегатом (--verify)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Только сверить, ничего не меняя.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        using = options['database']
+
+        if not options['verify']:
+            written = stock_totals.rebuild(chunk_size=chunk_size, using=using)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} product totals."))
+            return
+
+        mismatches = 0
+        for product_id, expected, stored in stock_totals.verify(chunk_size=chunk_size, using=using):
+            mismatches += 1
+            self.stdout.write(
+                f"product {product_id}: expected total={expected[0]} rows={expected[1]}, "
+                f"stored total={stored[0]} rows={stored[1]}"
+            )
+        if mismatches:
+            raise CommandError(f"{mismatches} product totals differ from Inventory.")
+        self.stdout.write(self.style.SUCCESS("Product totals match Inventory."))
@@ -0,0 +1,126 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.authtoken.models import Token
+
+from warehouses.benchmarks import data, load, suite
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарки API складов на тестовой базе: бюджеты числа запросов, задержки и пропускная "
+        "способность на нескольких масштабах данных, конкурентные перемещения с проверкой сохранения "
+        "остатков. Результаты пишутся в JSON для сравнения между коммитами."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', choices=list(data.SCALES),
+                            help="Масштаб данных (можно несколько); по умолчанию tiny и small.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=30, help="Последовательных вызовов на эндпоинт.")
+        parser.add_argument('--requests', type=int, default=200, help="Запросов в прогоне пропускной способности.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--stress-workers', type=int, default=8)
+        parser.add_argument('--stress-transfers', type=int, default=25, help="Перемещений на поток.")
+        parser.add_argument('--hot-row-slots', type=int, default=8,
+                            help="Слотов в прогоне по одной горячей строке; 0 — без этого прогона.")
+        parser.add_argument('--output', default='benchmark_results.json')
+        parser.add_argument('--keepdb', action='store_true', help="Не удалять тестовую базу после прогона.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        results = {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "seed": options['seed'],
+            "query_budgets": suite.QUERY_BUDGETS,
+            "scales": {},
+            "violations": [],
+        }
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=load.NO_CACHE):
+                for scale in options['scale'] or ['tiny', 'small']:
+                    results["scales"][scale] = self.run_scale(scale, options, results["violations"], using)
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if results["violations"]:
+            raise CommandError("Benchmark violations:\n" + "\n".join(results["violations"]))
+        self.stdout.write(self.style.SUCCESS("All query budgets and stock checks passed."))
+
+    def run_scale(self, scale, options, violations, using):
+        call_command('flush', interactive=False, database=using, verbosity=0)
+        user = get_user_model().objects.db_manager(using).create_user('benchmark')
+        token = Token.objects.using(using).create(user=user).key
+
+        started = datetime.now(timezone.utc)
+        counts = data.generate(*data.SCALES[scale], seed=options['seed'], using=using)
+        generate_seconds = (datetime.now(timezone.utc) - started).total_seconds()
+        self.stdout.write(f"[{scale}] generated {counts} in {generate_seconds:.1f}s")
+
+        result, scale_violations = suite.run_scale(
+            token,
+            repeat=options['repeat'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            stress_workers=options['stress_workers'],
+            stress_transfers_per_worker=options['stress_transfers'],
+            seed=options['seed'],
+            hot_row_slots=options['hot_row_slots'],
+            using=using,
+        )
+        for name, endpoint in result["endpoints"].items():
+            latency = endpoint["latency"]
+            throughput = f"{endpoint['load']['rps']:>8.1f} req/s" if "load" in endpoint else " " * 14
+            self.stdout.write(
+                f"[{scale}] {name:<26} queries {endpoint['queries']:>2}/{endpoint['query_budget']:<2} "
+                f"p50 {latency['p50_ms']:>8.2f} ms  p99 {latency['p99_ms']:>8.2f} ms  {throughput}"
+            )
+        if result["stress"] is not None:
+            stress = result["stress"]
+            self.stdout.write(
+                f"[{scale}] transfer stress: {stress['attempted']} attempted, {stress['succeeded']} ok, "
+                f"{stress['server_errors']} errors, {stress['transfers_per_second']} /s, "
+                f"conserved={stress['conserved']}"
+            )
+        if result["hot_row"] is not None:
+            hot_row = result["hot_row"]
+            self.stdout.write(
+                f"[{scale}] hot row: single row {hot_row['single_row']['transfers_per_second']} /s, "
+                f"{hot_row['slots']} slots {hot_row['sharded']['transfers_per_second']} /s "
+                f"(x{hot_row['speedup']}), conserved="
+                f"{hot_row['single_row']['conserved'] and hot_row['sharded']['conserved']}"
+            )
+        violations.extend(f"[{scale}] {violation}" for violation in scale_violations)
+        return {"data": counts, "generate_seconds": round(generate_seconds, 3), **result}
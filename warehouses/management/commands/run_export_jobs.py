@@ -0,0 +1,54 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from warehouses import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Исполнитель фоновых выгрузок (ExportJob): забирает задания из таблицы через "
+        "SELECT ... FOR UPDATE SKIP LOCKED и пишет gzip-файлы в EXPORT_JOBS_DIR. "
+        "С --workers N запускает N процессов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help="Пауза между проверками пустой очереди, сек.")
+        parser.add_argument('--once', action='store_true',
+                            help="Выйти, когда очередь опустеет.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        interval, once, using = options['interval'], options['once'], options['database']
+        if options['workers'] <= 1:
+            done = jobs.work(interval, once, using)
+            self.stdout.write(self.style.SUCCESS(f"Finished {done} export jobs."))
+            return
+
+        # дочерние процессы открывают свои соединения
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=jobs.worker_process, args=(interval, once, using), name=f'export-worker-{number}')
+            for number in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Ctrl+C уже получили все процессы группы: ждём, пока доделают текущие задания
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS(f"{len(processes)} export workers stopped."))
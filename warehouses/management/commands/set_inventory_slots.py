@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouses import slots
+from warehouses.models import Inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит строку остатков (товар, склад) в режим шардированного счётчика: свободный остаток "
+        "раскладывается по N слотам, и параллельные перемещения не ждут блокировку одной строки. "
+        "--slots 0 возвращает строку в обычный режим."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, required=True)
+        parser.add_argument('--warehouse', type=int, required=True)
+        parser.add_argument('--slots', type=int, help="Число слотов; по умолчанию INVENTORY_HOT_ROW_SLOTS.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        count = slots.default_slots() if options['slots'] is None else options['slots']
+        if not 0 <= count <= 256:
+            raise CommandError("--slots must be between 0 and 256.")
+        inventory_id = (
+            Inventory.objects.using(options['database'])
+            .filter(product_id=options['product'], warehouse_id=options['warehouse'])
+            .values_list('pk', flat=True).first()
+        )
+        if inventory_id is None:
+            raise CommandError("No such product in warehouse.")
+        slots.set_slots(inventory_id, count, using=options['database'])
+        mode = f"{count} slots" if count else "a single row"
+        self.stdout.write(self.style.SUCCESS(f"Inventory {inventory_id} now uses {mode}."))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from warehouses import history
+
+
+class Command(BaseCommand):
+    help = (
+        "Записывает полный снимок остатков в InventorySnapshot одним INSERT ... SELECT "
+        "(запускать раз в сутки); по нему отвечают запросы с ?as_of=."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retain-days', type=int,
+                            help="Удалить снимки старше N дней.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        taken_at, rows = history.take_snapshot(using=using)
+        self.stdout.write(self.style.SUCCESS(f"Snapshot {taken_at.isoformat()}: {rows} rows."))
+
+        if options['retain_days']:
+            deleted = history.prune_snapshots(taken_at - timedelta(days=options['retain_days']), using=using)
+            self.stdout.write(f"Deleted {deleted} snapshot rows older than {options['retain_days']} days.")
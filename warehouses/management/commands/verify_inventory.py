@@ -0,0 +1,64 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from warehouses import consistency
+
+
+def describe(discrepancy):
+    if discrepancy.kind == 'quantity':
+        return f"inventory {discrepancy.quantity}, log {discrepancy.logged}"
+    if discrepancy.kind == 'unlogged_row':
+        return f"inventory {discrepancy.quantity}, no log entry"
+    if discrepancy.kind == 'missing_row':
+        return f"no inventory row, log {discrepancy.logged}"
+    logged_at = discrepancy.logged_at.isoformat() if discrepancy.logged_at else 'none'
+    return f"transfer at {discrepancy.transferred_at.isoformat()}, last log entry {logged_at}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет Inventory с журналами InventoryLog и TransferLog слиянием потоков, упорядоченных "
+        "по (склад, товар), и выводит расхождения по парам. С --repair дописывает в журнал записи "
+        "с текущим количеством строк; с --workers N проверяет диапазоны складов в N процессах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help="Дописать в InventoryLog записи с текущим состоянием расходящихся пар.")
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        fix, chunk_size, using = options['repair'], options['chunk_size'], options['database']
+        workers = options['workers']
+        if workers <= 1:
+            found, repaired = self.report([consistency.check_range((None, fix, chunk_size, using))])
+        else:
+            # на каждый процесс несколько диапазонов: освободившийся берёт следующий
+            tasks = [(bounds, fix, chunk_size, using) for bounds in consistency.warehouse_ranges(workers * 4, using)]
+            # дочерние процессы открывают свои соединения
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=consistency.worker_init) as pool:
+                found, repaired = self.report(pool.imap(consistency.check_range, tasks))
+
+        if not found:
+            self.stdout.write(self.style.SUCCESS("Inventory matches its logs."))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {repaired} repair log entries for {found} discrepancies."))
+        else:
+            raise CommandError(f"{found} discrepancies between Inventory and its logs.")
+
+    def report(self, results):
+        found, repaired = 0, 0
+        for discrepancies, written in results:
+            for discrepancy in discrepancies:
+                self.stdout.write(
+                    f"warehouse {discrepancy.warehouse_id} product {discrepancy.product_id}: "
+                    f"{discrepancy.kind} ({describe(discrepancy)})"
+                )
+            found += len(discrepancies)
+            repaired += written
+        return found, repaired
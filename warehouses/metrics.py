@@ -0,0 +1,152 @@
+"""
+Метрики запросов в памяти процесса и их выдача в текстовом формате Prometheus
+на /metrics (вместе со счётчиками журнала остатков и кэша выдачи складов).
+
+Значения копятся в каждом процессе отдельно, как и warehouses.audit.stats():
+при нескольких воркерах Prometheus собирает их с каждого процесса.
+
+/metrics закрыт по умолчанию: доступ даёт заголовок Authorization: Bearer
+<METRICS_TOKEN> или адрес клиента из METRICS_ALLOWED_IPS (адреса и сети).
+"""
+import hmac
+import ipaddress
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from warehouses import audit, inventory_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+# (view, method, status) -> число запросов
+_requests = defaultdict(int)
+# view -> [счётчики по корзинам..., сумма секунд, число]
+_durations = defaultdict(lambda: [0] * len(DURATION_BUCKETS) + [0.0, 0])
+# view -> [выборочных запросов, SQL-запросов, секунд SQL, повторных SQL-запросов]
+_sql = defaultdict(lambda: [0, 0, 0.0, 0])
+_slow = defaultdict(int)
+
+
+def record_request(view, method, status, seconds, sql=None, slow=False):
+    """sql — (число запросов, секунд SQL, повторов) для запросов из выборки или None."""
+    with _lock:
+        _requests[view, method, status] += 1
+        duration = _durations[view]
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                duration[index] += 1
+        duration[-2] += seconds
+        duration[-1] += 1
+        if sql is not None:
+            totals = _sql[view]
+            totals[0] += 1
+            totals[1] += sql[0]
+            totals[2] += sql[1]
+            totals[3] += sql[2]
+        if slow:
+            _slow[view] += 1
+
+
+def reset():
+    with _lock:
+        _requests.clear()
+        _durations.clear()
+        _sql.clear()
+        _slow.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _family(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def render():
+    with _lock:
+        requests = dict(_requests)
+        durations = {view: list(values) for view, values in _durations.items()}
+        sql = {view: list(values) for view, values in _sql.items()}
+        slow = dict(_slow)
+
+    lines = []
+    _family(lines, 'warehouses_http_requests_total', 'counter', 'HTTP requests by view, method and status.')
+    for (view, method, status), value in sorted(requests.items()):
+        lines.append(f'warehouses_http_requests_total{_labels(view=view, method=method, status=status)} {value}')
+
+    _family(lines, 'warehouses_http_request_duration_seconds', 'histogram', 'Request wall time by view.')
+    for view, values in sorted(durations.items()):
+        for bound, value in zip(DURATION_BUCKETS, values):
+            lines.append(f'warehouses_http_request_duration_seconds_bucket{_labels(view=view, le=bound)} {value}')
+        lines.append(f'warehouses_http_request_duration_seconds_bucket{_labels(view=view, le="+Inf")} {values[-1]}')
+        lines.append(f'warehouses_http_request_duration_seconds_sum{_labels(view=view)} {values[-2]}')
+        lines.append(f'warehouses_http_request_duration_seconds_count{_labels(view=view)} {values[-1]}')
+
+    sql_families = (
+        ('warehouses_http_sampled_requests_total', 'Requests with SQL instrumentation (sampled).'),
+        ('warehouses_http_sql_queries_total', 'SQL queries executed by sampled requests.'),
+        ('warehouses_http_sql_seconds_total', 'SQL time spent by sampled requests.'),
+        ('warehouses_http_sql_duplicate_queries_total', 'Repeated SQL fingerprints within a sampled request.'),
+    )
+    for index, (name, help_text) in enumerate(sql_families):
+        _family(lines, name, 'counter', help_text)
+        for view, values in sorted(sql.items()):
+            lines.append(f'{name}{_labels(view=view)} {values[index]}')
+
+    _family(lines, 'warehouses_http_slow_requests_total', 'counter', 'Requests over the slow-request thresholds.')
+    for view, value in sorted(slow.items()):
+        lines.append(f'warehouses_http_slow_requests_total{_labels(view=view)} {value}')
+
+    audit_stats = audit.stats()
+    for key, kind in (('flushed_rows', 'counter'), ('flushes', 'counter'),
+                      ('flush_seconds_total', 'counter'), ('last_flush_seconds', 'gauge')):
+        name = 'warehouses_inventory_log_' + key.removesuffix('_total') + ('_total' if kind == 'counter' else '')
+        _family(lines, name, kind, f'InventoryLog audit writer: {key}.')
+        lines.append(f'{name} {audit_stats[key]}')
+
+    _family(lines, 'warehouses_inventory_cache_events_total', 'counter', 'Warehouse inventory listing cache events.')
+    for event, value in sorted(inventory_cache.stats().items()):
+        lines.append(f'warehouses_inventory_cache_events_total{_labels(event=event)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_token():
+    return getattr(settings, 'METRICS_TOKEN', None)
+
+
+def metrics_allowed_ips():
+    return getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+def _allowed_address(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in metrics_allowed_ips())
+
+
+def _valid_token(request):
+    token = metrics_token()
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def metrics_view(request):
+    if not (_valid_token(request) or _allowed_address(request.META.get('REMOTE_ADDR', ''))):
+        if metrics_token():
+            response = JsonResponse({"error": "Invalid or missing metrics token."}, status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        return JsonResponse({"error": "Metrics are not available from this address."}, status=403)
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,187 @@
+"""
+Инструментирование запросов: время, число SQL-запросов, время SQL и повторы
+запросов (по отпечатку SQL без параметров) на каждое представление.
+
+Время и коды ответов считаются для всех запросов. SQL измеряется только для
+доли запросов REQUEST_METRICS_SAMPLE_RATE: обёртка выполнения запросов стоит
+на всех соединениях (см. install_sql_wrapper), но вне выборки сводится к чтению
+ContextVar. Контекстная переменная, а не execute_wrapper на соединении потока,
+нужна потому, что асинхронные представления выполняют запросы в других потоках.
+"""
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from warehouses import metrics
+
+logger = logging.getLogger('warehouses.requests')
+
+_recorder = ContextVar('warehouses_request_recorder', default=None)
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+_TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def fingerprint(sql):
+    """SQL без значений: литералы и списки параметров IN (...) сворачиваются в '?'."""
+    sql = _LITERAL_RE.sub('?', sql)
+    return _PLACEHOLDER_LIST_RE.sub('(?)', sql).replace('%s', '?')
+
+
+class RequestRecorder:
+    __slots__ = ('statements',)
+
+    def __init__(self):
+        # (секунды, sql)
+        self.statements = []
+
+    def add(self, sql, seconds):
+        self.statements.append((seconds, sql))
+
+    @property
+    def query_count(self):
+        return len(self.statements)
+
+    @property
+    def sql_seconds(self):
+        return sum(seconds for seconds, _ in self.statements)
+
+    def duplicates(self):
+        """{отпечаток: число выполнений} для отпечатков, выполненных больше одного раза."""
+        counts = Counter(
+            fingerprint(sql) for _, sql in self.statements if not sql.startswith(_TRANSACTION_STATEMENTS)
+        )
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+    def top_statements(self, limit):
+        return sorted(self.statements, key=lambda statement: statement[0], reverse=True)[:limit]
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - started)
+
+
+def install_sql_wrapper(connection):
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.0)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+class RequestMetricsMiddleware:
+    """
+    Записывает метрики запроса в warehouses.metrics, добавляет заголовок
+    Server-Timing и пишет в журнал warehouses.requests запросы, превысившие
+    SLOW_REQUEST_THRESHOLD_MS или SLOW_REQUEST_QUERY_THRESHOLD (с самыми
+    долгими SQL-запросами, если запрос попал в выборку).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self._finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self._finish(request, response, recorder, started)
+
+    def _start(self):
+        rate = sample_rate()
+        recorder = RequestRecorder() if rate and random.random() < rate else None
+        return recorder, _recorder.set(recorder), time.perf_counter()
+
+    def _finish(self, request, response, recorder, started):
+        seconds = time.perf_counter() - started
+        streaming = getattr(response, 'streaming', False)
+        timings = [f'app;dur={seconds * 1000:.1f}']
+        # у потокового ответа запросы ещё впереди: заголовки уходят до тела,
+        # время SQL в них было бы почти нулевым, оно попадает только в метрики
+        if recorder is not None and not streaming:
+            timings.append(f'db;dur={recorder.sql_seconds * 1000:.1f};desc="{recorder.query_count} queries"')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        # асинхронные потоки (лента изменений) бесконечны: для них метрики пишутся по заголовкам
+        if streaming and not response.is_async and recorder is not None:
+            # запросы потоковой выгрузки выполняются при чтении тела: метрики пишутся по его окончании
+            response.streaming_content = self._recorded_stream(
+                response.streaming_content, request, response, recorder, started
+            )
+        else:
+            self._record(request, response, recorder, seconds)
+        return response
+
+    def _recorded_stream(self, content, request, response, recorder, started):
+        try:
+            for chunk in content:
+                _recorder.set(recorder)
+                yield chunk
+                _recorder.set(None)
+        finally:
+            _recorder.set(None)
+            self._record(request, response, recorder, time.perf_counter() - started)
+
+    def _record(self, request, response, recorder, seconds):
+        view = view_name(request)
+        slow = seconds * 1000 >= getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 1000)
+        sql = None
+        duplicates = {}
+        if recorder is not None:
+            duplicates = recorder.duplicates()
+            sql = (recorder.query_count, recorder.sql_seconds, sum(count - 1 for count in duplicates.values()))
+            slow = slow or recorder.query_count >= getattr(settings, 'SLOW_REQUEST_QUERY_THRESHOLD', 50)
+        metrics.record_request(view, request.method, response.status_code, seconds, sql=sql, slow=slow)
+
+        if slow:
+            self._log_slow(request, view, response.status_code, seconds, recorder, duplicates)
+
+    @staticmethod
+    def _log_slow(request, view, status, seconds, recorder, duplicates):
+        message = f"Slow request {request.method} {request.get_full_path()} ({view}) {status} in {seconds * 1000:.1f} ms"
+        if recorder is None:
+            logger.warning(message + " (SQL not sampled)")
+            return
+        lines = [message + f", {recorder.query_count} queries, {recorder.sql_seconds * 1000:.1f} ms SQL"]
+        for statement_seconds, sql in recorder.top_statements(getattr(settings, 'SLOW_REQUEST_TOP_STATEMENTS', 5)):
+            lines.append(f"  {statement_seconds * 1000:.1f} ms: {sql}")
+        for sql, count in sorted(duplicates.items(), key=lambda item: -item[1]):
+            lines.append(f"  repeated x{count}: {sql}")
+        logger.warning('\n'.join(lines))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_stock_totals(apps, schema_editor):
+    Inventory = apps.get_model('warehouses', 'Inventory')
+    ProductStockTotal = apps.get_model('warehouses', 'ProductStockTotal')
+    db_alias = schema_editor.connection.alias
+
+    totals = (
+        Inventory.objects.using(db_alias)
+        .values('product_id')
+        .annotate(total=Sum('quantity'), rows=Count('id'))
+        .order_by('product_id')
+    )
+    ProductStockTotal.objects.using(db_alias).bulk_create(
+        [
+            ProductStockTotal(product_id=item['product_id'], total_quantity=item['total'] or 0, inventory_rows=item['rows'])
+            for item in totals.iterator(chunk_size=2000)
+        ],
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0004_alter_inventory_quantity_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStockTotal',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_total', serialize=False, to='warehouses.product')),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('inventory_rows', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['total_quantity'], name='stock_total_quantity_idx')],
+            },
+        ),
+        migrations.RunPython(populate_stock_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_inventory(apps, schema_editor):
+    # Дубликаты (product, warehouse) сливаются в строку с меньшим id, количество суммируется
+    Inventory = apps.get_model('warehouses', 'Inventory')
+    ProductStockTotal = apps.get_model('warehouses', 'ProductStockTotal')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = (
+        Inventory.objects.using(db_alias)
+        .values('product_id', 'warehouse_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    affected_products = set()
+    for item in duplicates:
+        Inventory.objects.using(db_alias).filter(pk=item['keep_id']).update(quantity=item['total'])
+        Inventory.objects.using(db_alias).filter(
+            product_id=item['product_id'], warehouse_id=item['warehouse_id']
+        ).exclude(pk=item['keep_id']).delete()
+        affected_products.add(item['product_id'])
+
+    for product_id in affected_products:
+        ProductStockTotal.objects.using(db_alias).filter(product_id=product_id).update(
+            inventory_rows=Inventory.objects.using(db_alias).filter(product_id=product_id).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0005_productstocktotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_inventory, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='inventory',
+            constraint=models.UniqueConstraint(fields=('product', 'warehouse'), name='unique_inventory_product_warehouse'),
+        ),
+    ]
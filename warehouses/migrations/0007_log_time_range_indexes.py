@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0006_inventory_unique_product_warehouse'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['warehouse', 'created_at'], name='inventorylog_wh_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['product', 'created_at'], name='inventorylog_prod_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['created_at'], name='inventorylog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferlog',
+            index=models.Index(fields=['from_warehouse', 'timestamp'], name='transferlog_from_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferlog',
+            index=models.Index(fields=['to_warehouse', 'timestamp'], name='transferlog_to_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferlog',
+            index=models.Index(fields=['product', 'timestamp'], name='transferlog_prod_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferlog',
+            index=models.Index(fields=['timestamp'], name='transferlog_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from warehouses.partitioning import convert_to_partitioned, convert_to_unpartitioned
+
+
+def partition_log_tables(apps, schema_editor):
+    # только PostgreSQL; на остальных СУБД журналы остаются обычными таблицами
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    convert_to_partitioned(schema_editor, apps.get_model('warehouses', 'InventoryLog'), 'created_at')
+    convert_to_partitioned(schema_editor, apps.get_model('warehouses', 'TransferLog'), 'timestamp')
+
+
+def unpartition_log_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    convert_to_unpartitioned(schema_editor, apps.get_model('warehouses', 'InventoryLog'), 'created_at')
+    convert_to_unpartitioned(schema_editor, apps.get_model('warehouses', 'TransferLog'), 'timestamp')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0007_log_time_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('closing_quantity', models.IntegerField()),
+                ('net_change', models.BigIntegerField()),
+                ('entries', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouses.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouses.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['warehouse', 'day'], name='inventorylog_rollup_wh_idx'), models.Index(fields=['product', 'day'], name='inventorylog_rollup_prod_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'product', 'warehouse'), name='unique_inventorylog_rollup_day')],
+            },
+        ),
+        migrations.RunPython(partition_log_tables, unpartition_log_tables),
+    ]
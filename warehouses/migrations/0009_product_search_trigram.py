@@ -0,0 +1,46 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+TRIGRAM_INDEXES = [
+    ('product_name_trgm_idx', '"name" gin_trgm_ops'),
+    ('product_sku_trgm_idx', '"sku" gin_trgm_ops'),
+    # icontains/istartswith на PostgreSQL сравнивают UPPER(...) LIKE UPPER(...)
+    ('product_name_upper_trgm_idx', '(UPPER("name"::text)) gin_trgm_ops'),
+    ('product_sku_upper_trgm_idx', '(UPPER("sku"::text)) gin_trgm_ops'),
+]
+
+
+class PostgresTrigramExtension(TrigramExtension):
+    # откат CreateExtension не проверяет СУБД и на SQLite падает на pg_extension
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, expression in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "warehouses_product" USING gin ({expression})'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0008_inventorylogrollup_log_partitions'),
+    ]
+
+    operations = [
+        PostgresTrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
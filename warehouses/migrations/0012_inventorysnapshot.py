@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0011_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouses.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouses.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['taken_at', 'product'], name='inventory_snapshot_prod_idx')],
+                'constraints': [models.UniqueConstraint(fields=('taken_at', 'warehouse', 'product'), name='unique_inventory_snapshot_row')],
+            },
+        ),
+    ]
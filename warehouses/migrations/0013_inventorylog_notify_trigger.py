@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# канал должен совпадать с warehouses.changefeed.CHANNEL
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION warehouses_inventorylog_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('warehouses_inventory_changes', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER warehouses_inventorylog_notify
+    AFTER INSERT ON warehouses_inventorylog
+    FOR EACH STATEMENT EXECUTE FUNCTION warehouses_inventorylog_notify();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS warehouses_inventorylog_notify ON warehouses_inventorylog;
+DROP FUNCTION IF EXISTS warehouses_inventorylog_notify();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    # только PostgreSQL; на остальных СУБД ленту будит warehouses.audit внутри процесса
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0012_inventorysnapshot'),
+    ]
+
+    operations = [
+        # один NOTIFY на INSERT (а не на строку): bulk_create журнала будит слушателей один раз
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
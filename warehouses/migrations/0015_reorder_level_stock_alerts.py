@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0014_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('low', 'Ниже порога'), ('recovered', 'Восстановлен')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('reorder_level', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='reorder_level',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__lt', models.F('reorder_level'))), fields=['warehouse', 'id'], name='inventory_low_stock_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouses.product'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouses.warehouse'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', True)), fields=['created_at'], name='stock_alert_pending_idx'),
+        ),
+    ]
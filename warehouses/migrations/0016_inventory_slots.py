@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0015_reorder_level_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='inventory',
+            name='inventory_low_stock_idx',
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='slots',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__lt', models.F('reorder_level')), ('slots', 0)), fields=['warehouse', 'id'], name='inventory_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('slots__gt', 0)), fields=['id'], name='inventory_sharded_idx'),
+        ),
+        migrations.AddField(
+            model_name='inventoryslot',
+            name='inventory',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_rows', to='warehouses.inventory'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventoryslot',
+            constraint=models.UniqueConstraint(fields=('inventory', 'slot'), name='unique_inventory_slot'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0016_inventory_slots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorylog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:45
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_watermark(apps, schema_editor):
+    InventoryLog = apps.get_model('warehouses', 'InventoryLog')
+    ChangeFeedWatermark = apps.get_model('warehouses', 'ChangeFeedWatermark')
+    db_alias = schema_editor.connection.alias
+
+    # уже записанный журнал считается зафиксированным
+    last_id = InventoryLog.objects.using(db_alias).aggregate(latest=Max('id'))['latest'] or 0
+    ChangeFeedWatermark.objects.using(db_alias).create(pk=1, last_id=last_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouses', '0017_inventorylog_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_watermark, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,13 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.constants import OnConflict
+from django.db.models.expressions import Combinable
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from warehouses.changes import InventoryChange, inventory_changed
 
 # Create your models here.
 class Warehouse(models.Model):
@@ -18,14 +27,342 @@ class Product(models.Model):
         return self.name
 
 
+class InventoryQuerySet(models.QuerySet):
+    """
+    Массовые пути записи остатков, которые не вызывают post_save/post_delete,
+    сами отправляют inventory_changed, чтобы изменения попадали в журнал.
+    """
+
+    def _send_changes(self, rows, operation):
+        # rows: (product_id, warehouse_id, quantity, previous)
+        changes = [
+            InventoryChange(product_id, warehouse_id, quantity, operation, previous)
+            for product_id, warehouse_id, quantity, previous in rows
+        ]
+        if changes:
+            inventory_changed.send(sender=self.model, changes=changes, using=self.db)
+
+    def _current_quantities(self, objs):
+        product_ids = {obj.product_id for obj in objs}
+        warehouse_ids = {obj.warehouse_id for obj in objs}
+        locked = list(
+            self.model._base_manager.using(self.db)
+            .select_for_update()
+            .filter(product_id__in=product_ids, warehouse_id__in=warehouse_ids)
+            .values_list('pk', 'product_id', 'warehouse_id', 'quantity', 'slots')
+        )
+        # запись задаёт количество строки целиком: остаток слотов сначала переносится в строку
+        moved = self._fold_locked([pk for pk, _, _, _, slots in locked if slots])
+        return {
+            (product_id, warehouse_id): quantity + moved.get(pk, 0)
+            for pk, product_id, warehouse_id, quantity, _ in locked
+        }
+
+    def _bulk_create(self, objs, **kwargs):
+        objs = list(objs)
+        self._for_write = True
+        update_conflicts = kwargs.get('update_conflicts', False)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            if update_conflicts or kwargs.get('ignore_conflicts', False):
+                previous = self._current_quantities(objs)
+            else:
+                previous = {}
+            created = super().bulk_create(objs, **kwargs)
+
+            changes = {'add': [], 'update': []}
+            for obj in created:
+                key = (obj.product_id, obj.warehouse_id)
+                if key not in previous:
+                    changes['add'].append((obj.product_id, obj.warehouse_id, obj.quantity, 0))
+                elif update_conflicts:
+                    changes['update'].append((obj.product_id, obj.warehouse_id, obj.quantity, previous[key]))
+            for operation, rows in changes.items():
+                self._send_changes(rows, operation)
+        return created, previous
+
+    def bulk_create(self, objs, **kwargs):
+        return self._bulk_create(objs, **kwargs)[0]
+
+    def upsert(self, objs, batch_size=None):
+        """
+        INSERT ... ON CONFLICT (product, warehouse) DO UPDATE SET quantity.
+        Возвращает (число созданных строк, число обновлённых).
+        """
+        created, previous = self._bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['product', 'warehouse'],
+            update_fields=['quantity'],
+        )
+        updated = sum(1 for obj in created if (obj.product_id, obj.warehouse_id) in previous)
+        return len(created) - updated, updated
+
+    upsert.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        if 'quantity' in fields:
+            sharded = {obj.pk: obj for obj in objs if obj.slots}
+            if sharded:
+                for pk, moved in self.model.objects.using(self.db).filter(pk__in=sharded).fold_slots().items():
+                    sharded[pk].loaded_quantity += moved
+        # QuerySet.bulk_update() вызывает update(), поэтому идём через базовый менеджер, чтобы не логировать дважды
+        updated = self.model._base_manager.using(self.db).bulk_update(objs, fields, batch_size=batch_size)
+        if 'quantity' not in fields:
+            return updated
+
+        if any(isinstance(obj.quantity, Combinable) for obj in objs):
+            quantities = dict(self.model._base_manager.using(self.db).filter(
+                pk__in=[obj.pk for obj in objs]
+            ).values_list('pk', 'quantity'))
+            for obj in objs:
+                obj.quantity = quantities[obj.pk]
+        self._send_changes(
+            ((obj.product_id, obj.warehouse_id, obj.quantity, obj.loaded_quantity) for obj in objs),
+            'update',
+        )
+        for obj in objs:
+            obj.loaded_quantity = obj.quantity
+        return updated
+
+    def update(self, **kwargs):
+        if 'quantity' not in kwargs:
+            return super().update(**kwargs)
+
+        self._for_write = True
+        with transaction.atomic(using=self.db, savepoint=False):
+            locked = list(self.select_for_update().values_list('pk', 'quantity', 'slots'))
+            moved = self._fold_locked([pk for pk, _, slots in locked if slots])
+            previous = {pk: quantity + moved.get(pk, 0) for pk, quantity, _ in locked}
+            base = self.model._base_manager.using(self.db).filter(pk__in=previous)
+            updated = base.update(**kwargs)
+            self._send_changes(
+                (
+                    (product_id, warehouse_id, quantity, previous[pk])
+                    for pk, product_id, warehouse_id, quantity in base.values_list(
+                        'pk', 'product_id', 'warehouse_id', 'quantity'
+                    )
+                ),
+                'update',
+            )
+        return updated
+
+    update.alters_data = True
+
+    def delete(self):
+        # остаток слотов входит в количество, с которым строка уходит из итогов
+        self.fold_slots()
+        return super().delete()
+
+    delete.alters_data = True
+
+    def fold_slots(self):
+        """
+        Переносит остаток слотов шардированных строк queryset в сами строки
+        (строки блокируются). Количество строки вместе со слотами не меняется,
+        поэтому inventory_changed не отправляется. Возвращает {pk: перенесено}.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            return self._fold_locked(list(
+                self.filter(slots__gt=0).select_for_update().order_by('pk').values_list('pk', flat=True)
+            ))
+
+    fold_slots.alters_data = True
+
+    def _fold_locked(self, inventory_ids):
+        # строки inventory_ids уже заблокированы вызывающим кодом
+        if not inventory_ids:
+            return {}
+        using = self.db
+        moved = {}
+        for inventory_id, quantity in (
+            InventorySlot.objects.using(using).select_for_update()
+            .filter(inventory_id__in=inventory_ids, quantity__gt=0)
+            .order_by('inventory_id', 'slot').values_list('inventory_id', 'quantity')
+        ):
+            moved[inventory_id] = moved.get(inventory_id, 0) + quantity
+        if moved:
+            self.model._base_manager.using(using).filter(pk__in=moved).update(
+                quantity=F('quantity') + Case(
+                    *[When(pk=pk, then=Value(quantity)) for pk, quantity in moved.items()], default=Value(0),
+                )
+            )
+            InventorySlot.objects.using(using).filter(inventory_id__in=moved).update(quantity=0)
+        return moved
+
+    def with_slot_totals(self):
+        """
+        Аннотации live_quantity и live_available: количество строки вместе с
+        остатком её слотов. Списки и выгрузки читают их вместо quantity/available.
+        """
+        return self.annotate(live_quantity=live_quantity()).annotate(live_available=F('live_quantity') - F('reserved'))
+
+    def raw_update(self, **kwargs):
+        """Обычный QuerySet.update(): вызывающий код сам отправляет inventory_changed."""
+        return super().update(**kwargs)
+
+    raw_update.alters_data = True
+
+    def raw_update_returning(self, fields, **kwargs):
+        """
+        raw_update() одним запросом UPDATE ... RETURNING: список кортежей значений
+        fields обновлённых строк после изменения. Без RETURNING в СУБД — UPDATE и SELECT.
+        """
+        connection = connections[self.db]
+        if not connection.features.can_return_columns_from_insert:
+            pks = list(self.values_list('pk', flat=True))
+            self.raw_update(**kwargs)
+            return list(type(self)(self.model, using=self.db).filter(pk__in=pks).values_list(*fields))
+
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(kwargs)
+        statement, params = query.get_compiler(self.db).as_sql()
+        columns = ', '.join(connection.ops.quote_name(self.model._meta.get_field(field).column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{statement} RETURNING {columns}', params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+    raw_update_returning.alters_data = True
+
+    def insert_missing(self, objs):
+        """
+        INSERT ... ON CONFLICT DO NOTHING без журнала: вызывающий код сам отправляет
+        inventory_changed. Возвращает множество (product_id, warehouse_id) строк,
+        вставленных этим запросом; уже существующие, в том числе вставленные
+        параллельной транзакцией, пропускаются.
+        """
+        objs = list(objs)
+        connection = connections[self.db]
+        manager = self.model._base_manager.db_manager(self.db)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            inserted = set()
+            for obj in objs:
+                try:
+                    with transaction.atomic(using=self.db):
+                        manager.bulk_create([obj])
+                except IntegrityError:
+                    continue
+                inserted.add((obj.product_id, obj.warehouse_id))
+            return inserted
+
+        opts = self.model._meta
+        fields = [field for field in opts.concrete_fields if not field.generated and field != opts.pk]
+        returning = [opts.get_field('product'), opts.get_field('warehouse')]
+        rows = manager._insert(objs, fields, returning_fields=returning, on_conflict=OnConflict.IGNORE, using=self.db)
+        # у одиночной вставки пропущенная строка возвращается как None
+        return {tuple(row) for row in rows if row is not None}
+
+    insert_missing.alters_data = True
+
+
+# Строка ниже порога дозаказа; то же условие у частичного индекса inventory_low_stock_idx.
+# У шардированных строк количество без слотов ничего не говорит, они проверяются отдельно (см. warehouses.alerts)
+LOW_STOCK = Q(slots=0, quantity__lt=F('reorder_level'))
+
+
 class Inventory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
     quantity = models.IntegerField()
-        
+    # порог дозаказа: остаток ниже него — «мало товара» (см. warehouses.alerts); None — без порога
+    reorder_level = models.PositiveIntegerField(null=True, blank=True)
+    # сумма активных резервов (StockReservation); меняется только условными UPDATE в warehouses.reservations
+    reserved = models.PositiveIntegerField(default=0)
+    # хранится в строке, чтобы проверка резерва была одним условным UPDATE по уникальному индексу
+    available = models.GeneratedField(
+        expression=F('quantity') - F('reserved'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    # число слотов InventorySlot у «горячей» строки (0 — обычная строка); меняется
+    # только через warehouses.slots, чтобы остаток не терялся при смене режима
+    slots = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = InventoryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'warehouse'], name='unique_inventory_product_warehouse'),
+        ]
+        indexes = [
+            # в индексе только строки ниже порога: /inventory/low-stock/ не читает остальную таблицу
+            models.Index(fields=['warehouse', 'id'], condition=LOW_STOCK, name='inventory_low_stock_idx'),
+            models.Index(fields=['id'], condition=Q(slots__gt=0), name='inventory_sharded_idx'),
+        ]
+
+    # Количество, загруженное из БД или сохранённое последним; нужно, чтобы
+    # считать приращения остатков без дополнительного SELECT перед записью.
+    loaded_quantity = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # save() загруженной строки не должен перезаписывать reserved, изменённый параллельным резервом
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated and field.name not in ('reserved', 'slots')
+            ]
+        if not self._state.adding and self.slots:
+            self._fold_slots(kwargs.get('using'))
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        if self.slots:
+            self._fold_slots(kwargs.get('using'))
+        return super().delete(*args, **kwargs)
+
+    def _fold_slots(self, using):
+        # количество строки задаётся целиком, поэтому остаток слотов сначала переносится в неё
+        using = using or router.db_for_write(type(self), instance=self)
+        moved = type(self).objects.using(using).filter(pk=self.pk).fold_slots().get(self.pk, 0)
+        if self.loaded_quantity is not None:
+            self.loaded_quantity += moved
+
     def __str__(self):
         return f"{self.product.name} @ {self.warehouse.name} = {self.quantity}"
 
+class InventorySlot(models.Model):
+    """
+    Часть свободного остатка «горячей» строки Inventory (Inventory.slots > 0).
+    Перемещения списывают и зачисляют количество на случайный слот, а не на
+    саму строку, поэтому параллельные переводы одного товара не ждут одну
+    блокировку. Количество строки — quantity строки плюс сумма её слотов;
+    manage.py compact_inventory_slots выравнивает слоты (см. warehouses.slots).
+    """
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='slot_rows')
+    slot = models.PositiveSmallIntegerField()
+    # неотрицательность проверяет и сама база: условное списание не уводит слот в минус
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['inventory', 'slot'], name='unique_inventory_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_id}#{self.slot} = {self.quantity}"
+
+
+def live_quantity():
+    """Количество строки вместе с остатком слотов (подзапрос считается только для шардированных строк)."""
+    slotted = Subquery(
+        InventorySlot.objects.filter(inventory=OuterRef('pk'))
+        .values('inventory').annotate(total=Sum('quantity')).values('total')
+    )
+    return Case(
+        When(slots=0, then=F('quantity')),
+        default=F('quantity') + Coalesce(slotted, 0),
+        output_field=models.IntegerField(),
+    )
+
+
 class InventoryLog(models.Model):
     OPERATION_CHOICES = [
         ('add', 'Добавление'),
@@ -37,12 +374,96 @@ class InventoryLog(models.Model):
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # время изменения остатка, а не записи: журнал пишется после фиксации
+    # (warehouses.audit), и порядок записей по id может расходиться с порядком изменений
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['warehouse', 'created_at'], name='inventorylog_wh_created_idx'),
+            models.Index(fields=['product', 'created_at'], name='inventorylog_prod_created_idx'),
+            models.Index(fields=['created_at'], name='inventorylog_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.operation} {self.product.name} x{self.quantity} at {self.warehouse.name}"
 
 
+class ChangeFeedWatermark(models.Model):
+    """
+    Граница ленты изменений (warehouses.changefeed): id последней записи
+    InventoryLog, зафиксированной вместе с этой строкой. Строка одна.
+    """
+    last_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"InventoryLog <= {self.last_id}"
+
+
+class ProductStockTotal(models.Model):
+    """Поддерживаемая сумма остатков товара по всем складам (для /inventory/summary)."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stock_total')
+    total_quantity = models.BigIntegerField(default=0)
+    inventory_rows = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['total_quantity'], name='stock_total_quantity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} = {self.total_quantity}"
+
+
+class InventoryLogRollup(models.Model):
+    """
+    Дневная сводка InventoryLog по паре (товар, склад) для периодов, сырые
+    записи которых удалены политикой хранения (manage.py manage_log_partitions).
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    closing_quantity = models.IntegerField()
+    net_change = models.BigIntegerField()
+    entries = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product', 'warehouse'], name='unique_inventorylog_rollup_day'),
+        ]
+        indexes = [
+            models.Index(fields=['warehouse', 'day'], name='inventorylog_rollup_wh_idx'),
+            models.Index(fields=['product', 'day'], name='inventorylog_rollup_prod_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id} @ {self.warehouse_id}: {self.net_change:+} -> {self.closing_quantity}"
+
+
+class InventorySnapshot(models.Model):
+    """
+    Полный снимок остатков на момент taken_at (manage.py snapshot_inventory, раз в сутки).
+    Остатки на произвольный момент — ближайший более ранний снимок плюс InventoryLog
+    после него (см. warehouses.history).
+    """
+    taken_at = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['taken_at', 'warehouse', 'product'], name='unique_inventory_snapshot_row'),
+        ]
+        indexes = [
+            models.Index(fields=['taken_at', 'product'], name='inventory_snapshot_prod_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.taken_at:%Y-%m-%d %H:%M} {self.product_id} @ {self.warehouse_id} = {self.quantity}"
+
+
 class TransferLog(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     from_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='from_warehouse')
@@ -50,5 +471,159 @@ class TransferLog(models.Model):
     quantity = models.IntegerField(default=0)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_warehouse', 'timestamp'], name='transferlog_from_ts_idx'),
+            models.Index(fields=['to_warehouse', 'timestamp'], name='transferlog_to_ts_idx'),
+            models.Index(fields=['product', 'timestamp'], name='transferlog_prod_ts_idx'),
+            models.Index(fields=['timestamp'], name='transferlog_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} @ {self.from_warehouse.name} --> {self.to_warehouse} = {self.quantity}"
+
+class IdempotencyKey(models.Model):
+    """
+    Ответ на запрос с заголовком Idempotency-Key: повтор с тем же ключом
+    возвращает сохранённый ответ, не выполняя операцию снова (см. warehouses.idempotency).
+    Просроченные ключи удаляются командой manage.py purge_idempotency_keys.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} -> {self.response_status}"
+
+
+class StockReservation(models.Model):
+    """
+    Резерв товара на складе до expires_at: пока он активен, его количество входит
+    в Inventory.reserved и недоступно для перемещений и других резервов.
+    Просроченные резервы снимает manage.py expire_reservations.
+    """
+    ACTIVE = 'active'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Активен'),
+        (CONFIRMED, 'Подтверждён'),
+        (RELEASED, 'Снят'),
+        (EXPIRED, 'Истёк'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    # склад назначения, если резерв подтверждён перемещением, а не списанием
+    to_warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.SET_NULL, null=True, blank=True, related_name='confirmed_reservations'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], condition=Q(status='active'), name='reservation_active_expiry_idx'),
+            models.Index(fields=['user', 'created_at'], name='reservation_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.warehouse_id} x{self.quantity} ({self.status})"
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка CSV: запрос ставит задание в очередь, manage.py run_export_jobs
+    выполняет его и пишет gzip-файл в EXPORT_JOBS_DIR (см. warehouses.jobs).
+    """
+    INVENTORY = 'inventory'
+    INVENTORY_LOGS = 'inventory_logs'
+    KIND_CHOICES = [
+        (INVENTORY, 'Остатки'),
+        (INVENTORY_LOGS, 'Журнал остатков'),
+    ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # параметры выгрузки в том же виде, что у синхронных эндпоинтов
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # имя файла в EXPORT_JOBS_DIR
+    artifact = models.CharField(max_length=255, blank=True)
+    rows = models.PositiveBigIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # обновляется во время выгрузки; задание без пульса дольше EXPORT_JOB_TIMEOUT возвращается в очередь
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], condition=Q(status='queued'), name='export_job_queued_idx'),
+            models.Index(fields=['heartbeat_at'], condition=Q(status='running'), name='export_job_running_idx'),
+            models.Index(fields=['user', 'created_at'], name='export_job_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class StockAlert(models.Model):
+    """
+    Пересечение порога дозаказа, найденное при записи остатка; ждёт отправки
+    вебхуком (manage.py dispatch_stock_alerts, см. warehouses.alerts).
+    """
+    LOW = 'low'
+    RECOVERED = 'recovered'
+    STATE_CHOICES = [
+        (LOW, 'Ниже порога'),
+        (RECOVERED, 'Восстановлен'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES)
+    quantity = models.IntegerField()
+    reorder_level = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], condition=Q(dispatched_at__isnull=True), name='stock_alert_pending_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.product.name} @ {self.from_warehouse.name} --> {self.to_warehouse} = {self.quantity}"
\ No newline at end of file
+        return f"{self.product_id} @ {self.warehouse_id}: {self.state} ({self.quantity} < {self.reorder_level})"
@@ -0,0 +1,218 @@
+from base64 import b64decode, b64encode
+from urllib.parse import parse_qs, urlencode
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# курсоры KeysetPagination помечены этим токеном: курсор CursorPagination
+# в асинхронном режиме и наоборот отклоняются, а не листают не с того места
+KEYSET_TOKEN = 'k'
+FOREIGN_CURSOR_MESSAGE = (
+    "Cursor was issued by another pagination of this endpoint (another WAREHOUSES_API_MODE or as_of); "
+    "start again from the first page."
+)
+
+
+class ForeignCursor(ValueError):
+    pass
+
+
+def cursor_tokens(encoded):
+    """Токены курсора (base64 от query string); ValueError, если курсор не разобрать."""
+    try:
+        return parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+class SyncCursorMixin:
+    """CursorPagination, отклоняющая курсоры KeysetPagination с 400."""
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is not None:
+            try:
+                foreign = KEYSET_TOKEN in cursor_tokens(encoded)
+            except ValueError:
+                foreign = False
+            if foreign:
+                raise ParseError(FOREIGN_CURSOR_MESSAGE)
+        return super().decode_cursor(request)
+
+
+class StockSummaryPagination(SyncCursorMixin, CursorPagination):
+    ordering = 'product_id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class LogCursorPagination(SyncCursorMixin, CursorPagination):
+    # журналы только дополняются, поэтому курсор стабилен; размер страницы ограничен сверху
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class InventoryLogPagination(LogCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class InventoryLogRollupPagination(LogCursorPagination):
+    ordering = ('-day', '-id')
+
+
+class TransferLogPagination(LogCursorPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class StockReservationPagination(LogCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class ExportJobPagination(LogCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class LowStockPagination(LogCursorPagination):
+    ordering = 'id'
+
+
+class WarehouseInventoryPagination(PageNumberPagination):
+    # включается только при наличии ?page= или ?page_size=, иначе выдача целиком, как раньше
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def page_links(request, pagination, page):
+    """Ссылки next/previous как у PageNumberPagination."""
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if page.has_next():
+        next_url = replace_query_param(url, pagination.page_query_param, page.next_page_number())
+    if page.has_previous():
+        previous_url = replace_query_param(url, pagination.page_query_param, page.previous_page_number())
+        if page.previous_page_number() == 1:
+            previous_url = remove_query_param(url, pagination.page_query_param)
+    return next_url, previous_url
+
+
+def cached_page(page, results):
+    """Страница выдачи склада для кэша: без ссылок, они зависят от хоста запроса."""
+    return {"count": page.paginator.count, "page": page.number, "page_size": page.paginator.per_page, "results": results}
+
+
+def listing_page(request, cached):
+    """Ответ PageNumberPagination из cached_page() со ссылками на адрес текущего запроса."""
+    page = Paginator(range(cached["count"]), cached["page_size"]).page(cached["page"])
+    next_url, previous_url = page_links(request, WarehouseInventoryPagination, page)
+    return {"count": cached["count"], "next": next_url, "previous": previous_url, "results": cached["results"]}
+
+
+class KeysetPagination:
+    """
+    Курсорная пагинация для асинхронных представлений (warehouses.async_views).
+
+    Страница выбирается условием по ключу сортировки, без OFFSET. Курсор —
+    base64 от k=1&p=<позиция>, плюс i=<id> для составного ключа; с курсором
+    CursorPagination он несовместим, и курсоры другого режима
+    (WAREHOUSES_API_MODE) отклоняются с 400 в обе стороны. Ссылка есть только
+    на следующую страницу. Последнее поле ordering должно быть уникальным.
+    """
+    ordering = ('id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    position_tokens = ('p', 'i')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        """Позиция курсора как значения полей ordering или None; ValueError для битого курсора."""
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        tokens = cursor_tokens(encoded)
+        if KEYSET_TOKEN not in tokens:
+            raise ForeignCursor(FOREIGN_CURSOR_MESSAGE)
+        try:
+            return tuple(
+                model._meta.get_field(field.lstrip('-')).to_python(tokens[token][0])
+                for field, token in zip(self.ordering, self.position_tokens)
+            )
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise ValueError("Invalid cursor")
+
+    def filter_after(self, queryset, position):
+        names = [field.lstrip('-') for field in self.ordering]
+        lookups = ['lt' if field.startswith('-') else 'gt' for field in self.ordering]
+        if len(names) == 1:
+            return queryset.filter(**{f'{names[0]}__{lookups[0]}': position[0]})
+        return queryset.filter(
+            Q(**{f'{names[0]}__{lookups[0]}': position[0]})
+            | Q(**{names[0]: position[0], f'{names[1]}__{lookups[1]}': position[1]})
+        )
+
+    async def paginate(self, queryset, request):
+        """Возвращает (строки страницы, ссылка на следующую страницу или None); queryset — values()."""
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = self.filter_after(queryset, position)
+
+        rows = [row async for row in queryset.order_by(*self.ordering)[:page_size + 1]]
+        return self._page(rows, page_size, request)
+
+    def paginate_rows(self, rows, request, model):
+        """
+        То же для списка словарей, уже отсортированного по ordering; поддерживается
+        только ordering из одного поля по возрастанию. model нужна для разбора курсора.
+        """
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, model)
+        if position is not None:
+            rows = [row for row in rows if row[self.ordering[0]] > position[0]]
+        return self._page(rows[:page_size + 1], page_size, request)
+
+    def _page(self, rows, page_size, request):
+        if len(rows) <= page_size:
+            return rows, None
+
+        rows = rows[:page_size]
+        tokens = {KEYSET_TOKEN: '1'}
+        tokens.update(
+            (token, str(rows[-1][field.lstrip('-')]))
+            for field, token in zip(self.ordering, self.position_tokens)
+        )
+        cursor = b64encode(urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return rows, replace_query_param(request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+
+class StockSummaryKeysetPagination(KeysetPagination):
+    ordering = ('product_id',)
+
+
+class InventoryLogKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class InventoryLogRollupKeysetPagination(KeysetPagination):
+    ordering = ('-day', '-id')
+
+
+class TransferLogKeysetPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
@@ -0,0 +1,38 @@
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """Потоково разбирает CSV с заголовком: request.data — генератор словарей по строкам."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return csv.DictReader(codecs.iterdecode(stream, encoding))
+
+
+class JSONLinesParser(BaseParser):
+    """
+    Потоково разбирает JSON Lines: по объекту на строку. Строки, которые не
+    разбираются как JSON, отдаются как есть, чтобы импорт сообщил об ошибке строки.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return self._rows(codecs.iterdecode(stream, encoding))
+
+    @staticmethod
+    def _rows(lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
@@ -0,0 +1,366 @@
+"""
+Помесячное декларативное секционирование InventoryLog и TransferLog в PostgreSQL
+и свёртка старых записей InventoryLog в дневные сводки InventoryLogRollup.
+
+На других СУБД (SQLite в тестах) таблицы остаются обычными: политика хранения
+сворачивает и удаляет строки пачками вместо отсоединения секций.
+
+Строки вне помесячных секций попадают в секцию DEFAULT. При создании секции
+месяца её строки переносятся из DEFAULT, а ensure_partitions разносит всю
+DEFAULT по месяцам, чтобы политика хранения видела каждую строку.
+"""
+import re
+from datetime import date, datetime, time, timezone
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils.timezone import now
+
+from warehouses.models import InventoryLog, InventoryLogRollup
+
+# (таблица, столбец ключа секционирования)
+PARTITIONED_TABLES = [
+    ('warehouses_inventorylog', 'created_at'),
+    ('warehouses_transferlog', 'timestamp'),
+]
+
+PARTITION_NAME_RE = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def utc_today():
+    # границы секций — в UTC (as_datetime), поэтому и текущий день берётся в UTC, а не по часам сервера
+    return now().date()
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def as_datetime(value):
+    return datetime.combine(value, time.min, tzinfo=timezone.utc)
+
+
+def partition_name(table, start):
+    return f'{table}_y{start.year}m{start.month:02d}'
+
+
+def partition_column(table):
+    return dict(PARTITIONED_TABLES)[table]
+
+
+def supports_partitioning(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'postgresql'
+
+
+def is_partitioned(table, using=DEFAULT_DB_ALIAS):
+    if not supports_partitioning(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def monthly_partitions(table, using=DEFAULT_DB_ALIAS):
+    """Список (начало месяца, имя секции) для помесячных секций таблицы, по возрастанию."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.search(name)
+        if match:
+            partitions.append((date(int(match[1]), int(match[2]), 1), name))
+    return sorted(partitions)
+
+
+def default_partition(cursor, table):
+    """Имя секции DEFAULT таблицы или None."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partdefid "
+        "WHERE p.partrelid = %s::regclass",
+        [table],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partition(cursor, quote_name, table, column, start):
+    """
+    Создаёт секцию месяца start, если её нет. PostgreSQL не создаёт секцию, пока
+    строки её диапазона лежат в DEFAULT, поэтому при наличии DEFAULT секция
+    создаётся отдельной таблицей, строки месяца переносятся в неё из DEFAULT
+    и она подключается ATTACH PARTITION. Вызывается внутри транзакции.
+    """
+    name = partition_name(table, start)
+    bounds = [as_datetime(start), as_datetime(add_months(start, 1))]
+    default = default_partition(cursor, table)
+    if default is None:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote_name(name)} "
+            f"PARTITION OF {quote_name(table)} FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        return
+
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0] is not None:
+        return
+    # до ATTACH в DEFAULT не должны попасть новые строки этого месяца
+    cursor.execute(f"LOCK TABLE {quote_name(default)} IN ACCESS EXCLUSIVE MODE")
+    cursor.execute(f"CREATE TABLE {quote_name(name)} (LIKE {quote_name(table)} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {quote_name(default)} "
+        f"WHERE {quote_name(column)} >= %s AND {quote_name(column)} < %s RETURNING *) "
+        f"INSERT INTO {quote_name(name)} SELECT * FROM moved",
+        bounds,
+    )
+    cursor.execute(
+        f"ALTER TABLE {quote_name(table)} ATTACH PARTITION {quote_name(name)} FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+
+
+def drain_default_partition(cursor, quote_name, table, column):
+    """Разносит строки секции DEFAULT по помесячным секциям, создавая их. Возвращает начала месяцев."""
+    default = default_partition(cursor, table)
+    if default is None:
+        return []
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', {quote_name(column)} AT TIME ZONE 'UTC') FROM {quote_name(default)}"
+    )
+    months = sorted(month_start(row[0]) for row in cursor.fetchall())
+    for month in months:
+        create_partition(cursor, quote_name, table, column, month)
+    return months
+
+
+def ensure_partitions(table, months_ahead=3, using=DEFAULT_DB_ALIAS, today=None):
+    """
+    Создаёт секции с текущего месяца (UTC) на months_ahead месяцев вперёд и
+    секции месяцев, строки которых лежат в DEFAULT. Возвращает имена новых.
+    """
+    connection = connections[using]
+    column = partition_column(table)
+    existing = {name for _, name in monthly_partitions(table, using)}
+    start = month_start(today or utc_today())
+    months = [add_months(start, offset) for offset in range(months_ahead + 1)]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for month in months:
+            create_partition(cursor, connection.ops.quote_name, table, column, month)
+        months += drain_default_partition(cursor, connection.ops.quote_name, table, column)
+    return sorted({partition_name(table, month) for month in months} - existing)
+
+
+def remove_partition(table, name, drop=True, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {quote_name(table)} DETACH PARTITION {quote_name(name)}")
+        if drop:
+            cursor.execute(f"DROP TABLE {quote_name(name)}")
+
+
+def convert_to_partitioned(schema_editor, model, column, months_ahead=2):
+    """
+    Пересоздаёт таблицу модели как секционированную по диапазону column.
+
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому он становится (id, column); id по-прежнему берётся из последовательности.
+    """
+    quote_name = schema_editor.quote_name
+    table = model._meta.db_table
+    legacy = f'{table}_unpartitioned'
+    sequence = f'{table}_pid_seq'
+
+    schema_editor.execute(f"ALTER TABLE {quote_name(table)} RENAME TO {quote_name(legacy)}")
+    schema_editor.execute(f"CREATE SEQUENCE {quote_name(sequence)}")
+    schema_editor.execute(
+        f"CREATE TABLE {quote_name(table)} (LIKE {quote_name(legacy)} INCLUDING DEFAULTS, "
+        f"CONSTRAINT {quote_name(table + '_partitioned_pk')} PRIMARY KEY (id, {quote_name(column)})) "
+        f"PARTITION BY RANGE ({quote_name(column)})"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {quote_name(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')"
+    )
+    schema_editor.execute(f"ALTER SEQUENCE {quote_name(sequence)} OWNED BY {quote_name(table)}.id")
+    schema_editor.execute(
+        f"CREATE TABLE {quote_name(table + '_default')} PARTITION OF {quote_name(table)} DEFAULT"
+    )
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({quote_name(column)}) FROM {quote_name(legacy)}")
+        oldest = cursor.fetchone()[0]
+        month = month_start(oldest or utc_today())
+        last = add_months(month_start(utc_today()), months_ahead)
+        while month <= last:
+            create_partition(cursor, quote_name, table, column, month)
+            month = add_months(month, 1)
+
+    schema_editor.execute(f"INSERT INTO {quote_name(table)} SELECT * FROM {quote_name(legacy)}")
+    schema_editor.execute(
+        f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {quote_name(table)}), 0) + 1, false)"
+    )
+    schema_editor.execute(f"DROP TABLE {quote_name(legacy)}")
+    _add_constraints(schema_editor, model)
+
+
+def convert_to_unpartitioned(schema_editor, model, column):
+    """
+    Обратное convert_to_partitioned: обычная таблица с первичным ключом id
+    (identity, как у таблиц Django) со строками всех секций, включая DEFAULT.
+    """
+    quote_name = schema_editor.quote_name
+    table = model._meta.db_table
+    partitioned = f'{table}_partitioned'
+
+    schema_editor.execute(f"ALTER TABLE {quote_name(table)} RENAME TO {quote_name(partitioned)}")
+    # без INCLUDING DEFAULTS: значение id по умолчанию берётся из последовательности, которая удалится с таблицей
+    schema_editor.execute(f"CREATE TABLE {quote_name(table)} (LIKE {quote_name(partitioned)})")
+    schema_editor.execute(f"INSERT INTO {quote_name(table)} SELECT * FROM {quote_name(partitioned)}")
+    # секции удаляются вместе с родительской таблицей
+    schema_editor.execute(f"DROP TABLE {quote_name(partitioned)}")
+    schema_editor.execute(f"ALTER TABLE {quote_name(table)} ADD PRIMARY KEY (id)")
+    schema_editor.execute(f"ALTER TABLE {quote_name(table)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+    schema_editor.execute(
+        f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {quote_name(table)}), 0) + 1, false)",
+        [table],
+    )
+    _add_constraints(schema_editor, model)
+
+
+def _add_constraints(schema_editor, model):
+    quote_name = schema_editor.quote_name
+    table = model._meta.db_table
+    for field in model._meta.concrete_fields:
+        if field.remote_field:
+            schema_editor.execute(
+                f"ALTER TABLE {quote_name(table)} ADD CONSTRAINT {quote_name(f'{table}_{field.column}_fk')} "
+                f"FOREIGN KEY ({quote_name(field.column)}) "
+                f"REFERENCES {quote_name(field.remote_field.model._meta.db_table)} "
+                f"({quote_name(field.target_field.column)}) "
+                f"DEFERRABLE INITIALLY DEFERRED"
+            )
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def rollup_inventory_logs(start, end, chunk_size=2000, using=DEFAULT_DB_ALIAS):
+    """
+    Сворачивает InventoryLog за [start, end) в дневные сводки по паре (товар, склад).
+
+    InventoryLog хранит количество после операции, поэтому closing_quantity — значение
+    последней по времени изменения записи дня (не по id: записи пишутся после
+    фиксации, warehouses.audit), а net_change — разница с закрытием предыдущего дня пары
+    (из уже свёрнутых сводок для первого дня диапазона). Повторный запуск идемпотентен.
+    Возвращает число записанных сводок.
+    """
+    logs = (
+        InventoryLog.objects.using(using)
+        .filter(created_at__gte=as_datetime(start), created_at__lt=as_datetime(end))
+        .annotate(day=TruncDate('created_at'))
+    )
+    groups = (
+        logs.values('product_id', 'warehouse_id', 'day')
+        .annotate(entries=Count('id'))
+        .order_by('product_id', 'warehouse_id', 'day')
+    )
+
+    written = 0
+    carried = {}
+    batch = []
+    for group in groups.iterator(chunk_size=chunk_size):
+        batch.append(group)
+        if len(batch) >= chunk_size:
+            written += _write_rollups(logs, batch, start, carried, using)
+            batch = []
+    if batch:
+        written += _write_rollups(logs, batch, start, carried, using)
+    return written
+
+
+def _write_rollups(logs, batch, start, carried, using):
+    closing = {
+        (product_id, warehouse_id, day): quantity
+        for product_id, warehouse_id, day, quantity in logs.filter(
+            product_id__in={group['product_id'] for group in batch},
+            warehouse_id__in={group['warehouse_id'] for group in batch},
+            day__in={group['day'] for group in batch},
+        ).annotate(position=Window(
+            RowNumber(),
+            partition_by=[F('product_id'), F('warehouse_id'), F('day')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )).filter(position=1).values_list('product_id', 'warehouse_id', 'day', 'quantity')
+    }
+
+    pairs = {(group['product_id'], group['warehouse_id']) for group in batch} - carried.keys()
+    if pairs:
+        previous = (
+            InventoryLogRollup.objects.using(using)
+            .filter(
+                day__lt=start,
+                product_id__in={product_id for product_id, _ in pairs},
+                warehouse_id__in={warehouse_id for _, warehouse_id in pairs},
+            )
+            .annotate(position=Window(
+                RowNumber(),
+                partition_by=[F('product_id'), F('warehouse_id')],
+                order_by=F('day').desc(),
+            ))
+            .filter(position=1)
+            .values_list('product_id', 'warehouse_id', 'closing_quantity')
+        )
+        for product_id, warehouse_id, quantity in previous:
+            if (product_id, warehouse_id) in pairs:
+                carried[product_id, warehouse_id] = quantity
+
+    rollups = []
+    for group in batch:
+        pair = (group['product_id'], group['warehouse_id'])
+        quantity = closing[pair + (group['day'],)]
+        rollups.append(InventoryLogRollup(
+            day=group['day'],
+            product_id=pair[0],
+            warehouse_id=pair[1],
+            closing_quantity=quantity,
+            net_change=quantity - carried.get(pair, 0),
+            entries=group['entries'],
+        ))
+        carried[pair] = quantity
+
+    # группы упорядочены по паре, поэтому в следующую пачку переносится только последняя пара
+    last = rollups[-1]
+    carried.clear()
+    carried[last.product_id, last.warehouse_id] = last.closing_quantity
+
+    with transaction.atomic(using=using):
+        InventoryLogRollup.objects.using(using).bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['day', 'product', 'warehouse'],
+            update_fields=['closing_quantity', 'net_change', 'entries'],
+        )
+    return len(rollups)
+
+
+def delete_before(model, column, cutoff, chunk_size=10000, using=DEFAULT_DB_ALIAS):
+    """Удаляет строки старше cutoff пачками по первичному ключу (для СУБД без секций)."""
+    deleted = 0
+    queryset = model._base_manager.using(using).filter(**{f'{column}__lt': as_datetime(cutoff)})
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += model._base_manager.using(using).filter(pk__in=pks).delete()[0]
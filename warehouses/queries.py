@@ -0,0 +1,130 @@
+"""
+Запросы горячих эндпоинтов чтения, общие для синхронных (warehouses.views)
+и асинхронных (warehouses.async_views) представлений.
+"""
+from django.db.models import F
+from rest_framework import serializers
+
+from warehouses.models import Inventory, ProductStockTotal
+
+_datetime_field = serializers.DateTimeField()
+
+# live_quantity, live_available — вместе со слотами шардированных строк (InventoryQuerySet.with_slot_totals)
+INVENTORY_LISTING_FIELDS = ('product_id', 'product__name', 'product__sku', 'live_quantity', 'live_available')
+
+
+def warehouse_inventory(warehouse_id, product_ids=None):
+    inventories = Inventory.objects.with_slot_totals().filter(warehouse=warehouse_id)
+    if product_ids is not None:
+        inventories = inventories.filter(product__in=product_ids)
+    return inventories.values_list(*INVENTORY_LISTING_FIELDS)
+
+
+def inventory_listing_row(row):
+    product_id, name, sku, quantity, available = row
+    return {
+        "product_id": product_id,
+        "name": name,
+        "sku": sku,
+        "quantity": quantity,
+        "available": available
+    }
+
+
+def stock_summary(params):
+    """Итоги по товарам с фильтрами sku_prefix, min_total, max_total; ValueError при нецелых границах."""
+    # итоги по товарам поддерживаются инкрементально в ProductStockTotal (см. warehouses.stock_totals)
+    totals = ProductStockTotal.objects.filter(inventory_rows__gt=0).values(
+        'product_id', 'total_quantity', name=F('product__name'), sku=F('product__sku'),
+    )
+
+    sku_prefix = params.get('sku_prefix')
+    if sku_prefix:
+        totals = totals.filter(product__sku__startswith=sku_prefix)
+
+    min_total = params.get('min_total')
+    if min_total is not None:
+        totals = totals.filter(total_quantity__gte=int(min_total))
+    max_total = params.get('max_total')
+    if max_total is not None:
+        totals = totals.filter(total_quantity__lte=int(max_total))
+    return totals
+
+
+def stock_summary_row(item):
+    return {
+        "product_id": item["product_id"],
+        "name": item["name"],
+        "sku": item["sku"],
+        "total_quantity": item["total_quantity"]
+    }
+
+
+# Строки списков без сериализаторов: те же ключи и порядок, что у сериализаторов из warehouses.serializers
+
+INVENTORY_FIELDS = (
+    'id', 'product_id', 'product__name', 'warehouse_id', 'warehouse__name', 'live_quantity', 'reserved',
+    'live_available', 'reorder_level',
+)
+
+
+def inventory_row(row):
+    return {
+        "id": row[0],
+        "product": row[1],
+        "product_name": row[2],
+        "warehouse": row[3],
+        "warehouse_name": row[4],
+        "quantity": row[5],
+        "reserved": row[6],
+        "available": row[7],
+        "reorder_level": row[8],
+    }
+
+
+def low_stock_row(item):
+    # словарь из values(): CursorPagination берёт позицию курсора из полей строки
+    row = inventory_row([item[field] for field in INVENTORY_FIELDS])
+    row["shortage"] = item['reorder_level'] - item['live_quantity']
+    return row
+
+
+TRANSFER_LOG_FIELDS = ('id', 'quantity', 'timestamp', 'product_id', 'from_warehouse_id', 'to_warehouse_id')
+
+
+def transfer_log_row(item):
+    return {
+        "id": item["id"],
+        "quantity": item["quantity"],
+        "timestamp": _datetime_field.to_representation(item["timestamp"]),
+        "product": item["product_id"],
+        "from_warehouse": item["from_warehouse_id"],
+        "to_warehouse": item["to_warehouse_id"],
+    }
+
+
+PRODUCT_FIELDS = ('id', 'name', 'sku')
+
+
+def product_rows(rows):
+    """Строки товаров со списком складов: одним запросом к Inventory на всю страницу."""
+    rows = list(rows)
+    warehouses = {product_id: [] for product_id, _, _ in rows}
+    pairs = (
+        Inventory.objects.filter(product_id__in=warehouses)
+        .order_by('product_id', 'warehouse_id')
+        .values_list('product_id', 'warehouse_id')
+    )
+    for product_id, warehouse_id in pairs:
+        warehouses[product_id].append(warehouse_id)
+    return [
+        {"id": product_id, "name": name, "sku": sku, "warehouses": warehouses[product_id]}
+        for product_id, name, sku in rows
+    ]
+
+
+WAREHOUSE_FIELDS = ('id', 'name', 'location')
+
+
+def warehouse_row(row):
+    return {"id": row[0], "name": row[1], "location": row[2]}
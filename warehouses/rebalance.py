@@ -0,0 +1,160 @@
+"""
+Планировщик выравнивания остатков между складами.
+
+Правила задают для склада (всех его товаров или одного товара) границы
+[min, max] либо целевой уровень target (min = max = target). Матрица
+доступных остатков (товары × склады, available вместе со слотами) загружается одним
+запросом в массивы numpy, дефициты и излишки считаются по всей матрице сразу,
+а перемещения подбираются жадно только для товаров, где что-то нарушено:
+крупнейший донор отдаёт крупнейшему получателю, пока одна из сторон не
+исчерпана. Так каждое перемещение закрывает хотя бы одного донора или
+получателя, и перемещений в плане не больше, чем доноров и получателей вместе.
+
+Порядок доноров: сначала излишек сверх max (его нужно вывезти в любом случае),
+затем свободный остаток над min у остальных складов. Излишек, который не ушёл
+на покрытие дефицитов, везётся на склады, где есть место до max (склады без
+max — в первую очередь).
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from warehouses.models import Inventory
+
+# без max: «место» на складе не ограничено
+UNBOUNDED = np.iinfo(np.int64).max // 4
+# больше перемещений за раз не применяется (как и у /transfer/batch/)
+APPLY_LIMIT = 1000
+
+Rule = namedtuple('Rule', ['warehouse_id', 'product_id', 'min', 'max'])
+Transfer = namedtuple('Transfer', ['product_id', 'from_warehouse_id', 'to_warehouse_id', 'quantity'])
+Shortfall = namedtuple('Shortfall', ['product_id', 'warehouse_id', 'quantity'])
+
+
+class Plan:
+    __slots__ = ('transfers', 'unmet', 'unplaced', 'products', 'warehouses')
+
+    def __init__(self, transfers, unmet, unplaced, products, warehouses):
+        self.transfers = transfers
+        # дефициты, которые нечем покрыть
+        self.unmet = unmet
+        # излишки сверх max, которые некуда вывезти
+        self.unplaced = unplaced
+        self.products = products
+        self.warehouses = warehouses
+
+    @property
+    def moved_quantity(self):
+        return sum(transfer.quantity for transfer in self.transfers)
+
+    def as_dict(self):
+        return {
+            "transfers": [transfer._asdict() for transfer in self.transfers],
+            "moved_quantity": self.moved_quantity,
+            "unmet": [shortfall._asdict() for shortfall in self.unmet],
+            "unplaced": [shortfall._asdict() for shortfall in self.unplaced],
+            "products": self.products,
+            "warehouses": self.warehouses,
+        }
+
+
+def load_matrix(warehouse_ids, product_ids=None, include=()):
+    """
+    (id товаров, матрица available товары × склады) одним запросом. Без
+    product_ids берутся все товары, у которых есть строки Inventory в выбранных
+    складах; товары из include попадают в матрицу и без строк (нулевой остаток).
+    """
+    inventory = Inventory.objects.filter(warehouse_id__in=warehouse_ids)
+    if product_ids is not None:
+        inventory = inventory.filter(product_id__in=product_ids)
+    rows = np.array(
+        list(inventory.with_slot_totals().values_list('product_id', 'warehouse_id', 'live_available')), dtype=np.int64,
+    )
+    rows = rows.reshape(-1, 3)
+
+    products = np.union1d(rows[:, 0], np.fromiter(include, dtype=np.int64))
+    warehouses = np.asarray(warehouse_ids, dtype=np.int64)
+
+    matrix = np.zeros((len(products), len(warehouses)), dtype=np.int64)
+    matrix[np.searchsorted(products, rows[:, 0]), np.searchsorted(warehouses, rows[:, 1])] = rows[:, 2]
+    return products, matrix
+
+
+def bounds(rules, products, warehouses):
+    """Матрицы min и max; правило товара перекрывает правило склада."""
+    low = np.zeros((len(products), len(warehouses)), dtype=np.int64)
+    high = np.full((len(products), len(warehouses)), UNBOUNDED, dtype=np.int64)
+    product_index = {product_id: index for index, product_id in enumerate(products.tolist())}
+    warehouse_index = {warehouse_id: index for index, warehouse_id in enumerate(warehouses.tolist())}
+
+    for rule in sorted(rules, key=lambda rule: rule.product_id is not None):
+        column = warehouse_index[rule.warehouse_id]
+        row = slice(None) if rule.product_id is None else product_index[rule.product_id]
+        if rule.min is not None:
+            low[row, column] = rule.min
+        if rule.max is not None:
+            high[row, column] = rule.max
+    return low, high
+
+
+def _match(donors, receivers, product_id, warehouses, transfers):
+    """Жадно сводит [склад, количество] доноров и получателей (списки меняются на месте)."""
+    donors.sort(key=lambda item: -item[1])
+    receivers.sort(key=lambda item: -item[1])
+    donor = receiver = 0
+    while donor < len(donors) and receiver < len(receivers):
+        quantity = min(donors[donor][1], receivers[receiver][1])
+        if quantity > 0:
+            transfers.append(Transfer(product_id, warehouses[donors[donor][0]], warehouses[receivers[receiver][0]], quantity))
+            donors[donor][1] -= quantity
+            receivers[receiver][1] -= quantity
+        if donors[donor][1] == 0:
+            donor += 1
+        if receivers[receiver][1] == 0:
+            receiver += 1
+
+
+def plan(rules, warehouse_ids, product_ids=None):
+    """Строит Plan по правилам; warehouse_ids — все склады, между которыми можно возить."""
+    warehouses = np.unique(np.asarray(list(warehouse_ids), dtype=np.int64))
+    ruled = {rule.product_id for rule in rules if rule.product_id is not None}
+    if product_ids is not None:
+        product_ids = set(product_ids) | ruled
+    elif all(rule.product_id is not None for rule in rules):
+        # правил на весь склад нет: остальные товары не затронуты
+        product_ids = ruled
+    products, available = load_matrix(warehouses.tolist(), product_ids, include=product_ids or ruled)
+    low, high = bounds(rules, products, warehouses)
+
+    need = np.maximum(low - available, 0)
+    excess = np.maximum(available - high, 0)
+    spare = np.maximum(np.minimum(available, high) - low, 0)
+    # место считается после покрытия дефицита: излишек размещается, только когда все дефициты закрыты
+    room = np.where(high == UNBOUNDED, UNBOUNDED, np.maximum(high - np.maximum(available, low), 0))
+
+    transfers, unmet, unplaced = [], [], []
+    # дальше построчно на обычных int: поштучный доступ к массивам numpy медленнее списков
+    warehouse_list = warehouses.tolist()
+    for row in np.flatnonzero(need.any(axis=1) | excess.any(axis=1)).tolist():
+        product_id = int(products[row])
+        receivers = [[column, quantity] for column, quantity in enumerate(need[row].tolist()) if quantity]
+        forced = [[column, quantity] for column, quantity in enumerate(excess[row].tolist()) if quantity]
+        _match(forced, receivers, product_id, warehouse_list, transfers)
+
+        receivers = [item for item in receivers if item[1] > 0]
+        if receivers:
+            donors = [[column, quantity] for column, quantity in enumerate(spare[row].tolist()) if quantity]
+            _match(donors, receivers, product_id, warehouse_list, transfers)
+            unmet.extend(
+                Shortfall(product_id, warehouse_list[column], quantity) for column, quantity in receivers if quantity
+            )
+
+        forced = [item for item in forced if item[1] > 0]
+        if forced:
+            places = [[column, quantity] for column, quantity in enumerate(room[row].tolist()) if quantity]
+            _match(forced, places, product_id, warehouse_list, transfers)
+            unplaced.extend(
+                Shortfall(product_id, warehouse_list[column], quantity) for column, quantity in forced if quantity
+            )
+
+    return Plan(transfers, unmet, unplaced, len(products), len(warehouses))
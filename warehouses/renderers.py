@@ -0,0 +1,71 @@
+"""
+JSON-рендерер на orjson с той же выдачей, что у rest_framework.renderers.JSONRenderer
+в компактном режиме. Без установленного orjson (и для отступов из заголовка Accept)
+рендерит сам DRF.
+
+Колоночные отчёты ({"columns": {имя: список}}) также отдаются потоком Arrow IPC
+(?format=arrow), если установлен pyarrow.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            # даты, Decimal, ленивые строки и прочее — через кодировщик DRF, чтобы формат совпадал
+            content = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # как DRF: U+2028/U+2029 экранируются, чтобы ответ оставался валидным JavaScript
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ArrowRenderer(BaseRenderer):
+    """Колонки ответа одной таблицей Arrow; у ответов без колонок (ошибки) — строка из их полей."""
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if 'columns' in data:
+            table = pyarrow.table(data['columns'])
+            # параметры отчёта — в метаданных схемы
+            metadata = {key: str(value) for key, value in data.items() if key != 'columns'}
+            table = table.replace_schema_metadata(metadata)
+        else:
+            table = pyarrow.table({key: [str(value)] for key, value in data.items()})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def columnar_renderers():
+    """Рендереры отчётов с колоночной выдачей: по умолчанию плюс Arrow, если есть pyarrow."""
+    from rest_framework.settings import api_settings
+
+    return [*api_settings.DEFAULT_RENDERER_CLASSES, *([ArrowRenderer] if pyarrow is not None else [])]
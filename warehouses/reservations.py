@@ -0,0 +1,176 @@
+"""
+Резервирование остатков с истечением срока.
+
+Резерв увеличивает Inventory.reserved одним условным UPDATE
+(... SET reserved = reserved + n WHERE product = ? AND warehouse = ? AND available >= n)
+по уникальному индексу (товар, склад): без SELECT ... FOR UPDATE, поэтому
+резервы на «горячий» товар не выстраиваются в очередь блокировок дольше самой записи.
+Подтверждение списывает удержанное количество или перемещает его на другой склад,
+снятие и истечение возвращают его в available.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from warehouses import inventory_cache
+from warehouses.changes import InventoryChange, inventory_changed
+from warehouses.models import Inventory, StockReservation, live_quantity
+from warehouses.transfers import TransferRejected, apply_transfer, _pairs_filter
+
+
+class ReservationRejected(Exception):
+    """Отказ операции с резервом: error — текст ответа, status — HTTP-статус."""
+
+    def __init__(self, error, status):
+        super().__init__(error)
+        self.error = error
+        self.status = status
+
+
+def default_ttl():
+    return getattr(settings, 'RESERVATION_TTL', 15 * 60)
+
+
+def max_ttl():
+    return getattr(settings, 'RESERVATION_MAX_TTL', 24 * 60 * 60)
+
+
+def _bump_cache(warehouse_ids, using):
+    # available входит в выдачу склада
+    transaction.on_commit(partial(inventory_cache.bump_warehouses, warehouse_ids), using=using)
+
+
+def reserve(user, product_id, warehouse_id, quantity, ttl=None):
+    """Создаёт активный резерв на ttl секунд (по умолчанию RESERVATION_TTL)."""
+    with transaction.atomic():
+        rows = Inventory.objects.filter(product_id=product_id, warehouse_id=warehouse_id)
+        held = rows.filter(available__gte=quantity).raw_update(reserved=F('reserved') + quantity)
+        # у шардированной строки свободный остаток в слотах: резерв держится в самой строке
+        if not held and rows.fold_slots():
+            held = rows.filter(available__gte=quantity).raw_update(reserved=F('reserved') + quantity)
+        if not held:
+            if rows.exists():
+                raise ReservationRejected("Not enough available product in warehouse.", 400)
+            raise ReservationRejected("No such product in warehouse.", 404)
+
+        reservation = StockReservation.objects.create(
+            user=user,
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=ttl or default_ttl()),
+        )
+        _bump_cache([warehouse_id], rows.db)
+    return reservation
+
+
+def _lock_active(reservation_id, user, allow_expired=False):
+    reservation = StockReservation.objects.select_for_update().filter(pk=reservation_id, user=user).first()
+    if reservation is None:
+        raise ReservationRejected("No such reservation.", 404)
+    if reservation.status != StockReservation.ACTIVE:
+        raise ReservationRejected(f"Reservation is already {reservation.status}.", 409)
+    if not allow_expired and reservation.expires_at <= timezone.now():
+        # ещё не снят очисткой, но подтвердить уже нельзя
+        raise ReservationRejected("Reservation has expired.", 409)
+    return reservation
+
+
+def _free(reservations, status, using=DEFAULT_DB_ALIAS):
+    """Возвращает удержанное резервами количество в available; reservations — (pk, товар, склад, количество)."""
+    held = defaultdict(int)
+    for _, product_id, warehouse_id, quantity in reservations:
+        held[product_id, warehouse_id] += quantity
+
+    # Greatest: строку Inventory могли удалить и создать заново с нулевым резервом
+    Inventory.objects.using(using).filter(_pairs_filter(held)).raw_update(
+        reserved=Greatest(
+            F('reserved') - Case(
+                *[
+                    When(product_id=product_id, warehouse_id=warehouse_id, then=Value(quantity))
+                    for (product_id, warehouse_id), quantity in held.items()
+                ],
+                default=Value(0),
+            ),
+            Value(0),
+        )
+    )
+    StockReservation.objects.using(using).filter(pk__in=[pk for pk, _, _, _ in reservations]).update(
+        status=status, closed_at=timezone.now(),
+    )
+    _bump_cache({warehouse_id for _, warehouse_id in held}, using)
+
+
+def release(reservation_id, user):
+    with transaction.atomic():
+        reservation = _lock_active(reservation_id, user, allow_expired=True)
+        _free(
+            [(reservation.pk, reservation.product_id, reservation.warehouse_id, reservation.quantity)],
+            StockReservation.RELEASED,
+        )
+        reservation.refresh_from_db(fields=['status', 'closed_at'])
+    return reservation
+
+
+def confirm(reservation_id, user, to_warehouse_id=None):
+    """
+    Подтверждает резерв: без to_warehouse_id удержанное количество списывается со
+    склада, иначе перемещается на to_warehouse_id (с записью TransferLog).
+    """
+    with transaction.atomic():
+        reservation = _lock_active(reservation_id, user)
+        product_id, warehouse_id, quantity = reservation.product_id, reservation.warehouse_id, reservation.quantity
+
+        if to_warehouse_id is None:
+            rows = Inventory.objects.filter(product_id=product_id, warehouse_id=warehouse_id)
+            if not rows.filter(quantity__gte=quantity, reserved__gte=quantity).raw_update(
+                quantity=F('quantity') - quantity, reserved=F('reserved') - quantity,
+            ):
+                raise ReservationRejected("Reserved product is no longer in warehouse.", 409)
+            remaining = rows.values_list(live_quantity(), flat=True).get()
+            inventory_changed.send(
+                sender=Inventory,
+                changes=[InventoryChange(product_id, warehouse_id, remaining, 'update', remaining + quantity)],
+                using=rows.db,
+            )
+        else:
+            if to_warehouse_id == warehouse_id:
+                raise ReservationRejected("Source and destination warehouses must differ.", 400)
+            try:
+                apply_transfer(product_id, warehouse_id, to_warehouse_id, quantity, reserved=True)
+            except TransferRejected as exc:
+                raise ReservationRejected(exc.error, exc.status)
+
+        reservation.status = StockReservation.CONFIRMED
+        reservation.to_warehouse_id = to_warehouse_id
+        reservation.closed_at = timezone.now()
+        reservation.save(update_fields=['status', 'to_warehouse', 'closed_at'])
+    return reservation
+
+
+def expire_stale(batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Снимает просроченные активные резервы пачками по batch_size, каждая пачка —
+    своей транзакцией. Строки, заблокированные подтверждением или снятием,
+    пропускаются (SKIP LOCKED) и попадут в следующий запуск. Возвращает число снятых.
+    """
+    expired = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(
+                StockReservation.objects.using(using)
+                .select_for_update(skip_locked=True)
+                .filter(status=StockReservation.ACTIVE, expires_at__lte=timezone.now())
+                .order_by('expires_at')
+                .values_list('pk', 'product_id', 'warehouse_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return expired
+            _free(batch, StockReservation.EXPIRED, using=using)
+        expired += len(batch)
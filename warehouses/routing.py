@@ -0,0 +1,232 @@
+"""
+Чтение отчётов и списков с реплики (настройка WAREHOUSES_REPLICA_DATABASE).
+
+Представление включает реплику атрибутом read_replica (use_replica или
+атрибут класса ViewSet, действие может его переопределить). Решение
+принимается при первом чтении в запросе и запоминается в состоянии запроса
+(ContextVar, как у warehouses.middleware, чтобы его видели и потоки
+асинхронного ORM). Основная база используется, если:
+
+- метод запроса небезопасный или в запросе уже была запись;
+- чтение идёт внутри транзакции основной базы;
+- клиент недавно писал: ответ на запись ставит cookie PRIMARY_COOKIE на
+  REPLICA_STICKY_SECONDS, и следующие чтения видят собственные изменения;
+- реплика недоступна или отстаёт больше REPLICA_MAX_LAG секунд (проверка не
+  чаще раза в REPLICA_CHECK_INTERVAL секунд на процесс).
+
+Потоковые выгрузки читают уже после выхода из middleware, поэтому их
+queryset привязывается к базе явно: .using(read_alias()).
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger('warehouses.routing')
+
+PRIMARY_COOKIE = 'warehouses_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('warehouses_read_routing', default=None)
+_health = {}
+_health_lock = threading.Lock()
+
+
+def replica_alias():
+    return getattr(settings, 'WAREHOUSES_REPLICA_DATABASE', None)
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG', 5)
+
+
+def check_interval():
+    return getattr(settings, 'REPLICA_CHECK_INTERVAL', 5)
+
+
+def sticky_seconds():
+    # должно быть больше допустимого отставания, иначе клиент может не увидеть свою запись
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def use_replica(view=None, *, enabled=True):
+    """Помечает представление (функцию, метод действия ViewSet) для чтения с реплики или запрещает его."""
+    def mark(view):
+        view.read_replica = enabled
+        return view
+    return mark(view) if view is not None else mark
+
+
+def replica_lag(alias):
+    """Отставание реплики в секундах; на базах без репликации — 0. Ошибка подключения — DatabaseError."""
+    connection = connections[alias]
+    connection.ensure_connection()
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # на простаивающей основной базе время последнего воспроизведения стареет, поэтому
+        # при совпадении полученной и воспроизведённой позиций отставания нет
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() "
+            "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def replica_healthy(alias):
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < check_interval():
+        return checked[1]
+
+    with _health_lock:
+        checked = _health.get(alias)
+        if checked is not None and now - checked[0] < check_interval():
+            return checked[1]
+        try:
+            lag = replica_lag(alias)
+            healthy = lag <= max_lag()
+            if not healthy:
+                logger.warning("Replica %s lags %.1f s, reading from primary", alias, lag)
+        except DatabaseError:
+            logger.warning("Replica %s is unreachable, reading from primary", alias, exc_info=True)
+            healthy = False
+            # следующая проверка подключится заново
+            connections[alias].close()
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def view_allows_replica(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return False
+    view = match.func
+    if hasattr(view, 'read_replica'):
+        return view.read_replica
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return False
+    # ViewSet: атрибут метода действия перекрывает атрибут класса
+    actions = getattr(view, 'actions', None) or {}
+    handler = getattr(cls, actions.get(request.method.lower()) or actions.get('get') or '', None)
+    return getattr(handler, 'read_replica', getattr(cls, 'read_replica', False))
+
+
+class RoutingState:
+    __slots__ = ('request', 'alias', 'wrote')
+
+    def __init__(self, request):
+        self.request = request
+        self.alias = None
+        self.wrote = False
+
+    def read_alias(self):
+        if self.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if self.alias is None:
+            self.alias = self._choose()
+        return self.alias
+
+    def _choose(self):
+        alias = replica_alias()
+        request = self.request
+        if not alias or request.method not in SAFE_METHODS or not view_allows_replica(request):
+            return DEFAULT_DB_ALIAS
+        try:
+            primary_until = float(request.COOKIES.get(PRIMARY_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        if primary_until > time.time() or not replica_healthy(alias):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+
+def reporting_alias():
+    """База для чтения вне запроса (фоновые выгрузки): реплика, если она доступна и не отстаёт."""
+    alias = replica_alias()
+    if alias and replica_healthy(alias):
+        return alias
+    return DEFAULT_DB_ALIAS
+
+
+def read_alias():
+    """База для чтения в текущем запросе (вне запроса — основная)."""
+    state = _state.get()
+    return state.read_alias() if state is not None else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """Запись и миграции — только основная база; чтение — по решению RoutingState."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None:
+            return None
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема реплики приходит с основной базы через репликацию
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Заводит состояние маршрутизации на запрос и ставит cookie PRIMARY_COOKIE после записи."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    @staticmethod
+    def _finish(request, response, state):
+        if not replica_alias() or response.status_code >= 400:
+            return response
+        if state.wrote or request.method not in SAFE_METHODS:
+            seconds = sticky_seconds()
+            response.set_cookie(
+                PRIMARY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
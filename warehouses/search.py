@@ -0,0 +1,201 @@
+"""
+Поиск товаров по названию и SKU: префиксные и нечёткие (триграммные) совпадения.
+
+На PostgreSQL используется pg_trgm с GIN-индексами (миграция 0009). На остальных
+СУБД — триграммный индекс в памяти процесса, который перестраивается при
+изменении товаров (версия хранится в кэше, поэтому видна всем процессам).
+
+Запрос сравнивается не со всем полем, а с его лучшим фрагментом (word_similarity,
+оператор %> в pg_trgm): иначе опечатка в одном слове теряется на фоне
+остальных слов названия — «widgt» не находит «Widget Alpha».
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from warehouses.models import Product
+
+SIMILARITY_THRESHOLD = 0.3
+PREFIX_BOOSTS = {'sku': 1.0, 'name': 0.5}
+VERSION_KEY = 'products:search:version'
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def use_trigram_index():
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if backend != 'auto':
+        return backend == 'trigram'
+    return connections[router.db_for_read(Product)].vendor == 'postgresql'
+
+
+def word_trigrams(text):
+    # как в pg_trgm: слова — последовательности букв и цифр, каждое дополняется
+    # двумя пробелами слева и одним справа; триграммы — по словам, в их порядке
+    grams = []
+    for word in WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        grams.append({padded[i:i + 3] for i in range(len(padded) - 2)})
+    return grams
+
+
+def trigrams(text):
+    return set().union(*word_trigrams(text))
+
+
+def word_similarity(term_grams, words):
+    """
+    Наибольшее сходство триграмм запроса с отрезком подряд идущих слов поля —
+    word_similarity из pg_trgm с границами отрезка по словам.
+    """
+    best = 0.0
+    for start in range(len(words)):
+        extent = set()
+        for grams in words[start:]:
+            extent |= grams
+            common = len(term_grams & extent)
+            union = len(term_grams) + len(extent) - common
+            if union:
+                best = max(best, common / union)
+    return best
+
+
+def substring_grams(text):
+    """
+    Триграммы строки как есть, без разбиения на слова и дополнения пробелами:
+    строка содержит подстроку, только если содержит все её триграммы. Строка
+    короче трёх символов — сама себе «триграмма».
+    """
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NgramIndex:
+    def __init__(self, products):
+        self.products = {}
+        # по словам с дополнением — для сходства, по строке как есть — для подстрок и префиксов
+        self.word_postings = {}
+        self.substring_postings = {}
+        for pk, name, sku in products:
+            name_words, sku_words = word_trigrams(name), word_trigrams(sku)
+            self.products[pk] = (name, sku, name_words, sku_words)
+            for gram in set().union(*name_words, *sku_words):
+                self.word_postings.setdefault(gram, []).append(pk)
+            for gram in substring_grams(name.lower()) | substring_grams(sku.lower()):
+                self.substring_postings.setdefault(gram, []).append(pk)
+
+    def _substring_candidates(self, term_lower):
+        """Товары, в названии или SKU которых могут быть все триграммы запроса."""
+        if not term_lower:
+            return set(self.products)
+        if len(term_lower) < 3:
+            # короткий запрос — часть триграмм; перебираются триграммы, а не товары
+            candidates = set()
+            for gram, pks in self.substring_postings.items():
+                if term_lower in gram:
+                    candidates.update(pks)
+            return candidates
+        postings = sorted((self.substring_postings.get(gram, ()) for gram in substring_grams(term_lower)), key=len)
+        candidates = set(postings[0])
+        for pks in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(pks)
+        return candidates
+
+    def search(self, term):
+        """Возвращает [(product_id, score)] по убыванию score."""
+        term_lower = term.lower()
+        term_grams = trigrams(term)
+        # сходство считается только для товаров, у которых есть общие триграммы
+        similar = set()
+        for gram in term_grams:
+            similar.update(self.word_postings.get(gram, ()))
+        substring_candidates = self._substring_candidates(term_lower)
+
+        results = []
+        for pk in similar | substring_candidates:
+            name, sku, name_words, sku_words = self.products[pk]
+            similarity = 0.0
+            if pk in similar:
+                similarity = max(word_similarity(term_grams, name_words), word_similarity(term_grams, sku_words))
+            name_lower, sku_lower = name.lower(), sku.lower()
+            substring = pk in substring_candidates and (term_lower in name_lower or term_lower in sku_lower)
+            if similarity < SIMILARITY_THRESHOLD and not substring:
+                continue
+            boost = 0.0
+            if sku_lower.startswith(term_lower):
+                boost = PREFIX_BOOSTS['sku']
+            elif name_lower.startswith(term_lower):
+                boost = PREFIX_BOOSTS['name']
+            results.append((pk, similarity + boost))
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results
+
+
+_index_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def bump_version():
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def ngram_index():
+    global _index, _index_version
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_KEY, version, timeout=None)
+        version = cache.get(VERSION_KEY, version)
+    with _index_lock:
+        if _index is None or _index_version != version:
+            _index = NgramIndex(Product.objects.values_list('pk', 'name', 'sku').iterator())
+            _index_version = version
+        return _index
+
+
+def _trigram_queryset(term):
+    return Product.objects.filter(
+        # поле %> запрос: word_similarity(запрос, поле) не ниже pg_trgm.word_similarity_threshold
+        Q(name__trigram_word_similar=term) | Q(sku__trigram_word_similar=term)
+        | Q(name__icontains=term) | Q(sku__icontains=term)
+    ).annotate(
+        score=Greatest(TrigramWordSimilarity(term, 'name'), TrigramWordSimilarity(term, 'sku')) + Case(
+            When(sku__istartswith=term, then=Value(PREFIX_BOOSTS['sku'])),
+            When(name__istartswith=term, then=Value(PREFIX_BOOSTS['name'])),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+def search_products(term, limit=20):
+    """Ранжированный поиск: [{"product_id", "name", "sku", "score"}]."""
+    if use_trigram_index():
+        rows = _trigram_queryset(term).order_by('-score', 'pk').values_list('pk', 'name', 'sku', 'score')[:limit]
+        return [
+            {"product_id": pk, "name": name, "sku": sku, "score": round(score, 4)}
+            for pk, name, sku, score in rows
+        ]
+
+    index = ngram_index()
+    return [
+        {"product_id": pk, "name": index.products[pk][0], "sku": index.products[pk][1], "score": round(score, 4)}
+        for pk, score in index.search(term)[:limit]
+    ]
+
+
+def matching_product_ids(term):
+    """id подходящих товаров без ограничения: подзапрос на PostgreSQL, список иначе."""
+    if use_trigram_index():
+        return _trigram_queryset(term).values('pk')
+    return [pk for pk, _ in ngram_index().search(term)]
@@ -1,6 +1,10 @@
+from django.db.models import Sum
+from django.utils import timezone
 from rest_framework import serializers
 
-from warehouses.models import Warehouse, Product, Inventory, TransferLog, InventoryLog
+from warehouses import analytics, jobs
+from warehouses.models import Warehouse, Product, Inventory, TransferLog, InventoryLog, InventoryLogRollup, \
+    StockReservation, ExportJob
 
 
 class WarehouseSerializer(serializers.ModelSerializer):
@@ -22,7 +26,20 @@ class InventorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Inventory
-        fields = ['id', 'product', 'product_name', 'warehouse', 'warehouse_name', 'quantity']
+        fields = [
+            'id', 'product', 'product_name', 'warehouse', 'warehouse_name', 'quantity', 'reserved', 'available',
+            'reorder_level',
+        ]
+        read_only_fields = ['reserved', 'available']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.slots:
+            # у шардированной строки часть свободного остатка лежит в слотах
+            in_slots = instance.slot_rows.aggregate(total=Sum('quantity'))['total'] or 0
+            data['quantity'] += in_slots
+            data['available'] += in_slots
+        return data
 
 
 class InventoryLogSerializer(serializers.ModelSerializer):
@@ -31,7 +48,179 @@ class InventoryLogSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class InventoryLogRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InventoryLogRollup
+        fields = '__all__'
+
+
 class TransferLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = TransferLog
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class TransferLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    from_warehouse_id = serializers.IntegerField(min_value=1)
+    to_warehouse_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+    def validate(self, attrs):
+        if attrs['from_warehouse_id'] == attrs['to_warehouse_id']:
+            raise serializers.ValidationError("Source and destination warehouses must differ.")
+        return attrs
+
+
+class TransferBatchSerializer(serializers.Serializer):
+    transfers = TransferLineSerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class ReorderLevelSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    warehouse_id = serializers.IntegerField(min_value=1)
+    # null снимает порог
+    reorder_level = serializers.IntegerField(min_value=0, allow_null=True)
+
+
+class ReorderLevelBatchSerializer(serializers.Serializer):
+    levels = ReorderLevelSerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockReservation
+        exclude = ['user']
+
+
+class ReservationRequestSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    warehouse_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+    ttl_seconds = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_ttl_seconds(self, value):
+        limit = self.context['max_ttl']
+        if value > limit:
+            raise serializers.ValidationError(f"Must not exceed {limit} seconds.")
+        return value
+
+
+class ReservationConfirmSerializer(serializers.Serializer):
+    to_warehouse_id = serializers.IntegerField(min_value=1, required=False)
+
+
+class RebalanceRuleSerializer(serializers.Serializer):
+    warehouse_id = serializers.IntegerField(min_value=1)
+    # без product_id правило действует на все товары склада
+    product_id = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+    target = serializers.IntegerField(min_value=0, required=False)
+    min = serializers.IntegerField(min_value=0, required=False)
+    max = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if 'target' in attrs:
+            if 'min' in attrs or 'max' in attrs:
+                raise serializers.ValidationError("Use either target or min/max.")
+            attrs['min'] = attrs['max'] = attrs.pop('target')
+        elif 'min' not in attrs and 'max' not in attrs:
+            raise serializers.ValidationError("One of target, min or max is required.")
+        elif attrs.get('min') is not None and attrs.get('max') is not None and attrs['min'] > attrs['max']:
+            raise serializers.ValidationError("min must not exceed max.")
+        return attrs
+
+
+class RebalancePlanSerializer(serializers.Serializer):
+    rules = RebalanceRuleSerializer(many=True, allow_empty=False, max_length=10000)
+    # склады, между которыми можно возить; по умолчанию все
+    warehouse_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                          allow_empty=False)
+    product_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                        allow_empty=False)
+    apply = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        seen = set()
+        for rule in attrs['rules']:
+            key = rule['warehouse_id'], rule['product_id']
+            if key in seen:
+                raise serializers.ValidationError("Duplicate rule for the same warehouse and product.")
+            seen.add(key)
+        ruled = {rule['warehouse_id'] for rule in attrs['rules']}
+        if 'warehouse_ids' in attrs and not ruled <= set(attrs['warehouse_ids']):
+            raise serializers.ValidationError("Rules must reference warehouses listed in warehouse_ids.")
+        return attrs
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        exclude = ['user', 'artifact', 'heartbeat_at']
+
+    def get_download_url(self, job):
+        if job.status != ExportJob.DONE:
+            return None
+        url = f'/api/jobs/{job.pk}/download/'
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class InventoryExportParamsSerializer(serializers.Serializer):
+    # те же фильтры, что у GET /api/warehouses/inventory/export/?warehouse=&sku=
+    warehouse = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    sku = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+
+
+class ExportJobRequestSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=ExportJob.KIND_CHOICES)
+    # для inventory_logs — параметры фильтра журнала (product, warehouse, operation, start_date, end_date)
+    params = serializers.DictField(required=False, default=dict)
+
+    def validate(self, attrs):
+        if attrs['kind'] == ExportJob.INVENTORY:
+            params = InventoryExportParamsSerializer(data=attrs['params'])
+            if not params.is_valid():
+                raise serializers.ValidationError({'params': params.errors})
+            attrs['params'] = params.validated_data
+        else:
+            errors = jobs.validate_params(attrs['kind'], attrs['params'])
+            if errors:
+                raise serializers.ValidationError({'params': errors})
+        return attrs
+
+
+class MovementParamsSerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=analytics.PERIODS, default='day')
+    group_by = serializers.ChoiceField(choices=analytics.GROUP_BY, default='warehouse')
+    # по умолчанию — analytics.DEFAULT_PERIODS периодов по сегодняшний день
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    # id через запятую, как у выгрузок остатков
+    warehouse = serializers.CharField(required=False)
+    product = serializers.CharField(required=False)
+    window = serializers.IntegerField(min_value=1, max_value=366, default=7)
+    # columns — колонки вместо списка строк (как у ?format=arrow)
+    layout = serializers.ChoiceField(choices=['rows', 'columns'], default='rows')
+
+    def _ids(self, value):
+        try:
+            return [int(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise serializers.ValidationError("Must be a comma-separated list of ids.")
+
+    def validate_warehouse(self, value):
+        return self._ids(value)
+
+    def validate_product(self, value):
+        return self._ids(value)
+
+    def validate(self, attrs):
+        attrs.setdefault('end_date', timezone.localdate())
+        attrs.setdefault('start_date', analytics.default_start(attrs['end_date'], attrs['period']))
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError("start_date must not be after end_date.")
+        limit = analytics.max_periods()
+        if len(analytics.period_range(attrs['start_date'], attrs['end_date'], attrs['period'])) > limit:
+            raise serializers.ValidationError(f"The range must not exceed {limit} periods.")
+        return attrs
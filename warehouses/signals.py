@@ -1,23 +1,84 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.expressions import Combinable
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from warehouses.models import Inventory, InventoryLog
+from warehouses import alerts, audit, inventory_cache, search, stock_totals
+from warehouses.middleware import install_sql_wrapper
+from warehouses.changes import InventoryChange, inventory_changed
+from warehouses.models import Inventory, Product
 
 
 @receiver(post_save, sender=Inventory)
-def log_inventory_save(sender, instance, created, **kwargs):
-    InventoryLog.objects.create(
-        product=instance.product,
-        warehouse=instance.warehouse,
-        quantity=instance.quantity,
-        operation='add' if created else 'update',
+def log_inventory_save(sender, instance, created, using, **kwargs):
+    if isinstance(instance.quantity, Combinable):
+        instance.refresh_from_db(using=using, fields=['quantity'])
+
+    inventory_changed.send(
+        sender=Inventory,
+        changes=[InventoryChange(
+            product_id=instance.product_id,
+            warehouse_id=instance.warehouse_id,
+            quantity=instance.quantity,
+            operation='add' if created else 'update',
+            previous=0 if created else instance.loaded_quantity,
+        )],
+        using=using,
     )
+    instance.loaded_quantity = instance.quantity
 
 @receiver(post_delete, sender=Inventory)
-def log_inventory_delete(sender, instance, **kwargs):
-    InventoryLog.objects.create(
-        product=instance.product,
-        warehouse=instance.warehouse,
-        quantity=0,
-        operation='remove'
-    )
\ No newline at end of file
+def log_inventory_delete(sender, instance, using, **kwargs):
+    inventory_changed.send(
+        sender=Inventory,
+        changes=[InventoryChange(
+            product_id=instance.product_id,
+            warehouse_id=instance.warehouse_id,
+            quantity=0,
+            operation='remove',
+            previous=instance.loaded_quantity,
+        )],
+        using=using,
+    )
+
+@receiver(inventory_changed)
+def write_inventory_log(sender, changes, using, **kwargs):
+    audit.record(changes, using=using)
+
+@receiver(inventory_changed)
+def update_stock_totals(sender, changes, using, **kwargs):
+    stock_totals.apply_changes(changes, using=using)
+
+@receiver(inventory_changed)
+def detect_low_stock(sender, changes, using, **kwargs):
+    alerts.detect_crossings(changes, using=using)
+
+
+@receiver(inventory_changed)
+def invalidate_inventory_cache(sender, changes, using, **kwargs):
+    warehouse_ids = {change.warehouse_id for change in changes}
+    transaction.on_commit(partial(inventory_cache.bump_warehouses, warehouse_ids), using=using)
+
+@receiver(post_save, sender=Product)
+def invalidate_product_listings(sender, instance, created, using, **kwargs):
+    # название и SKU товара входят в выдачу склада
+    if created:
+        return
+    warehouse_ids = list(
+        Inventory.objects.using(using).filter(product_id=instance.pk).values_list('warehouse_id', flat=True)
+    )
+    transaction.on_commit(partial(inventory_cache.bump_warehouses, warehouse_ids), using=using)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_search(sender, using, **kwargs):
+    transaction.on_commit(search.bump_version, using=using)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # SQL измеряется обёрткой на каждом соединении; вне выборки запросов она ничего не делает
+    install_sql_wrapper(connection)
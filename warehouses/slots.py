@@ -0,0 +1,155 @@
+"""
+Шардированные счётчики для «горячих» строк Inventory.
+
+В обычном режиме популярная пара (товар, склад) — одна строка, и параллельные
+перемещения по ней выстраиваются в очередь за блокировкой её UPDATE. У строки
+со slots = N свободный остаток разложен по N строкам InventorySlot: списание
+выбирает случайный слот и уменьшает его условным UPDATE (quantity >= n),
+зачисление увеличивает случайный слот. Параллельные переводы попадают на
+разные слоты, а сама строка Inventory на быстром пути не меняется.
+
+Количество строки — Inventory.quantity плюс сумма её слотов
+(InventoryQuerySet.with_slot_totals). В самой строке остаются резерв и то,
+что перенесли в неё записи, задающие количество целиком (fold_slots). Если в
+опрошенных слотах не хватает количества, списание блокирует строку и все её
+слоты и собирает количество из нескольких. manage.py compact_inventory_slots
+периодически раскладывает остаток строки и слотов по слотам поровну, чтобы
+быстрый путь снова срабатывал.
+"""
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, Value, When
+
+from warehouses.changes import InventoryChange, inventory_changed
+from warehouses.models import Inventory, InventoryLog, InventorySlot
+
+# столько случайных слотов опрашивается до медленного пути
+SLOT_ATTEMPTS = 2
+
+
+def default_slots():
+    return getattr(settings, 'INVENTORY_HOT_ROW_SLOTS', 8)
+
+
+def withdraw(inventory_id, slots, quantity, using=DEFAULT_DB_ALIAS):
+    """Списывает quantity со слотов строки; False — свободного остатка не хватает."""
+    slot_rows = InventorySlot.objects.using(using).filter(inventory_id=inventory_id)
+    for slot in random.sample(range(slots), min(slots, SLOT_ATTEMPTS)):
+        if slot_rows.filter(slot=slot, quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            return True
+
+    # ни в одном опрошенном слоте нет quantity целиком: собираем из всех под блокировкой строки
+    with transaction.atomic(using=using, savepoint=False):
+        free = (
+            Inventory.objects.using(using).select_for_update()
+            .filter(pk=inventory_id).values_list('available', flat=True).get()
+        )
+        held = list(slot_rows.select_for_update().order_by('slot').values_list('slot', 'quantity'))
+        if free + sum(quantity for _, quantity in held) < quantity:
+            return False
+
+        taken, rest = {}, quantity
+        for slot, available in sorted(held, key=lambda item: -item[1]):
+            if not rest or not available:
+                break
+            taken[slot] = min(available, rest)
+            rest -= taken[slot]
+        if taken:
+            slot_rows.filter(slot__in=taken).update(
+                quantity=F('quantity') - Case(
+                    *[When(slot=slot, then=Value(amount)) for slot, amount in taken.items()], default=Value(0),
+                )
+            )
+        if rest:
+            Inventory.objects.using(using).filter(pk=inventory_id).raw_update(quantity=F('quantity') - rest)
+    return True
+
+
+def deposit(inventory_id, slots, quantity, using=DEFAULT_DB_ALIAS):
+    """Зачисляет quantity на случайный слот (на саму строку, если её успели вернуть в обычный режим)."""
+    if slots and InventorySlot.objects.using(using).filter(
+        inventory_id=inventory_id, slot=random.randrange(slots),
+    ).update(quantity=F('quantity') + quantity):
+        return
+    Inventory.objects.using(using).filter(pk=inventory_id).raw_update(quantity=F('quantity') + quantity)
+
+
+def _lock(inventory_id, using):
+    return (
+        Inventory.objects.using(using).select_for_update()
+        .filter(pk=inventory_id).values_list('product_id', 'warehouse_id', 'quantity', 'reserved', 'slots').get()
+    )
+
+
+def _spread(inventory_id, using):
+    """
+    Раскладывает свободный остаток строки и её слотов по слотам поровну.
+    Возвращает (количество строки вместе со слотами, изменилось ли что-нибудь).
+    """
+    _, _, quantity, reserved, slots = _lock(inventory_id, using)
+    slot_rows = InventorySlot.objects.using(using).filter(inventory_id=inventory_id)
+    held = dict(slot_rows.select_for_update().order_by('slot').values_list('slot', 'quantity'))
+    total = quantity + sum(held.values())
+
+    share, extra = divmod(total - reserved, slots)
+    target = {slot: share + (1 if slot < extra else 0) for slot in range(slots)}
+    if quantity == reserved and held == target:
+        return total, False
+
+    slot_rows.update(
+        quantity=Case(*[When(slot=slot, then=Value(amount)) for slot, amount in target.items()], default=Value(0))
+    )
+    Inventory.objects.using(using).filter(pk=inventory_id).raw_update(quantity=F('reserved'))
+    return total, True
+
+
+def set_slots(inventory_id, slots, using=DEFAULT_DB_ALIAS):
+    """
+    Переводит строку в шардированный режим со slots слотами или, при slots=0,
+    обратно в обычный. Количество строки вместе со слотами не меняется.
+    """
+    with transaction.atomic(using=using):
+        _lock(inventory_id, using)
+        Inventory.objects.using(using).filter(pk=inventory_id).fold_slots()
+        InventorySlot.objects.using(using).filter(inventory_id=inventory_id, slot__gte=slots).delete()
+        InventorySlot.objects.using(using).bulk_create(
+            [InventorySlot(inventory_id=inventory_id, slot=slot) for slot in range(slots)], ignore_conflicts=True,
+        )
+        Inventory.objects.using(using).filter(pk=inventory_id).raw_update(slots=slots)
+        if slots:
+            _spread(inventory_id, using)
+
+
+def compact(inventory_id, using=DEFAULT_DB_ALIAS):
+    """
+    Выравнивает слоты одной строки. Параллельные переводы пишут в журнал
+    количество, каким его видит каждая транзакция; если последняя запись
+    журнала расходится с точным количеством, дописывается запись с ним.
+    Возвращает True, если слоты пришлось переложить.
+    """
+    with transaction.atomic(using=using):
+        product_id, warehouse_id, _, _, slots = _lock(inventory_id, using)
+        if not slots:
+            return False
+        total, changed = _spread(inventory_id, using)
+        logged = (
+            InventoryLog.objects.using(using).filter(product_id=product_id, warehouse_id=warehouse_id)
+            .order_by('-created_at', '-id').values_list('quantity', flat=True).first()
+        )
+        if logged != total:
+            inventory_changed.send(
+                sender=Inventory,
+                changes=[InventoryChange(product_id, warehouse_id, total, 'update', total)],
+                using=using,
+            )
+    return changed
+
+
+def compact_all(using=DEFAULT_DB_ALIAS):
+    """Выравнивает слоты всех шардированных строк, каждую своей транзакцией. Возвращает число изменённых."""
+    inventory_ids = list(
+        Inventory.objects.using(using).filter(slots__gt=0).order_by('pk').values_list('pk', flat=True)
+    )
+    return sum(1 for inventory_id in inventory_ids if compact(inventory_id, using))
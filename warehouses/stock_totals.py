@@ -0,0 +1,136 @@
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Now
+
+from warehouses.models import Inventory, ProductStockTotal, live_quantity
+
+ROW_DELTAS = {'add': 1, 'remove': -1}
+
+
+def apply_changes(changes, using=DEFAULT_DB_ALIAS):
+    """
+    Инкрементально обновляет ProductStockTotal по списку InventoryChange.
+
+    Перемещения между складами не меняют сумму по товару, поэтому такие товары
+    пропускаются. Если путь записи не знает прежнее количество, итог товара
+    пересчитывается агрегатом по его строкам Inventory.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    unknown = set()
+    for change in changes:
+        if change.previous is None:
+            unknown.add(change.product_id)
+            continue
+        delta = deltas[change.product_id]
+        delta[0] += change.quantity - change.previous
+        delta[1] += ROW_DELTAS.get(change.operation, 0)
+
+    deltas = {product_id: delta for product_id, delta in deltas.items() if any(delta) and product_id not in unknown}
+    if not deltas and not unknown:
+        return
+
+    with transaction.atomic(using=using, savepoint=False):
+        if deltas:
+            ProductStockTotal.objects.using(using).bulk_create(
+                [ProductStockTotal(product_id=product_id) for product_id in deltas],
+                ignore_conflicts=True,
+            )
+            ProductStockTotal.objects.using(using).filter(product_id__in=deltas).update(
+                total_quantity=F('total_quantity') + Case(
+                    *[When(product_id=product_id, then=Value(delta[0])) for product_id, delta in deltas.items()],
+                    default=Value(0),
+                ),
+                inventory_rows=F('inventory_rows') + Case(
+                    *[When(product_id=product_id, then=Value(delta[1])) for product_id, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                updated_at=Now(),
+            )
+        if unknown:
+            recompute(unknown, using=using)
+
+
+def live_totals(using=DEFAULT_DB_ALIAS):
+    return (
+        Inventory.objects.using(using)
+        .values('product_id')
+        .annotate(total=Sum(live_quantity()), rows=Count('id'))
+        .order_by('product_id')
+    )
+
+
+def recompute(product_ids, using=DEFAULT_DB_ALIAS):
+    product_ids = set(product_ids)
+    totals = {
+        item['product_id']: item
+        for item in live_totals(using).filter(product_id__in=product_ids)
+    }
+    ProductStockTotal.objects.using(using).bulk_create(
+        [
+            ProductStockTotal(
+                product_id=product_id,
+                total_quantity=totals[product_id]['total'] if product_id in totals else 0,
+                inventory_rows=totals[product_id]['rows'] if product_id in totals else 0,
+            )
+            for product_id in product_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['total_quantity', 'inventory_rows', 'updated_at'],
+    )
+
+
+def rebuild(chunk_size=2000, using=DEFAULT_DB_ALIAS):
+    """Полностью пересобирает таблицу итогов из живого агрегата. Возвращает число строк."""
+    written = 0
+    with transaction.atomic(using=using):
+        ProductStockTotal.objects.using(using).all().delete()
+        batch = []
+        for item in live_totals(using).iterator(chunk_size=chunk_size):
+            batch.append(ProductStockTotal(
+                product_id=item['product_id'],
+                total_quantity=item['total'] or 0,
+                inventory_rows=item['rows'],
+            ))
+            if len(batch) >= chunk_size:
+                ProductStockTotal.objects.using(using).bulk_create(batch)
+                written += len(batch)
+                batch = []
+        ProductStockTotal.objects.using(using).bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def verify(chunk_size=2000, using=DEFAULT_DB_ALIAS):
+    """
+    Сравнивает таблицу итогов с живым агрегатом слиянием двух упорядоченных потоков.
+    Возвращает генератор расхождений (product_id, ожидаемое, фактическое).
+    """
+    live = (
+        (item['product_id'], (item['total'] or 0, item['rows']))
+        for item in live_totals(using).iterator(chunk_size=chunk_size)
+    )
+    stored = (
+        (product_id, (total, rows))
+        for product_id, total, rows in ProductStockTotal.objects.using(using)
+        .filter(inventory_rows__gt=0)
+        .order_by('product_id')
+        .values_list('product_id', 'total_quantity', 'inventory_rows')
+        .iterator(chunk_size=chunk_size)
+    )
+    missing = (0, 0)
+    live_item, stored_item = next(live, None), next(stored, None)
+    while live_item is not None or stored_item is not None:
+        if stored_item is None or (live_item is not None and live_item[0] < stored_item[0]):
+            yield live_item[0], live_item[1], missing
+            live_item = next(live, None)
+        elif live_item is None or stored_item[0] < live_item[0]:
+            yield stored_item[0], missing, stored_item[1]
+            stored_item = next(stored, None)
+        else:
+            if live_item[1] != stored_item[1]:
+                yield live_item[0], live_item[1], stored_item[1]
+            live_item, stored_item = next(live, None), next(stored, None)
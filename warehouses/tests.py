@@ -1,3 +1,1457 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import gc
+import gzip
+import json
+import os
+import runpy
+import tempfile
+import time
+from io import StringIO
+from urllib.parse import parse_qsl, urlsplit
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from warehouses import (
+    alerts, analytics, async_views, audit, changefeed, consistency, exports, history, idempotency, inventory_cache, jobs,
+    metrics, middleware, partitioning, rebalance,
+    reservations, routing, search, slots, stock_totals, warmup,
+)
+from warehouses.benchmarks import data, load, startup, suite
+from warehouses.models import (
+    ExportJob, IdempotencyKey, Inventory, InventoryLog, InventoryLogRollup, InventorySlot, InventorySnapshot, Product,
+    ProductStockTotal, StockAlert, StockReservation, TransferLog, Warehouse,
+)
+from warehouses.transfers import apply_transfer_batch
+
+
+class StockTestMixin:
+    """Три склада, пять товаров по 10 шт. на каждом складе и клиент с токеном."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('keeper', 'keeper@example.com', 'secret')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.warehouses = [Warehouse.objects.create(name=f'W{number}', location='L') for number in range(3)]
+        cls.products = [Product.objects.create(name=f'Widget {number}', sku=f'SKU{number}') for number in range(5)]
+        for warehouse in cls.warehouses:
+            for product in cls.products:
+                Inventory.objects.create(product=product, warehouse=warehouse, quantity=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def quantity(self, product, warehouse):
+        return Inventory.objects.get(product=product, warehouse=warehouse).quantity
+
+    def batch(self, *lines):
+        return [
+            {'product_id': product.pk, 'from_warehouse_id': source.pk, 'to_warehouse_id': destination.pk,
+             'quantity': quantity}
+            for product, source, destination, quantity in lines
+        ]
+
+    def transfer(self, product, source, destination, quantity, **extra):
+        # журнал InventoryLog пишется при фиксации транзакции (warehouses.audit)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/inventory/transfer/', {
+                'product_id': product.pk,
+                'from_warehouse_id': source.pk,
+                'to_warehouse_id': destination.pk,
+                'quantity': quantity,
+            }, format='json', **extra)
+
+
+class InventoryExportTests(StockTestMixin, TestCase):
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_warehouse_export_streams_filtered_rows(self):
+        warehouse = self.warehouses[0]
+        Inventory.objects.filter(warehouse=warehouse, product=self.products[1]).update(quantity=7)
+        body = self.export(f'/api/warehouses/{warehouse.pk}/inventory/export/', sku='SKU1,SKU2')
+        header, *rows = body.decode().splitlines()
+        self.assertEqual(header, 'product,name,sku,quantity')
+        self.assertCountEqual(rows, [
+            f'{self.products[1].pk},Widget 1,SKU1,7',
+            f'{self.products[2].pk},Widget 2,SKU2,10',
+        ])
+
+    def test_gzip_export_of_all_warehouses(self):
+        response = self.client.get('/api/warehouses/inventory/export/', {'compress': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv.gz"'))
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 1 + len(self.warehouses) * len(self.products))
+
+    def test_rows_are_joined_into_chunks(self):
+        chunks = list(exports.csv_rows(['a'], ([number] for number in range(5)), chunk_size=2))
+        self.assertEqual(chunks, ['a\r\n', '0\r\n1\r\n', '2\r\n3\r\n', '4\r\n'])
+
+    def test_invalid_warehouse_filter(self):
+        response = self.client.get('/api/warehouses/inventory/export/', {'warehouse': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TransferTests(StockTestMixin, TestCase):
+    def test_transfer_logs_quantities_from_update(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[1]
+        response = self.transfer(product, source, destination, 4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantity(product, source), 6)
+        self.assertEqual(self.quantity(product, destination), 14)
+        logged = dict(
+            InventoryLog.objects.filter(product=product, operation='update').values_list('warehouse_id', 'quantity')
+        )
+        self.assertEqual(logged, {source.pk: 6, destination.pk: 14})
+        self.assertEqual(TransferLog.objects.filter(product=product).count(), 1)
+
+    def test_transfer_to_new_row_creates_it(self):
+        product = self.products[0]
+        Inventory.objects.filter(product=product, warehouse=self.warehouses[2]).delete()
+        response = self.transfer(product, self.warehouses[0], self.warehouses[2], 3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantity(product, self.warehouses[2]), 3)
+        self.assertEqual(self.quantity(product, self.warehouses[0]), 7)
+
+    def test_rejected_transfer_changes_nothing(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[1]
+        response = self.transfer(product, source, destination, 11)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantity(product, source), 10)
+        self.assertEqual(self.quantity(product, destination), 10)
+        self.assertFalse(TransferLog.objects.exists())
+        self.assertFalse(InventoryLog.objects.filter(operation='update').exists())
+
+
+class TransferBatchTests(StockTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # итоги по товарам ведутся инкрементально; для начальных строк — пересборка
+        stock_totals.rebuild()
+
+    def test_batch_creates_destination_rows(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.filter(product=product, warehouse=destination).delete()
+            apply_transfer_batch(self.batch((product, source, destination, 3), (product, source, destination, 2)))
+        self.assertEqual(self.quantity(product, destination), 5)
+        self.assertEqual(self.quantity(product, source), 5)
+        self.assertEqual(
+            list(InventoryLog.objects.filter(product=product, warehouse=destination).values_list('operation', 'quantity')),
+            [('remove', 0), ('add', 5)],
+        )
+        self.assertEqual(list(stock_totals.verify()), [])
+
+    def test_batch_applies_delta_to_row_inserted_concurrently(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[2]
+        insert_missing = type(Inventory.objects.all()).insert_missing
+
+        def concurrent(queryset, objs):
+            # строку вставляет параллельный пакет между блокировкой и вставкой
+            Inventory.objects.create(product=product, warehouse=destination, quantity=7)
+            return insert_missing(queryset, objs)
+
+        with mock.patch.object(type(Inventory.objects.all()), 'insert_missing', concurrent):
+            with self.captureOnCommitCallbacks(execute=True):
+                Inventory.objects.filter(product=product, warehouse=destination).delete()
+                apply_transfer_batch(self.batch((product, source, destination, 3)))
+        self.assertEqual(self.quantity(product, destination), 10)
+        self.assertEqual(
+            list(InventoryLog.objects.filter(product=product, warehouse=destination).values_list('operation', 'quantity')),
+            [('remove', 0), ('add', 7), ('update', 10)],
+        )
+        self.assertEqual(list(stock_totals.verify()), [])
+
+
+@override_settings(CACHES=load.NO_CACHE)
+class AuditBufferTests(StockTestMixin, TestCase):
+    def test_logs_are_written_in_one_flush_on_commit(self):
+        flushes = audit.stats()['flushes']
+        with self.captureOnCommitCallbacks(execute=True):
+            for inventory in Inventory.objects.filter(warehouse=self.warehouses[0]):
+                inventory.quantity = 3
+                inventory.save()
+            self.assertFalse(InventoryLog.objects.exists())
+        self.assertEqual(audit.stats()['flushes'], flushes + 1)
+        self.assertEqual(InventoryLog.objects.filter(operation='update', quantity=3).count(), len(self.products))
+
+    def test_rolled_back_savepoint_drops_its_logs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.get(product=self.products[0], warehouse=self.warehouses[0]).save()
+            try:
+                with transaction.atomic():
+                    inventory = Inventory.objects.get(product=self.products[1], warehouse=self.warehouses[0])
+                    inventory.quantity = 2
+                    inventory.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(list(InventoryLog.objects.values_list('product_id', 'quantity')), [(self.products[0].pk, 10)])
+
+
+class StockTotalsTests(StockTestMixin, TestCase):
+    def summary(self):
+        response = self.client.get('/api/inventory/summary/')
+        self.assertEqual(response.status_code, 200)
+        return {row['sku']: row['total_quantity'] for row in response.json()['results']}
+
+    def test_totals_follow_writes(self):
+        product = self.products[0]
+        self.assertEqual(self.summary()['SKU0'], 30)
+        self.transfer(product, self.warehouses[0], self.warehouses[1], 4)
+        self.assertEqual(self.summary()['SKU0'], 30)
+
+        Inventory.objects.filter(product=product, warehouse=self.warehouses[2]).get().delete()
+        inventory = Inventory.objects.get(product=product, warehouse=self.warehouses[0])
+        inventory.quantity = 1
+        inventory.save()
+        self.assertEqual(self.summary()['SKU0'], 15)
+        self.assertEqual(ProductStockTotal.objects.get(product=product).inventory_rows, 2)
+        self.assertEqual(list(stock_totals.verify()), [])
+
+    def test_verify_reports_and_rebuild_repairs_drift(self):
+        product = self.products[1]
+        ProductStockTotal.objects.filter(product=product).update(total_quantity=99)
+        self.assertEqual(list(stock_totals.verify()), [(product.pk, (30, 3), (99, 3))])
+        stock_totals.rebuild()
+        self.assertEqual(list(stock_totals.verify()), [])
+        self.assertEqual(self.summary()['SKU1'], 30)
+
+
+class BulkImportTests(StockTestMixin, TestCase):
+    url = '/api/inventory/bulk/'
+
+    def test_csv_upsert_reports_row_errors(self):
+        warehouse = Warehouse.objects.create(name='W3', location='L')
+        body = (
+            'sku,warehouse_id,quantity\n'
+            f'SKU0,{self.warehouses[0].pk},4\n'
+            f'SKU1,{warehouse.pk},6\n'
+            f'NOPE,{warehouse.pk},1\n'
+            f'SKU2,{warehouse.pk},-1\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'created': 1, 'updated': 1, 'error_count': 2,
+            'errors': [{'row': 3, 'error': 'No such product.'}, {'row': 4, 'error': 'Quantity must not be negative.'}],
+        })
+        self.assertEqual(self.quantity(self.products[0], self.warehouses[0]), 4)
+        self.assertEqual(self.quantity(self.products[1], warehouse), 6)
+        self.assertEqual(InventoryLog.objects.filter(operation='add', product=self.products[1]).count(), 1)
+
+    def test_json_lines_in_chunks_last_duplicate_wins(self):
+        warehouse_id = self.warehouses[1].pk
+        body = '\n'.join([
+            f'{{"sku": "SKU3", "warehouse_id": {warehouse_id}, "quantity": 1}}',
+            'not json',
+            f'{{"sku": "SKU3", "warehouse_id": {warehouse_id}, "quantity": 2}}',
+            f'{{"sku": "SKU3", "warehouse_id": {warehouse_id}, "quantity": 3}}',
+        ])
+        with override_settings(INVENTORY_IMPORT_CHUNK_SIZE=2):
+            response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(response.json()['errors'], [{'row': 2, 'error': 'Malformed row.'}])
+        self.assertEqual(self.quantity(self.products[3], self.warehouses[1]), 3)
+
+    def test_object_body_is_rejected(self):
+        response = self.client.post(self.url, {'sku': 'SKU0'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class LogPaginationTests(StockTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        # одинаковое время у двух записей: порядок добирается по id
+        for hours in (0, 1, 1, 2, 3, 4):
+            entry = InventoryLog.objects.create(
+                product=cls.products[0], warehouse=cls.warehouses[0], quantity=hours, operation='update',
+            )
+            InventoryLog.objects.filter(pk=entry.pk).update(created_at=cls.start + timedelta(hours=hours))
+
+    def walk(self, url, params):
+        ids, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.json()['results']]
+            if response.json()['next'] is None:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_cursor_walks_time_range_newest_first(self):
+        ids = self.walk('/api/inventory/logs/', {
+            'page_size': 2, 'product': self.products[0].pk,
+            'start_date': (self.start + timedelta(hours=1)).isoformat(),
+            'end_date': (self.start + timedelta(hours=3)).isoformat(),
+        })
+        expected = InventoryLog.objects.filter(quantity__in=(1, 2, 3)).order_by('-created_at', '-id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+    def test_transfer_log_cursor(self):
+        for quantity in (1, 2, 3):
+            self.transfer(self.products[1], self.warehouses[0], self.warehouses[1], quantity)
+        ids = self.walk('/api/transfers/', {'page_size': 2, 'from_warehouse': self.warehouses[0].pk})
+        self.assertEqual(ids, list(TransferLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True)))
+
+    def test_invalid_filter(self):
+        self.assertEqual(self.client.get('/api/inventory/logs/', {'start_date': 'soon'}).status_code, 400)
+
+
+class InventoryCacheTests(StockTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # версии складов живут в кэше, а id складов между тестами повторяются
+        cache.clear()
+        self.url = f'/api/warehouses/{self.warehouses[0].pk}/inventory/'
+
+    def quantities(self, response):
+        return {row['product_id']: row['quantity'] for row in response.json()}
+
+    def test_hit_not_modified_and_invalidation_on_write(self):
+        stats = inventory_cache.stats()
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        second = self.client.get(self.url)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        after = inventory_cache.stats()
+        self.assertEqual(
+            (after['misses'] - stats['misses'], after['hits'] - stats['hits'], after['not_modified'] - stats['not_modified']),
+            (1, 1, 1),
+        )
+
+        self.transfer(self.products[0], self.warehouses[0], self.warehouses[1], 4)
+        fresh = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(self.quantities(fresh)[self.products[0].pk], 6)
+
+    def test_other_warehouse_writes_keep_cache(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.filter(warehouse=self.warehouses[2]).update(quantity=1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_product_rename_invalidates(self):
+        self.client.get(self.url)
+        product = self.products[0]
+        product.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        names = {row['product_id']: row['name'] for row in self.client.get(self.url).json()}
+        self.assertEqual(names[product.pk], 'Renamed')
+
+    @override_settings(ALLOWED_HOSTS=['public.example', 'internal.example'])
+    def test_cached_page_links_follow_request_host(self):
+        params = {'page': 2, 'page_size': 2}
+        public = self.client.get(self.url, params, HTTP_HOST='public.example').json()
+        hits = inventory_cache.stats()['hits']
+        internal = self.client.get(self.url, params, HTTP_HOST='internal.example').json()
+        self.assertEqual(inventory_cache.stats()['hits'], hits + 1)
+
+        self.assertEqual(internal['results'], public['results'])
+        self.assertEqual(internal['count'], len(self.products))
+        self.assertEqual(urlsplit(public['next']).netloc, 'public.example')
+        self.assertEqual(urlsplit(internal['next']).netloc, 'internal.example')
+        self.assertEqual(dict(parse_qsl(urlsplit(internal['next']).query)), {'page': '3', 'page_size': '2'})
+        self.assertEqual(dict(parse_qsl(urlsplit(internal['previous']).query)), {'page_size': '2'})
+
+
+class AsyncReadTests(StockTestMixin, TestCase):
+    """Асинхронные эндпоинты чтения отдают то же, что DRF-представления."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for quantity in range(5):
+            InventoryLog.objects.create(
+                product=cls.products[0], warehouse=cls.warehouses[0], quantity=quantity, operation='update',
+            )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    async def call(self, view, path, params=None, **kwargs):
+        response = await view(self.factory.get(path, params or {}, headers=self.headers), **kwargs)
+        return response.status_code, json.loads(response.content)
+
+    async def sync_json(self, path, params=None):
+        response = await sync_to_async(self.client.get)(path, params or {})
+        return response.json()
+
+    async def test_same_output_as_sync_views(self):
+        warehouse = self.warehouses[0]
+        path = f'/api/warehouses/{warehouse.pk}/inventory/'
+        self.assertEqual(
+            await self.call(async_views.warehouse_inventory, path, pk=str(warehouse.pk)),
+            (200, await self.sync_json(path)),
+        )
+        status_code, summary = await self.call(async_views.inventory_summary, '/api/inventory/summary/')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(summary['results'], (await self.sync_json('/api/inventory/summary/'))['results'])
+
+    async def test_logs_keyset_pages(self):
+        path, ids, params = '/api/inventory/logs/', [], {'page_size': 2}
+        while True:
+            status_code, page = await self.call(async_views.inventory_logs, path, params)
+            self.assertEqual(status_code, 200)
+            ids += [row['id'] for row in page['results']]
+            if page['next'] is None:
+                break
+            params = dict(parse_qsl(urlsplit(page['next']).query))
+        expected = [row['id'] for row in (await self.sync_json(path, {'page_size': 100}))['results']]
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), 5)
+
+    async def test_cursors_of_the_other_mode_are_rejected(self):
+        path = '/api/inventory/logs/'
+        sync_next = (await self.sync_json(path, {'page_size': 2}))['next']
+        status_code, body = await self.call(async_views.inventory_logs, path, dict(parse_qsl(urlsplit(sync_next).query)))
+        self.assertEqual(status_code, 400)
+        self.assertIn('WAREHOUSES_API_MODE', body['detail'])
+
+        _, page = await self.call(async_views.inventory_logs, path, {'page_size': 2})
+        self.assertIsNone(page['previous'])
+        response = await sync_to_async(self.client.get)(path, dict(parse_qsl(urlsplit(page['next']).query)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            (await self.call(async_views.inventory_logs, path, {'cursor': 'not-a-cursor'}))[0], 404,
+        )
+
+    async def test_token_required_and_read_only(self):
+        response = await async_views.inventory_summary(self.factory.get('/api/inventory/summary/'))
+        self.assertEqual(response.status_code, 401)
+        response = await async_views.transfer_logs(self.factory.post('/api/transfers/', headers=self.headers))
+        self.assertEqual(response.status_code, 405)
+
+
+class IdempotencyTests(StockTestMixin, TestCase):
+    def test_replay_returns_stored_response_once_applied(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[1]
+        first = self.transfer(product, source, destination, 3, HTTP_IDEMPOTENCY_KEY='move-1')
+        replay = self.transfer(product, source, destination, 3, HTTP_IDEMPOTENCY_KEY='move-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((replay.status_code, replay.json()), (first.status_code, first.json()))
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual((self.quantity(product, source), self.quantity(product, destination)), (7, 13))
+        self.assertEqual(TransferLog.objects.count(), 1)
+
+    def test_key_reused_with_other_payload(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[1]
+        self.transfer(product, source, destination, 3, HTTP_IDEMPOTENCY_KEY='move-1')
+        response = self.transfer(product, source, destination, 4, HTTP_IDEMPOTENCY_KEY='move-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.quantity(product, source), 7)
+
+    def test_rejected_transfer_is_replayed_too(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[1]
+        first = self.transfer(product, source, destination, 50, HTTP_IDEMPOTENCY_KEY='too-much')
+        Inventory.objects.filter(product=product, warehouse=source).update(quantity=100)
+        replay = self.transfer(product, source, destination, 50, HTTP_IDEMPOTENCY_KEY='too-much')
+        self.assertEqual(first.status_code, 400)
+        self.assertEqual((replay.status_code, replay.json()), (400, first.json()))
+        self.assertEqual(self.quantity(product, source), 100)
+
+    def test_expired_key_runs_again_and_is_purged(self):
+        product, source, destination = self.products[0], self.warehouses[0], self.warehouses[1]
+        self.transfer(product, source, destination, 1, HTTP_IDEMPOTENCY_KEY='move-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.transfer(product, source, destination, 1, HTTP_IDEMPOTENCY_KEY='move-1')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(self.quantity(product, source), 8)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(idempotency.purge_expired(batch_size=1), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_invalid_key(self):
+        response = self.transfer(self.products[0], self.warehouses[0], self.warehouses[1], 1,
+                                 HTTP_IDEMPOTENCY_KEY='x' * 256)
+        self.assertEqual(response.status_code, 400)
+
+
+class ReservationTests(StockTestMixin, TestCase):
+    def reserve(self, quantity, product=None, warehouse=None, **extra):
+        product, warehouse = product or self.products[0], warehouse or self.warehouses[0]
+        return self.client.post('/api/reservations/', {
+            'product_id': product.pk, 'warehouse_id': warehouse.pk, 'quantity': quantity, **extra,
+        }, format='json')
+
+    def row(self, product=None, warehouse=None):
+        return Inventory.objects.get(product=product or self.products[0], warehouse=warehouse or self.warehouses[0])
+
+    def test_hold_reduces_generated_available(self):
+        response = self.reserve(4)
+        self.assertEqual(response.status_code, 201)
+        row = self.row()
+        self.assertEqual((row.quantity, row.reserved, row.available), (10, 4, 6))
+        self.assertEqual(self.reserve(7).status_code, 400)
+        # перемещение видит только свободный остаток
+        self.assertEqual(self.transfer(self.products[0], self.warehouses[0], self.warehouses[1], 7).status_code, 400)
+        self.assertEqual(self.reserve(1, warehouse=Warehouse.objects.create(name='W3', location='L')).status_code, 404)
+
+    def test_confirm_writes_off_or_moves_held_quantity(self):
+        written_off = self.reserve(3).json()['id']
+        moved = self.reserve(2).json()['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/api/reservations/{written_off}/confirm/').status_code, 200)
+            response = self.client.post(f'/api/reservations/{moved}/confirm/',
+                                        {'to_warehouse_id': self.warehouses[1].pk}, format='json')
+        self.assertEqual(response.json()['status'], StockReservation.CONFIRMED)
+        row = self.row()
+        self.assertEqual((row.quantity, row.reserved, row.available), (5, 0, 5))
+        self.assertEqual(self.quantity(self.products[0], self.warehouses[1]), 12)
+        self.assertEqual(self.client.post(f'/api/reservations/{moved}/release/').status_code, 409)
+
+    def test_release_returns_quantity(self):
+        reservation = self.reserve(4).json()['id']
+        response = self.client.post(f'/api/reservations/{reservation}/release/')
+        self.assertEqual(response.json()['status'], StockReservation.RELEASED)
+        self.assertEqual(self.row().available, 10)
+
+    def test_expired_hold_cannot_be_confirmed_and_is_swept(self):
+        expired = self.reserve(4).json()['id']
+        self.reserve(2, product=self.products[1])
+        StockReservation.objects.filter(pk=expired).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.post(f'/api/reservations/{expired}/confirm/').status_code, 409)
+
+        call_command('expire_reservations', stdout=StringIO())
+        self.assertEqual(StockReservation.objects.get(pk=expired).status, StockReservation.EXPIRED)
+        self.assertEqual((self.row().reserved, self.row().available), (0, 10))
+        self.assertEqual(self.row(product=self.products[1]).available, 8)
+
+    def test_ttl_is_capped(self):
+        with override_settings(RESERVATION_MAX_TTL=60):
+            self.assertEqual(self.reserve(1, ttl_seconds=61).status_code, 400)
+
+
+class AsOfTests(StockTestMixin, TestCase):
+    """Остатки на момент времени: снимок плюс последние записи журнала после него."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        first, second = cls.products[0], cls.products[1]
+        warehouse = cls.warehouses[0]
+        cls.log(first, 'add', 10, hours=0)
+        cls.log(second, 'add', 10, hours=0)
+        for product in (first, second):
+            InventorySnapshot.objects.create(
+                taken_at=cls.at(1), product=product, warehouse=warehouse, quantity=10,
+            )
+        cls.log(first, 'update', 4, hours=2)
+        cls.log(second, 'remove', 0, hours=3)
+        cls.log(first, 'update', 7, hours=4)
+        # после снимка запись с тем же временем, что и другая: побеждает большая id
+        cls.log(first, 'update', 8, hours=4)
+
+    @classmethod
+    def at(cls, hours):
+        return cls.start + timedelta(hours=hours)
+
+    @classmethod
+    def log(cls, product, operation, quantity, hours):
+        entry = InventoryLog.objects.create(
+            product=product, warehouse=cls.warehouses[0], quantity=quantity, operation=operation,
+        )
+        InventoryLog.objects.filter(pk=entry.pk).update(created_at=cls.at(hours))
+
+    def quantities(self, hours):
+        return history.warehouse_quantities(self.warehouses[0].pk, self.at(hours) + timedelta(minutes=30))
+
+    def test_reconstruction_around_snapshot(self):
+        first, second = self.products[0].pk, self.products[1].pk
+        # до первого снимка — по журналу
+        self.assertEqual(self.quantities(0), {first: 10, second: 10})
+        self.assertEqual(self.quantities(1), {first: 10, second: 10})
+        self.assertEqual(self.quantities(2), {first: 4, second: 10})
+        self.assertEqual(self.quantities(3), {first: 4})
+        self.assertEqual(self.quantities(4), {first: 8})
+
+    def test_snapshot_without_later_logs_is_used_as_is(self):
+        InventorySnapshot.objects.filter(product=self.products[0]).update(quantity=99)
+        self.assertEqual(self.quantities(1)[self.products[0].pk], 99)
+
+    def test_summary_as_of(self):
+        totals = history.product_totals(self.at(3) + timedelta(minutes=30))
+        self.assertEqual(totals[self.products[0].pk], [4, 1])
+        self.assertEqual(totals[self.products[1].pk], [0, 0])
+
+        response = self.client.get('/api/inventory/summary/', {'as_of': (self.at(2) + timedelta(minutes=30)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['sku'], row['total_quantity']) for row in response.json()['results']], [('SKU0', 4), ('SKU1', 10)],
+        )
+        self.assertEqual(self.client.get('/api/inventory/summary/', {'as_of': 'yesterday'}).status_code, 400)
+
+    def test_warehouse_inventory_as_of_now_matches_live_rows(self):
+        InventoryLog.objects.all().delete()
+        InventorySnapshot.objects.all().delete()
+        history.take_snapshot()
+        self.transfer(self.products[2], self.warehouses[0], self.warehouses[1], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.filter(product=self.products[3], warehouse=self.warehouses[0]).delete()
+
+        warehouse = self.warehouses[0]
+        response = self.client.get(f'/api/warehouses/{warehouse.pk}/inventory/',
+                                   {'as_of': (timezone.now() + timedelta(seconds=1)).isoformat()})
+        live = self.client.get(f'/api/warehouses/{warehouse.pk}/inventory/')
+        self.assertEqual(response.json(), sorted(live.json(), key=lambda row: row['product_id']))
+
+    def test_available_as_of_counts_reservations_open_then(self):
+        product, warehouse = self.products[0], self.warehouses[0]
+        held = StockReservation.objects.create(
+            user=self.user, product=product, warehouse=warehouse, quantity=3, expires_at=self.at(10),
+        )
+        closed = StockReservation.objects.create(
+            user=self.user, product=product, warehouse=warehouse, quantity=1, expires_at=self.at(10),
+            status=StockReservation.RELEASED, closed_at=self.at(4),
+        )
+        StockReservation.objects.filter(pk__in=[held.pk, closed.pk]).update(created_at=self.at(2))
+
+        def available(hours):
+            [row] = history.warehouse_inventory(warehouse.pk, self.at(hours) + timedelta(minutes=30), [product.pk])
+            return row['quantity'], row['available']
+
+        self.assertEqual(available(1), (10, 10))
+        self.assertEqual(available(3), (4, 0))
+        self.assertEqual(available(4), (8, 5))
+
+
+class RebalancePlanTests(StockTestMixin, TestCase):
+    url = '/api/inventory/rebalance/plan/'
+
+    def plan(self, rules, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'rules': rules, **extra}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def moves(self, body):
+        return sorted(
+            (move['product_id'], move['from_warehouse_id'], move['to_warehouse_id'], move['quantity'])
+            for move in body['transfers']
+        )
+
+    def test_deficit_covered_by_largest_donors(self):
+        product, (first, second, third) = self.products[0], self.warehouses
+        Inventory.objects.filter(product=product, warehouse=second).update(quantity=14)
+        body = self.plan([{'warehouse_id': third.pk, 'product_id': product.pk, 'target': 25}])
+        self.assertEqual(self.moves(body), [(product.pk, first.pk, third.pk, 1), (product.pk, second.pk, third.pk, 14)])
+        self.assertEqual((body['moved_quantity'], body['unmet'], body['applied']), (15, [], False))
+        self.assertEqual(self.quantity(product, third), 10)
+
+    def test_unmet_deficit_and_min_of_donors(self):
+        product, (first, second, third) = self.products[0], self.warehouses
+        body = self.plan([
+            {'warehouse_id': first.pk, 'product_id': product.pk, 'min': 8},
+            {'warehouse_id': third.pk, 'product_id': product.pk, 'target': 30},
+        ])
+        self.assertEqual(self.moves(body), [(product.pk, first.pk, third.pk, 2), (product.pk, second.pk, third.pk, 10)])
+        self.assertEqual(body['unmet'], [{'product_id': product.pk, 'warehouse_id': third.pk, 'quantity': 8}])
+
+    def test_excess_over_max_is_moved_out_and_reservations_are_kept(self):
+        first = self.warehouses[0]
+        reservations.reserve(self.user, self.products[0].pk, first.pk, 4)
+        body = self.plan([{'warehouse_id': first.pk, 'max': 4}], apply=True)
+        self.assertTrue(body['applied'])
+        # товару 0 зарезервированные 4 шт. остаются на складе: вывозится только свободное сверх max
+        self.assertEqual(body['moved_quantity'], 4 * 6 + 2)
+        self.assertEqual(len(body['transfers']), len(self.products))
+        available = dict(Inventory.objects.filter(warehouse=first).values_list('product_id', 'available'))
+        self.assertEqual(set(available.values()), {4})
+        totals = Inventory.objects.values('product_id').annotate(total=Sum('quantity'))
+        self.assertEqual({row['total'] for row in totals}, {30})
+
+    def test_plan_function_limits_moves_to_donors_plus_receivers(self):
+        warehouse_ids = [warehouse.pk for warehouse in self.warehouses]
+        rules = [rebalance.Rule(self.warehouses[0].pk, None, 0, 0), rebalance.Rule(self.warehouses[1].pk, None, 15, None)]
+        plan = rebalance.plan(rules, warehouse_ids)
+        self.assertEqual(plan.moved_quantity, 10 * len(self.products))
+        self.assertLessEqual(len(plan.transfers), 2 * len(self.products))
+        self.assertEqual(plan.unplaced, [])
+
+    def test_unknown_warehouse(self):
+        response = self.client.post(self.url, {'rules': [{'warehouse_id': 999, 'target': 1}]}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(WAREHOUSES_REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(SimpleTestCase):
+    """Выбор базы для чтения; здоровье реплики подменено, к базам тесты не обращаются."""
+
+    def setUp(self):
+        self.replica_healthy = routing.replica_healthy
+        patcher = mock.patch.object(routing, 'replica_healthy', return_value=True)
+        self.healthy = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, path, method='get', **extra):
+        request = getattr(RequestFactory(), method)(path, **extra)
+        request.resolver_match = resolve(path)
+        return request
+
+    def alias(self, path, method='get', **extra):
+        return routing.RoutingState(self.request(path, method, **extra)).read_alias()
+
+    def test_marked_reads_go_to_replica(self):
+        self.assertEqual(self.alias('/api/inventory/summary/'), 'replica')
+        self.assertEqual(self.alias('/api/transfers/'), 'replica')
+        # выдача склада кэшируется и читается с основной базы
+        self.assertEqual(self.alias('/api/warehouses/1/inventory/'), 'default')
+        self.assertEqual(self.alias('/api/inventory/transfer/', method='post'), 'default')
+
+    def test_recent_writer_and_unhealthy_replica_read_primary(self):
+        recent = f'{routing.PRIMARY_COOKIE}={time.time() + 5}'
+        self.assertEqual(self.alias('/api/inventory/summary/', HTTP_COOKIE=recent), 'default')
+        expired = f'{routing.PRIMARY_COOKIE}={time.time() - 5}'
+        self.assertEqual(self.alias('/api/inventory/summary/', HTTP_COOKIE=expired), 'replica')
+
+        self.healthy.return_value = False
+        self.assertEqual(self.alias('/api/inventory/summary/'), 'default')
+
+    def test_write_sticks_to_primary_and_sets_cookie(self):
+        request = self.request('/api/inventory/summary/')
+        state = routing.RoutingState(request)
+        self.assertEqual(state.read_alias(), 'replica')
+        state.wrote = True
+        self.assertEqual(state.read_alias(), 'default')
+
+        response = routing.ReplicaRoutingMiddleware._finish(request, HttpResponse(), state)
+        self.assertGreater(float(response.cookies[routing.PRIMARY_COOKIE].value), time.time())
+        rejected = routing.ReplicaRoutingMiddleware._finish(request, HttpResponse(status=400), state)
+        self.assertNotIn(routing.PRIMARY_COOKIE, rejected.cookies)
+
+    @override_settings(REPLICA_MAX_LAG=5, REPLICA_CHECK_INTERVAL=60)
+    def test_lagging_replica_is_skipped_until_next_check(self):
+        self.addCleanup(routing._health.pop, 'replica', None)
+        with mock.patch.object(routing, 'replica_lag', return_value=12.0) as lag, \
+                self.assertLogs('warehouses.routing', 'WARNING'):
+            self.assertFalse(self.replica_healthy('replica'))
+            self.assertFalse(self.replica_healthy('replica'))
+        self.assertEqual(lag.call_count, 1)
+
+    def test_replica_is_never_migrated(self):
+        self.assertIs(routing.ReplicaRouter().allow_migrate('replica', 'warehouses'), False)
+        self.assertIsNone(routing.ReplicaRouter().allow_migrate('default', 'warehouses'))
+
+
+@override_settings(LOW_STOCK_WEBHOOK_URL='http://hooks.example.com/stock', LOW_STOCK_WEBHOOK_DEBOUNCE=30)
+class StockAlertTests(StockTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, self.warehouse = self.products[0], self.warehouses[0]
+        response = self.client.post('/api/inventory/reorder-levels/', {'levels': [
+            {'product_id': self.product.pk, 'warehouse_id': self.warehouse.pk, 'reorder_level': 5},
+            {'product_id': self.product.pk, 'warehouse_id': 999, 'reorder_level': 5},
+        ]}, format='json')
+        self.assertEqual(response.json(), {'updated': 1, 'missing': 1})
+
+    def states(self):
+        return list(StockAlert.objects.order_by('id').values_list('state', 'quantity'))
+
+    def test_crossing(self):
+        self.assertEqual(alerts.crossing(5, 4, 5), StockAlert.LOW)
+        self.assertEqual(alerts.crossing(None, 4, 5), StockAlert.LOW)
+        self.assertIsNone(alerts.crossing(4, 3, 5))
+        self.assertEqual(alerts.crossing(4, 5, 5), StockAlert.RECOVERED)
+        self.assertIsNone(alerts.crossing(None, 6, 5))
+        self.assertIsNone(alerts.crossing(6, 5, 5))
+
+    def test_alerts_only_on_threshold_crossings(self):
+        other = self.warehouses[1]
+        self.transfer(self.product, self.warehouse, other, 6)
+        self.transfer(self.product, self.warehouse, other, 1)
+        self.transfer(self.product, other, self.warehouse, 3)
+        self.assertEqual(self.states(), [(StockAlert.LOW, 4), (StockAlert.RECOVERED, 6)])
+
+        self.transfer(self.product, self.warehouse, other, 2)
+        rows = self.client.get('/api/inventory/low-stock/', {'warehouse': self.warehouse.pk}).json()['results']
+        self.assertEqual([(row['product'], row['shortage']) for row in rows], [(self.product.pk, 1)])
+
+    def test_rolled_back_write_leaves_no_alert(self):
+        try:
+            with transaction.atomic():
+                Inventory.objects.filter(product=self.product, warehouse=self.warehouse).update(quantity=1)
+                self.assertEqual(StockAlert.objects.count(), 1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(StockAlert.objects.exists())
+
+    @override_settings(LOW_STOCK_WEBHOOK_URL=None)
+    def test_no_alerts_without_webhook(self):
+        self.transfer(self.product, self.warehouse, self.warehouses[1], 8)
+        self.assertFalse(StockAlert.objects.exists())
+
+    def test_dispatch_waits_for_debounce_and_sends_last_state(self):
+        other = self.warehouses[1]
+        self.transfer(self.product, self.warehouse, other, 6)
+        self.transfer(self.product, other, self.warehouse, 6)
+        with mock.patch.object(alerts, 'post_webhook') as post:
+            self.assertEqual(alerts.dispatch(), 0)
+            post.assert_not_called()
+
+            StockAlert.objects.update(created_at=timezone.now() - timedelta(seconds=31))
+            self.assertEqual(alerts.dispatch(), 2)
+        [body] = [call.args[0] for call in post.call_args_list]
+        self.assertEqual([(alert['state'], alert['quantity']) for alert in body['alerts']], [(StockAlert.RECOVERED, 10)])
+        self.assertFalse(StockAlert.objects.filter(dispatched_at__isnull=True).exists())
+
+    def test_failed_delivery_stays_queued(self):
+        self.transfer(self.product, self.warehouse, self.warehouses[1], 6)
+        StockAlert.objects.update(created_at=timezone.now() - timedelta(seconds=31))
+        with mock.patch.object(alerts, 'post_webhook', side_effect=OSError), self.assertLogs('warehouses.alerts'):
+            call_command('dispatch_stock_alerts', stdout=StringIO())
+        self.assertTrue(StockAlert.objects.filter(dispatched_at__isnull=True).exists())
+
+
+class InventorySlotTests(StockTestMixin, TestCase):
+    """Шардированная строка: количество строки вместе со слотами сохраняется при любых операциях."""
+
+    def setUp(self):
+        super().setUp()
+        self.product, self.hot = self.products[0], self.warehouses[0]
+        self.inventory = Inventory.objects.get(product=self.product, warehouse=self.hot)
+        slots.set_slots(self.inventory.pk, 4)
+
+    def live(self, warehouse=None):
+        return Inventory.objects.with_slot_totals().get(
+            product=self.product, warehouse=warehouse or self.hot,
+        ).live_quantity
+
+    def held(self):
+        return list(InventorySlot.objects.filter(inventory=self.inventory).order_by('slot').values_list('quantity', flat=True))
+
+    def test_set_slots_spreads_and_folds_back(self):
+        self.assertEqual(self.held(), [3, 3, 2, 2])
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 0)
+        self.assertEqual(self.live(), 10)
+        slots.set_slots(self.inventory.pk, 0)
+        self.assertEqual((Inventory.objects.get(pk=self.inventory.pk).quantity, self.held()), (10, []))
+
+    def test_transfers_conserve_quantity(self):
+        other = self.warehouses[1]
+        for quantity in (3, 1, 4, 2):
+            self.assertEqual(self.transfer(self.product, self.hot, other, quantity).status_code, 200)
+            self.assertEqual(self.transfer(self.product, other, self.hot, 1).status_code, 200)
+        # ушло 10, вернулось 4
+        self.assertEqual((self.live(), self.live(other)), (4, 16))
+        # больше, чем во всех слотах, не списывается
+        self.assertEqual(self.transfer(self.product, self.hot, other, 5).status_code, 400)
+        self.assertEqual(sum(self.held()) + Inventory.objects.get(pk=self.inventory.pk).quantity, 4)
+        self.assertEqual(
+            Inventory.objects.with_slot_totals().filter(product=self.product).aggregate(total=Sum('live_quantity'))['total'],
+            30,
+        )
+
+    def test_withdraw_collects_from_several_slots(self):
+        self.assertTrue(slots.withdraw(self.inventory.pk, 4, 9))
+        self.assertEqual(sum(self.held()), 1)
+        self.assertFalse(slots.withdraw(self.inventory.pk, 4, 2))
+        self.assertEqual(self.live(), 1)
+
+    def test_reservation_and_compaction(self):
+        reservations.reserve(self.user, self.product.pk, self.hot.pk, 7)
+        row = Inventory.objects.with_slot_totals().get(pk=self.inventory.pk)
+        self.assertEqual((row.live_quantity, row.reserved, row.live_available), (10, 7, 3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = slots.compact(self.inventory.pk)
+        self.assertTrue(changed)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 7)
+        self.assertEqual(self.held(), [1, 1, 1, 0])
+        self.assertEqual(InventoryLog.objects.filter(product=self.product, warehouse=self.hot).latest('id').quantity, 10)
+        self.assertFalse(slots.compact(self.inventory.pk))
+
+
+class MovementAnalyticsTests(StockTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        first, second, third = cls.warehouses
+        cls.move(1, first, second, 5)
+        cls.move(2, first, second, 3)
+        cls.move(2, second, third, 2, product=cls.products[1])
+
+    @classmethod
+    def move(cls, day, source, destination, quantity, product=None):
+        entry = TransferLog.objects.create(
+            product=product or cls.products[0], from_warehouse=source, to_warehouse=destination, quantity=quantity,
+        )
+        moment = timezone.make_aware(datetime(2026, 1, day, 12))
+        TransferLog.objects.filter(pk=entry.pk).update(timestamp=moment)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def report(self, **params):
+        return analytics.as_rows(analytics.movements(date(2026, 1, 2), date(2026, 1, 3), **params))
+
+    def test_warehouse_movements_with_changes_and_rolling_sums(self):
+        rows = {(row['period'].day, row['warehouse_id']): row for row in self.report(window=2)}
+        first, second, third = (warehouse.pk for warehouse in self.warehouses)
+        self.assertEqual(sorted(rows), sorted((day, key) for day in (2, 3) for key in (first, second, third)))
+        self.assertEqual(rows[2, second], {
+            'period': date(2026, 1, 2), 'warehouse_id': second, 'inbound': 3, 'outbound': 2, 'net': 1,
+            'inbound_change': -2, 'outbound_change': 2, 'rolling_inbound': 8, 'rolling_outbound': 2,
+        })
+        # в пустой день строка есть, потому что движение изменилось к предыдущему дню
+        self.assertEqual(
+            (rows[3, first]['outbound'], rows[3, first]['outbound_change'], rows[3, first]['rolling_outbound']),
+            (0, -3, 3),
+        )
+
+    def test_product_movements_for_selected_warehouse(self):
+        rows = self.report(group_by='product', period='month', window=1, warehouse_ids=[self.warehouses[1].pk])
+        self.assertEqual(
+            [(row['product_id'], row['inbound'], row['outbound']) for row in rows],
+            [(self.products[0].pk, 8, 0), (self.products[1].pk, 0, 2)],
+        )
+
+    def test_closed_periods_are_read_from_cache(self):
+        self.report(window=2)
+        self.move(2, self.warehouses[0], self.warehouses[1], 100)
+        # сумма закрытого дня не пересчитывается: журнал перемещений только дописывается
+        with mock.patch.object(analytics, '_aggregate', wraps=analytics._aggregate) as aggregate:
+            rows = self.report(window=2)
+        aggregate.assert_not_called()
+        self.assertEqual(max(row['inbound'] for row in rows), 3)
+
+    def test_endpoint_rows_and_columns(self):
+        params = {'start_date': '2026-01-02', 'end_date': '2026-01-02', 'window': 1}
+        rows = self.client.get('/api/analytics/movements/', params).json()
+        columns = self.client.get('/api/analytics/movements/', {**params, 'layout': 'columns'}).json()
+        self.assertEqual(len(rows['results']), 3)
+        self.assertEqual(columns['columns']['inbound'], [row['inbound'] for row in rows['results']])
+        response = self.client.get('/api/analytics/movements/', {'start_date': '2026-01-03', 'end_date': '2026-01-02'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConsistencyTests(StockTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # журнал строк из setUpTestData не записан (on_commit там не выполняется): начинаем с согласованного
+        with self.captureOnCommitCallbacks(execute=True):
+            consistency.repair(list(consistency.verify()))
+        self.assertEqual(list(consistency.verify()), [])
+
+    def kinds(self):
+        return {(item.warehouse_id, item.product_id): item.kind for item in consistency.verify()}
+
+    def test_discrepancy_kinds_and_repair(self):
+        first, second, third = self.warehouses
+        Inventory.objects.filter(product=self.products[0], warehouse=first).raw_update(quantity=3)
+        InventoryLog.objects.create(product=self.products[1], warehouse=first, quantity=0, operation='remove')
+        lost = Product.objects.create(name='Lost', sku='LOST')
+        InventoryLog.objects.create(product=lost, warehouse=first, quantity=4, operation='add')
+        TransferLog.objects.create(product=self.products[3], from_warehouse=second, to_warehouse=third, quantity=1)
+        # сырые записи пары свёрнуты: сверка идёт по закрытию последнего дня
+        InventoryLog.objects.filter(product=self.products[4], warehouse=third).delete()
+        InventoryLogRollup.objects.create(
+            day=date(2026, 1, 1), product=self.products[4], warehouse=third,
+            closing_quantity=10, net_change=0, entries=1,
+        )
+
+        self.assertEqual(self.kinds(), {
+            (first.pk, self.products[0].pk): 'quantity',
+            (first.pk, self.products[1].pk): 'unlogged_row',
+            (first.pk, lost.pk): 'missing_row',
+            (second.pk, self.products[3].pk): 'unlogged_transfer',
+            (third.pk, self.products[3].pk): 'unlogged_transfer',
+        })
+        [quantity] = [item for item in consistency.verify() if item.kind == 'quantity']
+        self.assertEqual((quantity.quantity, quantity.logged), (3, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(consistency.repair(list(consistency.verify())), 5)
+        self.assertEqual(list(consistency.verify()), [])
+        # остатки не меняются: журнал догоняет Inventory
+        self.assertEqual(self.quantity(self.products[0], first), 3)
+        self.assertEqual(InventoryLog.objects.filter(product=lost).latest('id').operation, 'remove')
+
+    def test_logs_flushed_out_of_commit_order(self):
+        product, warehouse = self.products[0], self.warehouses[0]
+        flushes = []
+        for quantity in (4, 7):
+            with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+                inventory = Inventory.objects.get(product=product, warehouse=warehouse)
+                inventory.quantity = quantity
+                inventory.save()
+            flushes.extend(callbacks)
+        # колбэк второй транзакции выполнился раньше первого: у старой записи большая id
+        for flush in reversed(flushes):
+            flush()
+        self.assertGreater(InventoryLog.objects.get(quantity=4).pk, InventoryLog.objects.get(quantity=7).pk)
+
+        self.assertEqual(list(consistency.verify()), [])
+        self.assertEqual(history.warehouse_quantities(warehouse.pk, timezone.now(), [product.pk]), {product.pk: 7})
+
+    def test_warehouse_ranges_split_the_check(self):
+        Inventory.objects.filter(warehouse=self.warehouses[2]).raw_update(quantity=0)
+        ranges = consistency.warehouse_ranges(2)
+        self.assertEqual(ranges, [
+            (self.warehouses[0].pk, self.warehouses[1].pk), (self.warehouses[2].pk, self.warehouses[2].pk),
+        ])
+        self.assertEqual([len(list(consistency.verify(bounds))) for bounds in ranges], [0, len(self.products)])
+
+    def test_command_fails_until_repaired(self):
+        Inventory.objects.filter(product=self.products[0], warehouse=self.warehouses[0]).raw_update(quantity=3)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 discrepancies'):
+            call_command('verify_inventory', stdout=out)
+        self.assertIn('quantity (inventory 3, log 10)', out.getvalue())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('verify_inventory', repair=True, stdout=StringIO())
+        call_command('verify_inventory', stdout=out)
+        self.assertIn('Inventory matches its logs.', out.getvalue())
+
+
+class LeanListTests(StockTestMixin, TestCase):
+    """Списки LeanListMixin: число запросов не зависит от размера страницы."""
+
+    def queries(self, path):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return len(captured), response.json()
+
+    def add_stock(self, count):
+        warehouse = Warehouse.objects.create(name='Extra', location='L')
+        for number in range(count):
+            product = Product.objects.create(name=f'Extra {number}', sku=f'EXTRA{number}')
+            Inventory.objects.create(product=product, warehouse=warehouse, quantity=number)
+            TransferLog.objects.create(
+                product=product, from_warehouse=self.warehouses[0], to_warehouse=warehouse, quantity=1,
+            )
+
+    def test_transfers_page_size(self):
+        self.add_stock(30)
+        small, body = self.queries('/api/transfers/?page_size=2')
+        self.assertEqual(len(body['results']), 2)
+        large, body = self.queries('/api/transfers/?page_size=25')
+        self.assertEqual(len(body['results']), 25)
+        self.assertEqual(large, small)
+
+    def test_unpaginated_lists_row_count(self):
+        # эти списки отдаются целиком: страница растёт вместе с данными
+        paths = ['/api/inventory/', '/api/products/', '/api/warehouses/']
+        before = {path: self.queries(path) for path in paths}
+        self.add_stock(30)
+        for path in paths:
+            with self.subTest(path):
+                queries, body = self.queries(path)
+                self.assertGreater(len(body), len(before[path][1]))
+                self.assertEqual(queries, before[path][0])
+
+
+@override_settings(CACHES=load.NO_CACHE)
+class QueryBudgetTests(TransactionTestCase):
+    """Бюджеты suite.QUERY_BUDGETS: число запросов к базе на вызов эндпоинта, с настоящими транзакциями."""
+
+    def setUp(self):
+        user = User.objects.create_user('benchmark')
+        self.token = Token.objects.create(user=user).key
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def measure(self):
+        history.take_snapshot()
+        warehouse_id = Inventory.objects.order_by('warehouse_id').values_list('warehouse_id', flat=True).first()
+        counts = {}
+        for name, (method, path, body) in suite.endpoint_requests(warehouse_id, suite.transfer_candidate()).items():
+            queries, status, _ = suite.measure_endpoint(self.client, method, path, body, repeat=1)
+            self.assertLess(status, 400, name)
+            counts[name] = queries
+        return counts
+
+    def test_endpoints_within_budget_at_two_scales(self):
+        data.generate(3, 30, 0.5, log_entries=100, transfer_entries=20)
+        small = self.measure()
+        # второй масштаб на чистых данных: номера SKU генератора повторяются
+        Inventory.objects.all().delete()
+        Product.objects.all().delete()
+        Warehouse.objects.all().delete()
+        data.generate(6, 120, 0.5, log_entries=600, transfer_entries=120, seed=1)
+        large = self.measure()
+        for name, budget in suite.QUERY_BUDGETS.items():
+            with self.subTest(name):
+                self.assertLessEqual(small[name], budget)
+                self.assertLessEqual(large[name], budget)
+
+    def test_server_errors_are_violations(self):
+        stress = {"conserved": True, "transfer_logs_written": 3, "succeeded": 3, "server_errors": 2}
+        self.assertEqual(suite._stress_violations("stress", stress), ["stress: 2 server errors"])
+        self.assertEqual(suite._stress_violations("stress", {**stress, "server_errors": 0}), [])
+
+
+class ChangeFeedCursorTests(StockTestMixin, TestCase):
+    def write(self, quantity):
+        changefeed.write_logs([InventoryLog(
+            product=self.products[0], warehouse=self.warehouses[0], quantity=quantity, operation='update',
+        )])
+        return InventoryLog.objects.latest('id').pk
+
+    def test_rows_past_the_watermark_are_held_back(self):
+        after = self.write(1)
+        self.assertEqual(changefeed.latest_id(), after)
+        # запись, ещё не зафиксированная вместе с границей (вставка в обход write_logs)
+        pending = InventoryLog.objects.create(
+            product=self.products[0], warehouse=self.warehouses[0], quantity=2, operation='update',
+        )
+        self.assertEqual(changefeed.fetch_changes(after), [])
+        self.assertEqual(changefeed.latest_id(), after)
+
+        last = self.write(3)
+        self.assertEqual(
+            [row[0] for row in changefeed.fetch_changes(after)], [pending.pk, last],
+        )
+        self.assertEqual(changefeed.latest_id(), last)
+
+    def test_rows_are_filtered_by_warehouse(self):
+        after = changefeed.latest_id()
+        last = self.write(5)
+        self.assertEqual(
+            changefeed.fetch_changes(after), [(last, self.products[0].pk, self.warehouses[0].pk, 5)],
+        )
+        self.assertEqual(changefeed.fetch_changes(after, [self.warehouses[1].pk]), [])
+
+    def test_audit_flush_advances_the_watermark(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.filter(product=self.products[1], warehouse=self.warehouses[0]).update(quantity=4)
+            inventory = Inventory.objects.get(product=self.products[1], warehouse=self.warehouses[0])
+            inventory.save()
+        self.assertEqual(changefeed.latest_id(), InventoryLog.objects.latest('id').pk)
+
+
+@override_settings(CHANGE_FEED_BACKEND='local')
+class ChangeHubTests(TransactionTestCase):
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='W', location='L')
+        self.product = Product.objects.create(name='Widget', sku='SKU')
+
+    def receive(self, write, poll_interval):
+        # notify_local будит хаб процесса из get_hub()
+        hub = changefeed.get_hub()
+
+        async def run():
+            subscription = await hub.subscribe()
+            try:
+                await sync_to_async(write)()
+                return await subscription.get(5)
+            finally:
+                thread = hub._thread
+                hub.unsubscribe(subscription)
+                hub.notify()
+                await sync_to_async(thread.join)(5)
+
+        with override_settings(CHANGE_FEED_POLL_INTERVAL=poll_interval):
+            return async_to_sync(run)()
+
+    def test_local_notification_wakes_listener(self):
+        def write():
+            # журнал пишет warehouses.audit, он же будит слушателя процесса
+            Inventory.objects.create(product=self.product, warehouse=self.warehouse, quantity=4)
+
+        # без уведомления строки пришли бы только через минуту
+        rows = self.receive(write, poll_interval=60)
+        self.assertEqual([row[1:] for row in rows], [(self.product.pk, self.warehouse.pk, 4)])
+
+    def test_missed_notification_falls_back_to_polling(self):
+        def write():
+            # запись мимо warehouses.audit: уведомления нет, выручает страховочный опрос
+            changefeed.write_logs([
+                InventoryLog(product=self.product, warehouse=self.warehouse, quantity=7, operation='add'),
+            ])
+
+        rows = self.receive(write, poll_interval=0.1)
+        self.assertEqual([row[1:] for row in rows], [(self.product.pk, self.warehouse.pk, 7)])
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('keeper', 'keeper@example.com', 'secret')
+        cls.alpha = Product.objects.create(name='Widget Alpha', sku='WA-100')
+        cls.gadget = Product.objects.create(name='Gadget Beta', sku='GB-200')
+        cls.bolt = Product.objects.create(name='Steel Bolt M8', sku='SB-8')
+
+    def setUp(self):
+        # индекс в памяти перестраивается по версии в кэше, а on_commit в TestCase не выполняется
+        search.bump_version()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def found(self, term):
+        return [row['product_id'] for row in search.search_products(term)]
+
+    def test_word_similarity(self):
+        # целиком «widgt» и «Widget Alpha» похожи меньше порога, со словом «Widget» — больше
+        self.assertLess(len(search.trigrams('widgt') & search.trigrams('Widget Alpha'))
+                        / len(search.trigrams('widgt') | search.trigrams('Widget Alpha')), search.SIMILARITY_THRESHOLD)
+        self.assertGreaterEqual(
+            search.word_similarity(search.trigrams('widgt'), search.word_trigrams('Widget Alpha')),
+            search.SIMILARITY_THRESHOLD,
+        )
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='ngram')
+    def test_fallback_matches_misspelled_word(self):
+        self.assertEqual(self.found('widgt'), [self.alpha.pk])
+        self.assertEqual(self.found('stel bolt'), [self.bolt.pk])
+        self.assertEqual(self.found('qwerty'), [])
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='ngram')
+    def test_fallback_prefix_and_substring(self):
+        # префикс SKU важнее префикса названия, подстрока находится без сходства триграмм
+        self.assertEqual(self.found('gb')[0], self.gadget.pk)
+        self.assertEqual(self.found('olt m'), [self.bolt.pk])
+
+    def test_fallback_checks_only_posted_candidates(self):
+        index = search.NgramIndex(Product.objects.values_list('pk', 'name', 'sku'))
+        self.assertEqual(index._substring_candidates('olt m'), {self.bolt.pk})
+        self.assertEqual(index._substring_candidates('-2'), {self.gadget.pk})
+        self.assertEqual(index._substring_candidates('zzz'), set())
+        # поле короче триграммы индексируется целиком
+        self.assertEqual(search.NgramIndex([(1, 'Nut', 'N7')])._substring_candidates('n7'), {1})
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='ngram')
+    def test_endpoint(self):
+        response = self.client.get('/api/products/search/', {'q': 'widgt'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['product_id'] for row in response.json()], [self.alpha.pk])
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', "pg_trgm есть только в PostgreSQL")
+    @override_settings(PRODUCT_SEARCH_BACKEND='trigram')
+    def test_trigram_index_matches_misspelled_word(self):
+        self.assertEqual(self.found('widgt'), [self.alpha.pk])
+        self.assertEqual(self.found('gb')[0], self.gadget.pk)
+        self.assertIn(self.bolt.pk, list(search.matching_product_ids('stel bolt').values_list('pk', flat=True)))
+
+
+class RequestMetricsTests(StockTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        cache.clear()
+        self.url = f'/api/warehouses/{self.warehouses[0].pk}/inventory/'
+
+    def test_fingerprint_folds_values(self):
+        self.assertEqual(
+            middleware.fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (?) AND name = ? LIMIT ?",
+        )
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0, SLOW_REQUEST_QUERY_THRESHOLD=1, METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_sampled_request_reports_sql_and_slow_log(self):
+        with self.assertLogs('warehouses.requests', 'WARNING') as logs:
+            response = self.client.get(self.url)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+        self.assertIn('Slow request GET', logs.output[0])
+
+        body = self.client.get('/metrics').content.decode()
+        view = 'warehouse-warehouse-inventory'
+        self.assertIn(f'warehouses_http_requests_total{{view="{view}",method="GET",status="200"}} 1', body)
+        self.assertIn(f'warehouses_http_sampled_requests_total{{view="{view}"}} 1', body)
+        self.assertIn(f'warehouses_http_slow_requests_total{{view="{view}"}} 1', body)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request_has_only_wall_time(self):
+        response = self.client.get(self.url)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+$')
+        self.assertNotIn('warehouses_http_sampled_requests_total{', metrics.render())
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0, SLOW_REQUEST_QUERY_THRESHOLD=1000)
+    def test_streamed_export_is_recorded_after_body(self):
+        response = self.client.get(f'/api/warehouses/{self.warehouses[0].pk}/inventory/export/')
+        view = 'warehouse-warehouse-inventory-export'
+        # время SQL до чтения тела не известно и в заголовок не попадает
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+$')
+        self.assertNotIn(f'view="{view}"', metrics.render())
+        b''.join(response.streaming_content)
+        self.assertIn(f'warehouses_http_sql_queries_total{{view="{view}"}}', metrics.render())
+
+
+class MetricsAccessTests(TestCase):
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=[])
+    def test_denied_by_default(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=[])
+    def test_bearer_token(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'warehouses_http_requests_total', response.content)
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_allowed_network(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='192.168.1.1').status_code, 403)
+
+
+class LogRetentionTests(StockTestMixin, TestCase):
+    def test_current_month_is_utc(self):
+        # 23:30 UTC 31 января — в Москве уже 1 февраля, секции же режутся по UTC
+        moment = datetime(2026, 1, 31, 23, 30, tzinfo=dt_timezone.utc)
+        with mock.patch('warehouses.partitioning.now', return_value=moment):
+            self.assertEqual(partitioning.utc_today(), date(2026, 1, 31))
+
+    @skipUnless(connection.vendor != 'postgresql', "на PostgreSQL старые месяцы отсоединяются секциями")
+    def test_old_rows_are_rolled_up_and_deleted(self):
+        product, warehouse = self.products[0], self.warehouses[0]
+        old = partitioning.as_datetime(partitioning.add_months(partitioning.month_start(partitioning.utc_today()), -3))
+        for quantity in (4, 6):
+            entry = InventoryLog.objects.create(product=product, warehouse=warehouse, quantity=quantity, operation='update')
+            InventoryLog.objects.filter(pk=entry.pk).update(created_at=old + timedelta(hours=quantity))
+
+        call_command('manage_log_partitions', retain_months=1, stdout=StringIO())
+        self.assertFalse(InventoryLog.objects.filter(created_at__lt=old + timedelta(days=1)).exists())
+        rollup = InventoryLogRollup.objects.get(product=product, warehouse=warehouse)
+        self.assertEqual((rollup.day, rollup.closing_quantity, rollup.entries), (old.date(), 6, 2))
+
+
+@skipUnless(connection.vendor == 'postgresql', "секции есть только в PostgreSQL")
+class PartitionTests(StockTestMixin, TestCase):
+    table = InventoryLog._meta.db_table
+
+    def default_rows(self):
+        with connection.cursor() as cursor:
+            default = partitioning.default_partition(cursor, self.table)
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(default)}")
+            return cursor.fetchone()[0]
+
+    def test_rows_in_default_partition_move_to_new_month(self):
+        far = date(2100, 5, 1)
+        entry = InventoryLog.objects.create(
+            product=self.products[0], warehouse=self.warehouses[0], quantity=1, operation='update',
+        )
+        InventoryLog.objects.filter(pk=entry.pk).update(created_at=partitioning.as_datetime(far))
+        self.assertEqual(self.default_rows(), 1)
+
+        created = partitioning.ensure_partitions(self.table, months_ahead=0)
+        self.assertIn(partitioning.partition_name(self.table, far), created)
+        self.assertEqual(self.default_rows(), 0)
+        self.assertIn((far, partitioning.partition_name(self.table, far)), partitioning.monthly_partitions(self.table))
+        self.assertTrue(InventoryLog.objects.filter(pk=entry.pk).exists())
+
+    def test_ensure_partitions_is_idempotent(self):
+        partitioning.ensure_partitions(self.table, months_ahead=2)
+        self.assertEqual(partitioning.ensure_partitions(self.table, months_ahead=2), [])
+
+
+@override_settings(EXPORT_JOB_TIMEOUT=0.5)
+class ExportJobHeartbeatTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(EXPORT_JOBS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+
+        user = User.objects.create_user('exporter')
+        ExportJob.objects.create(user=user, kind=ExportJob.INVENTORY)
+        self.job = jobs.claim()
+
+    def run_stalled(self, during_stall):
+        """Выполняет задание, выгрузка которого встаёт на секунду после первой строки."""
+        def rows():
+            yield [1, 'Widget', 'SKU1', 5]
+            time.sleep(1)
+            during_stall()
+            yield [2, 'Widget', 'SKU2', 7]
+
+        with mock.patch.object(jobs, 'HEARTBEAT_INTERVAL', 0.05), \
+                mock.patch.object(jobs, 'job_rows', return_value=(['product', 'name', 'sku', 'quantity'], rows())):
+            jobs.run(self.job)
+        return ExportJob.objects.get(pk=self.job.pk)
+
+    def test_stalled_export_keeps_heartbeat(self):
+        requeued = []
+        # выгрузка стоит дольше EXPORT_JOB_TIMEOUT, но пульс идёт, и задание не возвращается в очередь
+        job = self.run_stalled(lambda: requeued.append(jobs.requeue_stale()))
+        self.assertEqual(requeued, [0])
+        self.assertEqual((job.status, job.rows), (ExportJob.DONE, 2))
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+    def test_attempt_taken_over_during_stall_is_discarded(self):
+        def take_over():
+            ExportJob.objects.filter(pk=self.job.pk).update(status=ExportJob.QUEUED)
+
+        job = self.run_stalled(take_over)
+        self.assertEqual(job.status, ExportJob.QUEUED)
+        self.assertEqual(job.artifact, '')
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class StartupTests(SimpleTestCase):
+    def test_import_breakdown(self):
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       100 |        100 |     encodings.utf_8',
+            'import time:      2000 |       5000 | django',
+            'import time:       300 |        300 |   django.utils',
+            'import time:      1000 |       1000 | rest_framework',
+        ])
+        total, slowest = startup.import_breakdown(stderr, top=1)
+        self.assertAlmostEqual(total, 0.0034)
+        self.assertEqual(slowest, [('django', 0.005)])
+
+    def test_gunicorn_master_reenables_gc_when_ready(self):
+        self.addCleanup(gc.enable)
+        with mock.patch.dict(os.environ):
+            config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        # выключен только на время загрузки приложения в мастере
+        self.assertFalse(gc.isenabled())
+        config['when_ready'](None)
+        self.assertTrue(gc.isenabled())
+
+    def test_warm_connections_skips_unavailable_database(self):
+        default = connections['default']
+        with mock.patch.object(default, 'ensure_connection', side_effect=DatabaseError), \
+                self.assertLogs('warehouses.warmup', 'WARNING') as logs:
+            warmup.warm_connections()
+        self.assertIn('Database default is unavailable at startup', logs.output[0])
+
+    def test_api_profile_loads_fewer_modules_and_shares_memory_after_fork(self):
+        full, _ = startup.run_probe('load', 'full')
+        api, _ = startup.run_probe('load', 'api')
+        self.assertLess(api['modules'], full['modules'])
+        preload, _ = startup.run_probe('preload', 'api', workers=2)
+        self.assertEqual(len(preload['workers']), 2)
@@ -0,0 +1,260 @@
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, F, Q, Value, When
+
+from warehouses import slots
+from warehouses.changes import InventoryChange, inventory_changed
+from warehouses.models import Warehouse, Product, Inventory, TransferLog, live_quantity
+
+
+class TransferError(Exception):
+    """Ошибка пакетного перемещения: errors — список {"index", "error"} по строкам пакета."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class TransferRejected(Exception):
+    """Отказ одиночного перемещения: error — текст ответа, status — HTTP-статус."""
+
+    def __init__(self, error, status):
+        super().__init__(error)
+        self.error = error
+        self.status = status
+
+
+def _pairs_filter(pairs):
+    return reduce(or_, (Q(product_id=product_id, warehouse_id=warehouse_id) for product_id, warehouse_id in pairs))
+
+
+def _check_references(lines):
+    product_ids = {line['product_id'] for line in lines}
+    warehouse_ids = {line['from_warehouse_id'] for line in lines} | {line['to_warehouse_id'] for line in lines}
+
+    known_products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    known_warehouses = set(Warehouse.objects.filter(pk__in=warehouse_ids).values_list('pk', flat=True))
+
+    errors = []
+    for index, line in enumerate(lines):
+        if line['product_id'] not in known_products:
+            errors.append({"index": index, "error": "No such product."})
+        elif not {line['from_warehouse_id'], line['to_warehouse_id']} <= known_warehouses:
+            errors.append({"index": index, "error": "No such warehouse."})
+    return errors
+
+
+def apply_transfer_batch(lines):
+    """
+    Выполняет пакет перемещений атомарно: либо все строки, либо ни одной.
+
+    Число запросов не зависит от размера пакета: две проверки ссылок, блокировка
+    затронутых строк Inventory (select_for_update в порядке pk, чтобы параллельные
+    пакеты не взаимоблокировались), вставка недостающих строк получателей
+    (INSERT ... ON CONFLICT DO NOTHING) и их блокировка, один UPDATE через CASE
+    и bulk_create для TransferLog. Записи InventoryLog пишутся одним bulk_create
+    при фиксации транзакции (см. warehouses.audit). Остаток слотов шардированных строк пакета сначала переносится в сами строки.
+    """
+    errors = _check_references(lines)
+    if errors:
+        raise TransferError(errors)
+
+    pairs = set()
+    for line in lines:
+        pairs.add((line['product_id'], line['from_warehouse_id']))
+        pairs.add((line['product_id'], line['to_warehouse_id']))
+
+    with transaction.atomic():
+        locked = (
+            Inventory.objects
+            .select_for_update()
+            .filter(_pairs_filter(pairs))
+            .order_by('pk')
+            .values_list('pk', 'product_id', 'warehouse_id', 'quantity', 'reserved', 'slots')
+        )
+        locked = list(locked)
+        sharded = [pk for pk, _, _, _, _, row_slots in locked if row_slots]
+        moved = Inventory.objects.filter(pk__in=sharded).fold_slots() if sharded else {}
+        # (product_id, warehouse_id) -> [pk, количество до пакета, количество после, в резерве]
+        rows = {}
+        for pk, product_id, warehouse_id, quantity, reserved, _ in locked:
+            quantity += moved.get(pk, 0)
+            rows.setdefault((product_id, warehouse_id), [pk, quantity, quantity, reserved])
+
+        # Пакет применяется построчно в памяти, поэтому строка может опираться на поступление из предыдущей
+        errors = []
+        for index, line in enumerate(lines):
+            source = rows.get((line['product_id'], line['from_warehouse_id']))
+            if source is None:
+                errors.append({"index": index, "error": "No such product in source warehouse."})
+                continue
+            # зарезервированное количество перемещать нельзя
+            if source[2] - source[3] < line['quantity']:
+                errors.append({"index": index, "error": "Not enough product in source warehouse."})
+                continue
+            source[2] -= line['quantity']
+            destination = rows.setdefault((line['product_id'], line['to_warehouse_id']), [None, 0, 0, 0])
+            destination[2] += line['quantity']
+        if errors:
+            raise TransferError(errors)
+
+        # Недостающие строки получателей вставляются с нулём, как если бы существовали до пакета.
+        # Параллельный пакет может вставить ту же строку: конфликт пропускается, а строка
+        # блокируется и меняется тем же UPDATE, что и остальные
+        missing = {key: row for key, row in rows.items() if row[0] is None}
+        inserted = set()
+        if missing:
+            inserted = Inventory.objects.insert_missing(
+                Inventory(product_id=product_id, warehouse_id=warehouse_id, quantity=0)
+                for product_id, warehouse_id in missing
+            )
+            for pk, product_id, warehouse_id, quantity in (
+                Inventory.objects
+                .select_for_update()
+                .filter(_pairs_filter(missing))
+                .order_by('pk')
+                .values_list('pk', 'product_id', 'warehouse_id', 'quantity')
+            ):
+                row = missing[(product_id, warehouse_id)]
+                row[0], row[1], row[2] = pk, quantity, quantity + row[2]
+
+        changed = {key: row for key, row in rows.items() if row[1] != row[2] or key in inserted}
+        if changed:
+            updated = Inventory.objects.filter(pk__in=[row[0] for row in changed.values()])
+            updated.raw_update(
+                quantity=F('quantity') + Case(
+                    *[When(pk=row[0], then=Value(row[2] - row[1])) for row in changed.values()],
+                    default=Value(0),
+                )
+            )
+            inventory_changed.send(
+                sender=Inventory,
+                changes=[
+                    InventoryChange(
+                        product_id, warehouse_id, row[2], 'add' if (product_id, warehouse_id) in inserted else 'update',
+                        row[1],
+                    )
+                    for (product_id, warehouse_id), row in changed.items()
+                ],
+                using=updated.db,
+            )
+
+        transfer_logs = TransferLog.objects.bulk_create([
+            TransferLog(
+                product_id=line['product_id'],
+                from_warehouse_id=line['from_warehouse_id'],
+                to_warehouse_id=line['to_warehouse_id'],
+                quantity=line['quantity'],
+            )
+            for line in lines
+        ])
+
+    return transfer_logs
+
+
+def _live(rows):
+    # новое количество строки из RETURNING; у шардированной строки часть остатка в слотах — неизвестно
+    quantity, row_slots = rows[0]
+    return None if row_slots else quantity
+
+
+def _withdraw(product_id, warehouse_id, quantity, reserved=False):
+    """Списывает quantity; возвращает новое количество строки или None, если его не известно."""
+    source = Inventory.objects.filter(product_id=product_id, warehouse_id=warehouse_id)
+    # условное списание: строка блокируется самим UPDATE, без предварительного SELECT ... FOR UPDATE
+    if reserved:
+        # количество уже удержано резервом: списываем его вместе с резервом
+        rows = source.filter(quantity__gte=quantity, reserved__gte=quantity).raw_update_returning(
+            ['quantity', 'slots'], quantity=F('quantity') - quantity, reserved=F('reserved') - quantity,
+        )
+        if rows:
+            return _live(rows)
+        raise TransferRejected("Reserved product is no longer in source warehouse.", 409)
+    rows = source.filter(available__gte=quantity).raw_update_returning(
+        ['quantity', 'slots'], quantity=F('quantity') - quantity,
+    )
+    if rows:
+        return _live(rows)
+    row = source.values_list('pk', 'slots').first()
+    if row is None:
+        raise TransferRejected("No such product in source warehouse.", 404)
+    # у шардированной строки свободный остаток лежит в слотах
+    if row[1] and slots.withdraw(row[0], row[1], quantity, source.db):
+        return None
+    raise TransferRejected("Not enough product in source warehouse.", 400)
+
+
+def _deposit(product_id, warehouse_id, quantity):
+    """
+    Зачисляет quantity; возвращает (создана ли строка, новое количество строки
+    или None, если его не известно).
+    """
+    destination = Inventory.objects.filter(product_id=product_id, warehouse_id=warehouse_id)
+    rows = destination.filter(slots=0).raw_update_returning(['quantity', 'slots'], quantity=F('quantity') + quantity)
+    if rows:
+        return False, _live(rows)
+    row = destination.values_list('pk', 'slots').first()
+    if row is not None:
+        slots.deposit(row[0], row[1], quantity, destination.db)
+        return False, None
+    if not Warehouse.objects.filter(pk=warehouse_id).exists():
+        raise TransferRejected("No such warehouse.", 404)
+    try:
+        with transaction.atomic():
+            # журнал и итоги для новой строки пишет post_save
+            Inventory.objects.create(product_id=product_id, warehouse_id=warehouse_id, quantity=quantity)
+        return True, quantity
+    except IntegrityError:
+        # строку успел создать параллельный запрос
+        destination.raw_update(quantity=F('quantity') + quantity)
+        return False, None
+
+
+def apply_transfer(product_id, from_warehouse_id, to_warehouse_id, quantity, reserved=False):
+    """
+    Одиночное перемещение одной транзакцией без чтения-изменения-записи: списание —
+    UPDATE ... SET quantity = quantity - n WHERE available >= n, зачисление —
+    UPDATE quantity + n или INSERT новой строки. Новые количества для журнала
+    возвращает сам UPDATE (RETURNING). Строки меняются по возрастанию id
+    склада, чтобы встречные перемещения не взаимоблокировались. У шардированных
+    строк (Inventory.slots) меняется случайный слот, а не сама строка. При отказе
+    (TransferRejected) ничего не меняется; TransferLog пишется только при успехе.
+
+    reserved=True — перемещается количество, удержанное резервом (подтверждение
+    StockReservation): оно списывается и из quantity, и из reserved.
+    """
+    steps = sorted([(from_warehouse_id, -quantity), (to_warehouse_id, quantity)])
+    with transaction.atomic():
+        created, quantities = False, {}
+        for warehouse_id, delta in steps:
+            if delta < 0:
+                quantities[warehouse_id] = _withdraw(product_id, warehouse_id, quantity, reserved)
+            else:
+                created, quantities[warehouse_id] = _deposit(product_id, warehouse_id, quantity)
+
+        # новые количества обычных строк известны из RETURNING, перечитываются только шардированные
+        unknown = [warehouse_id for warehouse_id, value in quantities.items() if value is None]
+        if unknown:
+            quantities.update(
+                Inventory.objects.filter(product_id=product_id, warehouse_id__in=unknown)
+                .values_list('warehouse_id', live_quantity())
+            )
+        changes = [InventoryChange(
+            product_id, from_warehouse_id, quantities[from_warehouse_id], 'update',
+            quantities[from_warehouse_id] + quantity,
+        )]
+        if not created:
+            changes.append(InventoryChange(
+                product_id, to_warehouse_id, quantities[to_warehouse_id], 'update',
+                quantities[to_warehouse_id] - quantity,
+            ))
+        inventory_changed.send(sender=Inventory, changes=changes, using=router.db_for_write(Inventory))
+
+        return TransferLog.objects.create(
+            product_id=product_id,
+            from_warehouse_id=from_warehouse_id,
+            to_warehouse_id=to_warehouse_id,
+            quantity=quantity,
+        )
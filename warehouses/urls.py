@@ -1,12 +1,20 @@
-from rest_framework.authtoken.views import obtain_auth_token
+from django.conf import settings
 from rest_framework.routers import DefaultRouter
 
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'warehouses', views.WarehouseViewSet, basename='warehouse')
 router.register(r'products', views.ProductViewSet, basename='product')
 router.register(r'inventory', views.InventoryViewSet, basename='inventory')
 router.register(r'transfers', views.TransferLogViewSet, basename='transfers')
+router.register(r'reservations', views.StockReservationViewSet, basename='reservation')
+router.register(r'jobs', views.ExportJobViewSet, basename='job')
+router.register(r'analytics', views.AnalyticsViewSet, basename='analytics')
 # router.register(r'login', obtain_auth_token, basename='login')
-urlpatterns = router.urls
+# лента изменений — раньше маршрутов роутера, иначе inventory/changes/ совпадёт с inventory/{pk}/
+urlpatterns = async_views.changefeed_urlpatterns + router.urls
+
+# под ASGI горячие эндпоинты чтения обслуживаются асинхронными версиями
+if getattr(settings, 'WAREHOUSES_API_MODE', 'sync') == 'async':
+    urlpatterns = async_views.urlpatterns + urlpatterns
@@ -1,50 +1,146 @@
-import csv
-from datetime import datetime, timezone
-
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.http import FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-
-from warehouses.models import Warehouse, Product, Inventory, TransferLog, InventoryLog
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from warehouses import alerts, analytics, audit, history, idempotency, inventory_cache, jobs, queries, rebalance, reservations, \
+    routing
+from warehouses.exports import inventory_csv_rows, csv_streaming_response, export_filename, filter_inventory
+from warehouses.filters import InventoryLogFilter, InventoryLogRollupFilter, TransferLogFilter
+from warehouses.imports import import_inventory
+from warehouses.models import Warehouse, Product, Inventory, TransferLog, InventoryLog, InventoryLogRollup, \
+    StockReservation, ProductStockTotal, ExportJob
+from warehouses.pagination import StockSummaryPagination, InventoryLogPagination, InventoryLogRollupPagination, \
+    TransferLogPagination, WarehouseInventoryPagination, StockReservationPagination, StockSummaryKeysetPagination, \
+    ExportJobPagination, LowStockPagination, ForeignCursor, cached_page, listing_page
+from warehouses.parsers import CSVParser, JSONLinesParser
+from warehouses.renderers import columnar_renderers
+from warehouses.search import matching_product_ids, search_products
 from warehouses.serializers import WarehouseSerializer, ProductSerializer, InventorySerializer, TransferLogSerializer, \
-    InventoryLogSerializer
+    InventoryLogSerializer, InventoryLogRollupSerializer, TransferBatchSerializer, StockReservationSerializer, \
+    ReservationRequestSerializer, ReservationConfirmSerializer, RebalancePlanSerializer, ExportJobSerializer, \
+    ExportJobRequestSerializer, ReorderLevelBatchSerializer, MovementParamsSerializer
+from warehouses.transfers import apply_transfer, apply_transfer_batch, TransferError, TransferRejected
+
+
+def parse_id_list(value):
+    if not value:
+        return []
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+class LeanListMixin:
+    """
+    list() без сериализатора: строки собираются из values()/values_list() с нужными
+    JOIN функциями lean_row/lean_rows и совпадают с выдачей serializer_class.
+    Число запросов на страницу не зависит от её размера.
+    """
+    lean_fields = ()
+    lean_row = None
+
+    def lean_values(self, queryset):
+        return queryset.values_list(*self.lean_fields)
 
+    def lean_rows(self, rows):
+        return [self.lean_row(row) for row in rows]
 
-class WarehouseViewSet(viewsets.ModelViewSet):
+    @routing.use_replica
+    def list(self, request, *args, **kwargs):
+        queryset = self.lean_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.lean_rows(page))
+        return Response(self.lean_rows(queryset))
+
+
+def invalid_as_of():
+    return Response(
+        {"error": "as_of must be an ISO 8601 date or datetime."},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+class WarehouseViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
+    lean_fields = queries.WAREHOUSE_FIELDS
+    lean_row = staticmethod(queries.warehouse_row)
 
     @action(detail=True, methods=['GET'], url_path='inventory')
     def warehouse_inventory(self, request, pk=None):
+        """
+        Остатки склада: product_id, name, sku, quantity и available (количество
+        за вычетом действующих резервов). С ?as_of= — на момент времени, с теми же
+        полями: available считается по резервам, действовавшим в тот момент.
+        """
         search = request.query_params.get('search', '').lower()
-
-        inventories = Inventory.objects.filter(warehouse=pk).select_related('product')
-
-        if search:
-            inventories = inventories.filter(product__name__icontains=search)
-
-        data = [
-            {
-                "product_id": inventory.product.id,
-                "name": inventory.product.name,
-                "sku": inventory.product.sku,
-                "quantity": inventory.quantity
-            }
-            for inventory in inventories
-        ]
+        paginate = 'page' in request.query_params or 'page_size' in request.query_params
+        params = {key: request.query_params.get(key) for key in ('page', 'page_size')}
+        params['search'] = search
+
+        if 'as_of' in request.query_params:
+            return self.warehouse_inventory_as_of(request, pk, search, paginate)
+
+        # кэш версионируется по складу: запись остатков склада увеличивает версию (см. warehouses.signals)
+        key = inventory_cache.listing_key(pk, inventory_cache.warehouse_version(pk), params)
+        etag = inventory_cache.etag_for(key)
+        if inventory_cache.etag_matches(request, etag):
+            inventory_cache.count('not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        # страница кэшируется без ссылок next/previous: ключ не зависит от хоста запроса
+        data = cache.get(key)
+        if data is not None:
+            inventory_cache.count('hits')
+            return Response(listing_page(request, data) if paginate else data, headers={'ETag': etag})
+        inventory_cache.count('misses')
+
+        product_ids = matching_product_ids(search) if search else None
+        inventories = queries.warehouse_inventory(pk, product_ids)
+
+        if paginate:
+            paginator = WarehouseInventoryPagination()
+            inventories = paginator.paginate_queryset(inventories.order_by('pk'), request, view=self)
+
+        data = [queries.inventory_listing_row(row) for row in inventories]
+        if paginate:
+            data = cached_page(paginator.page, data)
+
+        cache.set(key, data, inventory_cache.cache_timeout())
+        return Response(listing_page(request, data) if paginate else data, headers={'ETag': etag})
+
+    def warehouse_inventory_as_of(self, request, pk, search, paginate):
+        try:
+            as_of = history.parse_as_of(request.query_params['as_of'])
+        except ValueError:
+            return invalid_as_of()
+
+        product_ids = matching_product_ids(search) if search else None
+        data = history.warehouse_inventory(pk, as_of, product_ids)
+        if paginate:
+            paginator = WarehouseInventoryPagination()
+            page = paginator.paginate_queryset(data, request, view=self)
+            return paginator.get_paginated_response(page)
         return Response(data)
 
+    @action(detail=False, methods=['GET'], url_path='inventory/cache-stats')
+    def warehouse_inventory_cache_stats(self, request):
+        return Response(inventory_cache.stats(), status=status.HTTP_200_OK)
+
 
+    @routing.use_replica
     @action(detail=True, methods=['GET'], url_path='inventory/export')
     def warehouse_inventory_export(self, request, pk=None):
-        inventories = Inventory.objects.filter(warehouse=pk).select_related('product')
+        inventories = Inventory.objects.filter(warehouse=pk)
         return self.csv_export(inventories, pk)
 
 
+    @routing.use_replica
     @action(detail=False, methods=['GET'], url_path='inventory/export')
     def warehouse_inventory_export_all(self, request):
         inventories = Inventory.objects.all()
@@ -52,57 +148,132 @@ class WarehouseViewSet(viewsets.ModelViewSet):
 
 
     def csv_export(self, inventories, warehouse_pk: int = 0, many:bool = False):
-        response = HttpResponse(content_type='text/csv')
+        try:
+            warehouse_ids = parse_id_list(self.request.query_params.get('warehouse'))
+        except ValueError:
+            return Response(
+                {"error": "warehouse must be a comma-separated list of ids."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        skus = [sku for sku in self.request.query_params.get('sku', '').split(',') if sku]
+        inventories = filter_inventory(inventories, warehouse_ids, skus)
+
         if many:
-            content_disposition = f'attachment; filename="warehouses_inventory_{datetime.now(timezone.utc).date().strftime("%d_%m_%Y")}.csv"'
+            filename = export_filename('warehouses_inventory')
         else:
-            content_disposition = f'attachment; filename="warehouse_{warehouse_pk}_inventory_{datetime.now(timezone.utc).date().strftime("%d_%m_%Y")}.csv"'
-        response['Content-Disposition'] = content_disposition
-        writer = csv.writer(response)
-        writer.writerow(['product', 'name', 'sku', 'quantity'])
-
-        for inventory in inventories:
-            writer.writerow([
-                inventory.product.id,
-                inventory.product.name,
-                inventory.product.sku,
-                inventory.quantity
-            ])
-        return response
+            filename = export_filename(f'warehouse_{warehouse_pk}_inventory')
+
+        # строки читаются уже после выхода из представления: база выбирается сейчас
+        inventories = inventories.using(routing.read_alias())
+        compress = self.request.query_params.get('compress', '').lower() == 'gzip'
+        return csv_streaming_response(inventory_csv_rows(inventories), filename, compress=compress)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    lean_fields = queries.PRODUCT_FIELDS
+
+    def lean_rows(self, rows):
+        # склады товара (M2M) — одним запросом на страницу вместо запроса на каждый товар
+        return queries.product_rows(rows)
+
+    @action(detail=False, methods=['GET'], url_path='search')
+    def search(self, request):
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response(
+                {"error": "Query parameter q is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": "limit must be a positive integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-class InventoryViewSet(viewsets.ModelViewSet):
+        return Response(search_products(term, limit=limit))
+
+
+class InventoryViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = Inventory.objects.all()
     serializer_class = InventorySerializer
+    # названия товара и склада — через JOIN, а не по запросу на строку
+    lean_fields = queries.INVENTORY_FIELDS
+    lean_row = staticmethod(queries.inventory_row)
+
+    def lean_values(self, queryset):
+        return super().lean_values(queryset.with_slot_totals())
 
+    @routing.use_replica
     @action(detail=False, methods=['GET'], url_path='summary')
     def summary(self, request):
-        # аггрегируем по ID продукта и считаем сумму продуктов на всех складах для групп
-        aggregated = Inventory.objects.values("product").annotate(total_quantity=Sum("quantity"))
+        if 'as_of' in request.query_params:
+            return self.summary_as_of(request)
 
-        products = {
-            item.id: item
-            for item in Product.objects.filter(id__in=[item["product"] for item in aggregated])
-        }
+        try:
+            totals = queries.stock_summary(request.query_params)
+        except ValueError:
+            return Response(
+                {"error": "min_total and max_total must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        result = []
-        for item in aggregated:
-            product = products[item["product"]]
-            result.append(
-                {
-                    "product_id": product.id,
-                    "name": product.name,
-                    "sku": product.sku,
-                    "total_quantity": item["total_quantity"]
-                }
+        paginator = StockSummaryPagination()
+        page = paginator.paginate_queryset(totals, request, view=self)
+        result = [queries.stock_summary_row(item) for item in page]
+        return paginator.get_paginated_response(result)
+
+    def summary_as_of(self, request):
+        try:
+            as_of = history.parse_as_of(request.query_params['as_of'])
+        except ValueError:
+            return invalid_as_of()
+        try:
+            totals = history.stock_summary(request.query_params, as_of)
+        except ValueError:
+            return Response(
+                {"error": "min_total and max_total must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        return Response(result)
+        # итоги на момент времени считаются в памяти, поэтому курсор — по product_id поверх списка
+        try:
+            page, next_link = StockSummaryKeysetPagination().paginate_rows(totals, request, ProductStockTotal)
+        except ForeignCursor as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"detail": "Invalid cursor"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"next": next_link, "previous": None, "results": page})
+
+    @routing.use_replica
+    @action(detail=False, methods=['GET'], url_path='low-stock')
+    def low_stock(self, request):
+        try:
+            warehouse_ids = parse_id_list(request.query_params.get('warehouse'))
+        except ValueError:
+            return Response(
+                {"error": "warehouse must be a comma-separated list of ids."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        paginator = LowStockPagination()
+        rows = alerts.low_stock(warehouse_ids).values(*queries.INVENTORY_FIELDS)
+        page = paginator.paginate_queryset(rows, request, view=self)
+        return paginator.get_paginated_response([queries.low_stock_row(item) for item in page])
+
+    @action(detail=False, methods=["post"], url_path="reorder-levels")
+    def reorder_levels(self, request):
+        serializer = ReorderLevelBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = alerts.set_reorder_levels(serializer.validated_data['levels'])
+        levels = len(serializer.validated_data['levels'])
+        return Response({"updated": updated, "missing": levels - updated}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["post"], url_path="transfer")
     def transfer(self, request):
@@ -128,60 +299,273 @@ class InventoryViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            TransferLog.objects.create(
-                product=Product.objects.get(pk=product_id),
-                from_warehouse=Warehouse.objects.get(pk=from_warehouse_id),
-                to_warehouse=Warehouse.objects.get(pk=to_warehouse_id),
-                quantity=quantity
+            product_id, from_warehouse_id, to_warehouse_id = (
+                int(product_id), int(from_warehouse_id), int(to_warehouse_id)
             )
-            from_inventory = Inventory.objects.get(product_id=product_id, warehouse_id=from_warehouse_id)
-        except Inventory.DoesNotExist:
+        except (TypeError, ValueError):
             return Response(
-                {"error": "No such product in source warehouse."},
-                status=status.HTTP_404_NOT_FOUND
+                {"error": "product_id, from_warehouse_id and to_warehouse_id must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-
-        if from_inventory.quantity < quantity:
+        if from_warehouse_id == to_warehouse_id:
             return Response(
-                {"error": "Not enough product in source warehouse."},
+                {"error": "Source and destination warehouses must differ."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Уменьшаем на складе-отправителе
-        from_inventory.quantity -= quantity
-        from_inventory.save()
+        def perform():
+            try:
+                apply_transfer(product_id, from_warehouse_id, to_warehouse_id, quantity)
+            except TransferRejected as exc:
+                return exc.status, {"error": exc.error}
+            return status.HTTP_200_OK, {
+                "message": "Transfer successful.",
+                "transferred_quantity": quantity,
+                "from_warehouse_id": from_warehouse_id,
+                "to_warehouse_id": to_warehouse_id
+            }
 
-        # Добавляем/обновляем на складе-получателе
-        to_inventory, created = Inventory.objects.get_or_create(
-            product_id=product_id,
-            warehouse_id=to_warehouse_id,
-            defaults={"quantity": 0}
-        )
-        to_inventory.quantity += quantity
-        to_inventory.save()
+        # повтор с тем же Idempotency-Key возвращает сохранённый ответ и не трогает остатки
+        return idempotency.run(request, 'inventory-transfer', perform)
+
+    @action(detail=False, methods=["post"], url_path="transfer/batch")
+    def transfer_batch(self, request):
+        serializer = TransferBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.validated_data["transfers"]
+
+        try:
+            transfer_logs = apply_transfer_batch(lines)
+        except TransferError as exc:
+            return Response({"errors": exc.errors}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
-            "message": "Transfer successful.",
-            "transferred_quantity": quantity,
-            "from_warehouse_id": from_warehouse_id,
-            "to_warehouse_id": to_warehouse_id
+            "message": "Batch transfer successful.",
+            "transfers": len(transfer_logs),
+            "transferred_quantity": sum(line["quantity"] for line in lines),
         }, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=["post"], url_path="rebalance/plan")
+    def rebalance_plan(self, request):
+        serializer = RebalancePlanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        rules = [
+            rebalance.Rule(rule['warehouse_id'], rule['product_id'], rule.get('min'), rule.get('max'))
+            for rule in data['rules']
+        ]
+
+        warehouses = Warehouse.objects.all()
+        if 'warehouse_ids' in data:
+            warehouses = warehouses.filter(pk__in=data['warehouse_ids'])
+        warehouse_ids = set(warehouses.values_list('pk', flat=True))
+        if not {rule.warehouse_id for rule in rules} | set(data.get('warehouse_ids', ())) <= warehouse_ids:
+            return Response({"error": "No such warehouse."}, status=status.HTTP_404_NOT_FOUND)
+        product_ids = {rule.product_id for rule in rules if rule.product_id is not None}
+        product_ids |= set(data.get('product_ids', ()))
+        if len(product_ids) != Product.objects.filter(pk__in=product_ids).count():
+            return Response({"error": "No such product."}, status=status.HTTP_404_NOT_FOUND)
+
+        def perform():
+            plan = rebalance.plan(rules, warehouse_ids, data.get('product_ids'))
+            body = plan.as_dict()
+            body["applied"] = False
+            if data['apply'] and len(plan.transfers) > rebalance.APPLY_LIMIT:
+                return status.HTTP_400_BAD_REQUEST, {
+                    "error": f"Plan has more than {rebalance.APPLY_LIMIT} transfers, narrow it to apply.", **body,
+                }
+            if data['apply'] and plan.transfers:
+                try:
+                    apply_transfer_batch([transfer._asdict() for transfer in plan.transfers])
+                except TransferError as exc:
+                    # остатки изменились между расчётом и блокировкой строк: план нужно пересчитать
+                    return status.HTTP_409_CONFLICT, {
+                        "error": "Inventory changed while applying the plan.", "errors": exc.errors,
+                    }
+                body["applied"] = True
+            return status.HTTP_200_OK, body
+
+        if not data['apply']:
+            code, body = perform()
+            return Response(body, status=code)
+        return idempotency.run(request, 'inventory-rebalance', perform)
+
+    @action(detail=False, methods=["post"], url_path="bulk",
+            parser_classes=[JSONParser, JSONLinesParser, CSVParser])
+    def bulk_upsert(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            return Response(
+                {"error": "Expected a list of rows, JSON lines or CSV."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = import_inventory(rows)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @routing.use_replica
     @action(detail=False, methods=['GET'], url_path='logs')
     def inventory_logs(self, request):
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        if request.query_params.get('source') == 'rollup':
+            return self.inventory_log_rollups(request)
+
+        filterset = InventoryLogFilter(request.query_params, queryset=InventoryLog.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = InventoryLogPagination()
+        page = paginator.paginate_queryset(filterset.qs, request, view=self)
+        serializer = InventoryLogSerializer(page, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+
+        # Сырые записи закончились: более старая история доступна только в дневных сводках
+        if response.data['next'] is None and 'operation' not in request.query_params:
+            rollups = InventoryLogRollupFilter(queryset=InventoryLogRollup.objects.all())
+            if rollups.filter_cleaned(filterset.form.cleaned_data).exists():
+                url = remove_query_param(request.build_absolute_uri(), paginator.cursor_query_param)
+                response.data['next'] = replace_query_param(url, 'source', 'rollup')
+        return response
 
-        if not all([start_date, end_date]) or start_date > end_date:
-            inventory_logs = InventoryLog.objects.all()
-        else:
-            inventory_logs = InventoryLog.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
+    def inventory_log_rollups(self, request):
+        filterset = InventoryLogRollupFilter(request.query_params, queryset=InventoryLogRollup.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = InventoryLogSerializer(inventory_logs, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = InventoryLogRollupPagination()
+        page = paginator.paginate_queryset(filterset.qs, request, view=self)
+        serializer = InventoryLogRollupSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-class TransferLogViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['GET'], url_path='logs/audit-stats')
+    def inventory_logs_audit_stats(self, request):
+        return Response(audit.stats(), status=status.HTTP_200_OK)
+
+class TransferLogViewSet(LeanListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = TransferLog.objects.all()
     serializer_class = TransferLogSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['product', 'from_warehouse', 'to_warehouse']
+    filterset_class = TransferLogFilter
+    pagination_class = TransferLogPagination
+    lean_row = staticmethod(queries.transfer_log_row)
+    read_replica = True
+
+    def lean_values(self, queryset):
+        # словари, а не кортежи: CursorPagination берёт позицию курсора из полей строки
+        return queryset.values(*queries.TRANSFER_LOG_FIELDS)
+
+
+class StockReservationViewSet(viewsets.ReadOnlyModelViewSet):
+    """Резервы текущего пользователя: создание, подтверждение (списание или перемещение) и снятие."""
+    serializer_class = StockReservationSerializer
+    filterset_fields = ['status', 'product', 'warehouse']
+    pagination_class = StockReservationPagination
+
+    def get_queryset(self):
+        return StockReservation.objects.filter(user=self.request.user)
+
+    def create(self, request):
+        serializer = ReservationRequestSerializer(data=request.data, context={'max_ttl': reservations.max_ttl()})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        def perform():
+            try:
+                reservation = reservations.reserve(
+                    request.user, data['product_id'], data['warehouse_id'], data['quantity'],
+                    ttl=data.get('ttl_seconds'),
+                )
+            except reservations.ReservationRejected as exc:
+                return exc.status, {"error": exc.error}
+            return status.HTTP_201_CREATED, StockReservationSerializer(reservation).data
+
+        return idempotency.run(request, 'reservation-create', perform)
+
+    @action(detail=True, methods=['POST'], url_path='confirm')
+    def confirm(self, request, pk=None):
+        serializer = ReservationConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            reservation = reservations.confirm(pk, request.user, serializer.validated_data.get('to_warehouse_id'))
+        except reservations.ReservationRejected as exc:
+            return Response({"error": exc.error}, status=exc.status)
+        return Response(StockReservationSerializer(reservation).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['POST'], url_path='release')
+    def release(self, request, pk=None):
+        try:
+            reservation = reservations.release(pk, request.user)
+        except reservations.ReservationRejected as exc:
+            return Response({"error": exc.error}, status=exc.status)
+        return Response(StockReservationSerializer(reservation).data, status=status.HTTP_200_OK)
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Отчёты по журналу перемещений. Колонки ({"columns": ...}) отдаются при
+    layout=columns и в формате ?format=arrow (если установлен pyarrow).
+    """
+    renderer_classes = columnar_renderers()
+
+    @routing.use_replica
+    @action(detail=False, methods=['GET'], url_path='movements')
+    def movements(self, request):
+        params = MovementParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+
+        columns = analytics.movements(
+            options['start_date'], options['end_date'], options['period'], options['group_by'], options['window'],
+            options.get('warehouse'), options.get('product'), using=routing.read_alias(),
+        )
+        body = {
+            "period": options['period'],
+            "group_by": options['group_by'],
+            "window": options['window'],
+            "start_date": options['start_date'],
+            "end_date": options['end_date'],
+        }
+        if options['layout'] == 'columns' or request.accepted_renderer.format == 'arrow':
+            body["columns"] = columns
+        else:
+            body["results"] = analytics.as_rows(columns)
+        return Response(body)
+
+
+class ExportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Фоновые выгрузки текущего пользователя: POST ставит задание в очередь
+    (выполняет manage.py run_export_jobs), готовый файл — в download/.
+    """
+    serializer_class = ExportJobSerializer
+    filterset_fields = ['status', 'kind']
+    pagination_class = ExportJobPagination
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(user=self.request.user)
+
+    def create(self, request):
+        serializer = ExportJobRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        def perform():
+            job = ExportJob.objects.create(user=request.user, kind=data['kind'], params=data['params'])
+            return status.HTTP_202_ACCEPTED, ExportJobSerializer(job, context={'request': request}).data
+
+        return idempotency.run(request, 'export-job-create', perform)
+
+    @action(detail=True, methods=['GET'], url_path='download')
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ExportJob.DONE:
+            return Response(
+                {"error": f"Export job is {job.status}."},
+                status=status.HTTP_409_CONFLICT
+            )
+        try:
+            artifact = open(jobs.artifact_path(job), 'rb')
+        except FileNotFoundError:
+            return Response({"error": "Export file has expired."}, status=status.HTTP_410_GONE)
+        return FileResponse(
+            artifact, as_attachment=True, filename=jobs.download_filename(job), content_type='application/gzip',
+        )
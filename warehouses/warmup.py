@@ -0,0 +1,49 @@
+"""
+Прогрев процесса при старте: первый запрос воркера не должен платить за
+ленивую инициализацию.
+
+warm_code() импортирует URLconf со всеми представлениями, разбирает маршруты
+резолвера и загружает классы из настроек DRF. Под gunicorn с preload_app это
+делается в мастере до fork, и память остаётся общей для воркеров (copy-on-write).
+
+warm_connections() открывает соединения с базами (или пул psycopg). Это
+делается в каждом воркере после fork: соединение, открытое до fork, нельзя
+делить между процессами.
+"""
+import logging
+
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger('warehouses.warmup')
+
+DRF_SETTINGS = [
+    'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES',
+    'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_FILTER_BACKENDS',
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_METADATA_CLASS',
+    'DEFAULT_VERSIONING_CLASS',
+]
+
+
+def warm_code():
+    # reverse_dict разбирает все маршруты, в том числе вложенных URLconf
+    get_resolver().reverse_dict
+    for name in DRF_SETTINGS:
+        getattr(api_settings, name)
+
+
+def warm_connections():
+    """Открывает соединение с каждой базой; недоступная база не мешает старту воркера."""
+    for connection in connections.all():
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            logger.warning("Database %s is unavailable at startup", connection.alias, exc_info=True)
+            continue
+        # как в конце запроса: соединение пула возвращается в пул, постоянное остаётся открытым
+        connection.close_if_unusable_or_obsolete()